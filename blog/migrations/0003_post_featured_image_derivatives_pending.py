@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_post_featured_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='featured_image_derivatives_pending',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+    ]
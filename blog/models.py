@@ -30,6 +30,12 @@ class Post(models.Model):
     featured_image = models.ImageField(
         upload_to="blog_images/",
         null=True, blank=True)
+    # Names of the resized copies of the image, see hand_crafted/images.py
+    featured_image_derivatives = models.JSONField(
+        default=dict, blank=True, editable=False)
+    # Set while the resized copies wait for the derivatives worker
+    featured_image_derivatives_pending = models.BooleanField(
+        default=False, editable=False, db_index=True)
     featured = models.BooleanField(default=False)
 
     class Meta:
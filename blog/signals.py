@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from hand_crafted.images import schedule_derivatives
+
+from .models import Post
+
+
+@receiver(post_save, sender=Post)
+def generate_image_derivatives(sender, instance, raw=False, **kwargs):
+    """
+    Queue the resized copies of a new featured image
+    """
+    if not raw:
+        schedule_derivatives(instance, 'featured_image',
+                             'featured_image_derivatives',
+                             'featured_image_derivatives_pending')
@@ -6,7 +6,8 @@ from django.shortcuts import (
     )
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator, PageNotAnInteger
+
+from hand_crafted.pagination import KeysetPaginator
 
 from .models import Post, Comment
 from .forms import PostForm, CommentForm
@@ -26,18 +27,13 @@ def post_list(request):
     # Retrieve all published posts from the database
     posts = Post.objects.filter(status="published")
 
-    # Paginate the list of posts
-    paginator = Paginator(posts, 8)
-
-    # Get the current page number from the request parameters
-    page = request.GET.get("page")
+    # Paginate the list of posts with a cursor paginator
+    paginator = KeysetPaginator(posts, 8)
 
-    try:
-        # Attempt to retrieve the requested page of posts
-        posts = paginator.page(page)
-    except PageNotAnInteger:
-        # If the page parameter is not an integer, default to the first page
-        posts = paginator.page(1)
+    # Get the current cursor from the request parameters and retrieve
+    # the requested page of posts, or the first page if it is invalid
+    cursor = request.GET.get("cursor")
+    posts = paginator.get_page(cursor, request.GET)
 
     # Define the template to be used to render the view
     template_name = "blog/post_list.html"
@@ -46,7 +42,7 @@ def post_list(request):
     context = {
         "page_title": "Blog",
         "posts": posts,
-        "page": page,
+        "cursor": cursor,
     }
 
     # Render the template with the given context and return the response
@@ -1,3 +1,17 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Cart, CartLine
+
+
+class CartLineAdminInline(admin.TabularInline):
+    model = CartLine
+    raw_id_fields = ('product',)
+
+
+class CartAdmin(admin.ModelAdmin):
+    inlines = (CartLineAdminInline,)
+    list_display = ('user', 'created_on')
+    raw_id_fields = ('user',)
+
+
+admin.site.register(Cart, CartAdmin)
@@ -0,0 +1,236 @@
+"""
+JSON cart API.
+
+Each endpoint changes the cart and answers with the new totals and the
+re-rendered cart fragments (cart total, cart lines and header badges),
+so the cart page can be patched in place instead of reloaded.
+"""
+import json
+from functools import wraps
+
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.views.decorators.http import require_POST
+
+from products.models import Product
+
+from .cart import line_key
+from .contexts import get_cart_contents
+from .pricing import to_minor
+from .stores import CartConflict, get_cart_store
+from .views import CONFLICT_MESSAGE
+
+# Largest quantity accepted for a cart line
+MAX_QUANTITY = 99
+
+
+class CartAPIError(Exception):
+    """ Raised for an invalid API request, answered with status 400 """
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _payload(request):
+    """ Read the request data from a JSON body or from form data """
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            raise CartAPIError('Invalid JSON body.')
+        if not isinstance(data, dict):
+            raise CartAPIError('Invalid JSON body.')
+        return data
+    return request.POST.dict()
+
+
+def _quantity(value, minimum=0):
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        raise CartAPIError('Quantity must be a digit.')
+    if quantity < minimum or quantity > MAX_QUANTITY:
+        raise CartAPIError(
+            f'Quantity must be between {minimum} and {MAX_QUANTITY}.')
+    return quantity
+
+
+def _products(ids):
+    """ Fetch the products of the given ids, failing on unknown ids """
+    try:
+        ids = {int(item_id) for item_id in ids}
+    except (TypeError, ValueError):
+        raise CartAPIError('Invalid product id.')
+    products = Product.objects.in_bulk(ids)
+    if len(products) != len(ids):
+        raise CartAPIError('Product not found.', status=404)
+    return products
+
+
+def _size_label(size):
+    return f'size {size.upper()} ' if size else ''
+
+
+def cart_response(request, changed, message):
+    """
+    Build the API response: totals, the fragments of the changed lines
+    (None for removed lines), the cart total and the header badges
+    """
+    contents = get_cart_contents(request)
+    items = {item['line_key']: item for item in contents['cart_items']}
+    lines = {}
+    for key in changed:
+        item = items.get(key)
+        if item is None:
+            lines[key] = None
+            continue
+        context = {'item': item}
+        lines[key] = {
+            'quantity': item['quantity'],
+            'row': render_to_string('cart/line-row.html', context,
+                                    request=request),
+            'card': render_to_string('cart/line-card.html', context,
+                                     request=request),
+        }
+    return JsonResponse({
+        'message': message,
+        'product_count': contents['product_count'],
+        'total': f"{contents['total']:.2f}",
+        'delivery': f"{contents['delivery']:.2f}",
+        'grand_total': f"{contents['grand_total']:.2f}",
+        'free_delivery_delta': f"{contents['free_delivery_delta']:.2f}",
+        'lines': lines,
+        'fragments': {
+            'cart_total': render_to_string(
+                'cart/cart-total.html', request=request),
+            'cart_badge': render_to_string(
+                'includes/cart-badge.html', request=request),
+            'cart_badge_mobile': render_to_string(
+                'includes/cart-badge-mobile.html', request=request),
+        },
+    })
+
+
+def cart_api_view(view_func):
+    """
+    Answer API errors with a JSON error message, and a change that lost
+    to concurrent changes of the cart with status 409
+    """
+    @require_POST
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view_func(request, *args, **kwargs)
+        except CartAPIError as error:
+            return JsonResponse({'error': str(error)}, status=error.status)
+        except CartConflict:
+            return JsonResponse({'error': CONFLICT_MESSAGE}, status=409)
+    return wrapper
+
+
+@cart_api_view
+def add(request, item_id):
+    """
+    Add a quantity of a product, optionally in a size, to the cart.
+    Expects ``quantity`` and optionally ``product_size``.
+    """
+    data = _payload(request)
+    product = _products([item_id])[int(item_id)]
+    quantity = _quantity(data.get('quantity'), minimum=1)
+    size = data.get('product_size') or None
+
+    new_quantity = get_cart_store(request).mutate(
+        lambda cart: cart.add(product.id, quantity, size,
+                              to_minor(product.price)))
+
+    if new_quantity == quantity:
+        message = (f'Added {_size_label(size)}{product.name} '
+                   'to your cart')
+    else:
+        message = (f'Updated {_size_label(size)}{product.name} '
+                   f'quantity to {new_quantity}')
+    return cart_response(request, [line_key(product.id, size)], message)
+
+
+@cart_api_view
+def adjust(request, item_id):
+    """
+    Set the quantity of a cart line, removing it when the quantity is 0.
+    Expects ``quantity`` and optionally ``product_size``.
+    """
+    data = _payload(request)
+    product = _products([item_id])[int(item_id)]
+    quantity = _quantity(data.get('quantity'))
+    size = data.get('product_size') or None
+
+    get_cart_store(request).mutate(
+        lambda cart: cart.set(product.id, quantity, size))
+
+    if quantity > 0:
+        message = (f'Updated {_size_label(size)}{product.name} '
+                   f'quantity to {quantity}')
+    else:
+        message = (f'Removed {_size_label(size)}{product.name} '
+                   'from your cart')
+    return cart_response(request, [line_key(product.id, size)], message)
+
+
+@cart_api_view
+def remove(request, item_id):
+    """
+    Remove a cart line, or every line of the product when no
+    ``product_size`` is given
+    """
+    data = _payload(request)
+    product = _products([item_id])[int(item_id)]
+    size = data.get('product_size') or None
+
+    def remove_lines(cart):
+        removed = [line_key(line_id, line_size)
+                   for line_id, line_size, _ in cart
+                   if line_id == product.id and
+                   (not size or line_size == size)]
+        cart.remove(product.id, size)
+        return removed
+
+    try:
+        removed = get_cart_store(request).mutate(remove_lines)
+    except KeyError:
+        raise CartAPIError('This item is not in your cart.', status=404)
+
+    message = (f'Removed {_size_label(size)}{product.name} '
+               'from your cart')
+    return cart_response(request, removed, message)
+
+
+@cart_api_view
+def batch(request):
+    """
+    Set the quantities of several cart lines at once. Expects a JSON body
+    of the form {"lines": [{"item_id": 1, "size": null, "quantity": 2}]},
+    a quantity of 0 removing the line.
+    """
+    lines = _payload(request).get('lines')
+    if not isinstance(lines, list) or not lines:
+        raise CartAPIError('No cart lines given.')
+    try:
+        updates = [(line['item_id'], line.get('size') or None,
+                    _quantity(line.get('quantity')))
+                   for line in lines]
+    except (KeyError, TypeError, AttributeError):
+        raise CartAPIError('Every line needs an item_id and a quantity.')
+    # Fail on unknown products before changing the cart
+    products = _products(item_id for item_id, _, _ in updates)
+
+    def set_lines(cart):
+        for item_id, size, quantity in updates:
+            # Lines already in the cart keep the price they were added at
+            price = None
+            if cart.price(item_id, size) is None:
+                price = to_minor(products[int(item_id)].price)
+            cart.set(item_id, quantity, size, price)
+
+    get_cart_store(request).mutate(set_lines)
+    changed = [line_key(int(item_id), size) for item_id, size, _ in updates]
+
+    return cart_response(request, changed, 'Updated your cart')
@@ -0,0 +1,196 @@
+"""
+The shopping cart domain object and its compact encoding.
+
+A cart is a mapping of (product id, size) lines to quantities. Stored
+carts are encoded as a list of [product_id, size, quantity] triples where
+known frame sizes are replaced by a small integer code, 0 means no size
+and any other size is kept as a string. Lines may carry a fourth item,
+the unit price in cents when the line was added, used to tell the
+customer about price changes before checkout.
+
+The legacy format, ``{item_id: quantity | {'items_by_size': {size:
+quantity}}}``, is still accepted when decoding and is produced by
+``to_legacy()`` for order records and Stripe metadata.
+"""
+import json
+
+# Frame sizes offered on the product detail page. Codes are the index
+# in this tuple plus one, so only append new sizes to the end.
+SIZES = (
+    '20.32x20.32cm-8x8in',
+    '20.32x25.4cm-8x10in',
+    '22.86x22.86cm-9x9in',
+    '30.48x30.48cm-12x12in',
+    '27.94x35.56cm-11x14in',
+)
+SIZE_CODES = {size: code for code, size in enumerate(SIZES, 1)}
+
+
+def encode_size(size):
+    """ Return the compact code of a size """
+    if not size:
+        return 0
+    return SIZE_CODES.get(size, size)
+
+
+def decode_size(code):
+    """ Return the size of a compact code """
+    if isinstance(code, str):
+        return code
+    if not code:
+        return None
+    return SIZES[code - 1]
+
+
+def line_key(product_id, size=None):
+    """ Return a string identifying a cart line, used in the cart page """
+    return f'{product_id}-{encode_size(size)}'
+
+
+class Cart:
+    """
+    A shopping cart of product lines, optionally split by size
+    """
+    def __init__(self, lines=None, prices=None):
+        # {(product_id, size): quantity}, in insertion order
+        self.lines = dict(lines or {})
+        # {(product_id, size): unit price in cents when added}
+        self.prices = dict(prices or {})
+
+    def __iter__(self):
+        """ Yield (product_id, size, quantity) for every line """
+        for (product_id, size), quantity in self.lines.items():
+            yield product_id, size, quantity
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    def __eq__(self, other):
+        return (isinstance(other, Cart) and self.lines == other.lines and
+                self.prices == other.prices)
+
+    def copy(self):
+        return Cart(self.lines, self.prices)
+
+    def get(self, product_id, size=None):
+        """ Return the quantity of a line, 0 when not in the cart """
+        return self.lines.get((int(product_id), size or None), 0)
+
+    def price(self, product_id, size=None):
+        """ Return the unit price of a line when added, None if unknown """
+        return self.prices.get((int(product_id), size or None))
+
+    def add(self, product_id, quantity, size=None, price=None):
+        """
+        Add to the quantity of a line and return the new quantity.
+        ``price`` is the current unit price in cents, kept for the line.
+        """
+        key = (int(product_id), size or None)
+        self.lines[key] = self.lines.get(key, 0) + quantity
+        if price is not None:
+            self.prices[key] = price
+        return self.lines[key]
+
+    def set(self, product_id, quantity, size=None, price=None):
+        """ Set the quantity of a line, removing it when not positive """
+        key = (int(product_id), size or None)
+        if quantity > 0:
+            self.lines[key] = quantity
+            if price is not None:
+                self.prices[key] = price
+        else:
+            self.lines.pop(key, None)
+            self.prices.pop(key, None)
+
+    def remove(self, product_id, size=None):
+        """
+        Remove a line, or every line of the product when no size is given.
+        Raises KeyError when there is nothing to remove.
+        """
+        product_id = int(product_id)
+        if size:
+            keys = [(product_id, size)]
+            del self.lines[keys[0]]
+        else:
+            keys = [key for key in self.lines if key[0] == product_id]
+            if not keys:
+                raise KeyError(product_id)
+            for key in keys:
+                del self.lines[key]
+        for key in keys:
+            self.prices.pop(key, None)
+
+    def clear(self):
+        self.lines.clear()
+        self.prices.clear()
+
+    def product_ids(self):
+        """ Return the distinct product ids in the cart """
+        return list(dict.fromkeys(key[0] for key in self.lines))
+
+    def count(self):
+        """ Return the total quantity of all lines """
+        return sum(self.lines.values())
+
+    def encode(self):
+        """ Return the compact, JSON serializable form of the cart """
+        data = []
+        for key, quantity in self.lines.items():
+            line = [key[0], encode_size(key[1]), quantity]
+            if key in self.prices:
+                line.append(self.prices[key])
+            data.append(line)
+        return data
+
+    @classmethod
+    def decode(cls, data):
+        """
+        Build a cart from its compact form or from the legacy dict,
+        ignoring lines that cannot be read
+        """
+        lines = {}
+        prices = {}
+        if isinstance(data, dict):
+            for item_id, item_data in data.items():
+                try:
+                    product_id = int(item_id)
+                except (TypeError, ValueError):
+                    continue
+                if isinstance(item_data, int):
+                    lines[(product_id, None)] = item_data
+                elif isinstance(item_data, dict):
+                    for size, quantity in item_data.get(
+                            'items_by_size', {}).items():
+                        lines[(product_id, size)] = quantity
+        elif isinstance(data, list):
+            for line in data:
+                try:
+                    product_id, code, quantity, *price = line
+                    key = (int(product_id), decode_size(code))
+                    lines[key] = int(quantity)
+                    if price:
+                        prices[key] = int(price[0])
+                except (TypeError, ValueError, IndexError):
+                    continue
+        return cls(lines, prices)
+
+    def to_legacy(self):
+        """ Return the cart in the legacy nested dict format """
+        cart = {}
+        for (product_id, size), quantity in self.lines.items():
+            item_id = str(product_id)
+            if size:
+                item = cart.get(item_id)
+                if not isinstance(item, dict):
+                    item = cart[item_id] = {'items_by_size': {}}
+                item['items_by_size'][size] = quantity
+            else:
+                cart[item_id] = quantity
+        return cart
+
+    def dumps(self):
+        """ Serialize the cart as legacy JSON for orders and payments """
+        return json.dumps(self.to_legacy())
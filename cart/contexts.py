@@ -1,14 +1,34 @@
-from decimal import Decimal
 from django.conf import settings
-from django.shortcuts import get_object_or_404
+
+from .cart import line_key
 from products.models import Product
 
+from .pricing import price_cart, revalidate_cart
+from .stores import get_cart_store
 
-def cart_contents(request):
+# Context variables computed from the cart contents
+CART_CONTEXT_KEYS = (
+    'cart_items',
+    'total',
+    'product_count',
+    'delivery',
+    'free_delivery_delta',
+    'grand_total',
+    'cart_changes',
+)
+
+
+def get_cart_contents(request):
     """
     Retrieves the contents of the user's shopping cart and calculates
     relevant information for displaying in the cart template.
 
+    The cart is priced by cart.pricing with a single product query, and
+    the result is memoized on the request until the cart changes.
+    Products that no longer exist are left out. The PricedCart is
+    available under ``pricing``, and the CartChanges found by checking
+    the cart against the same products under ``cart_changes``.
+
     :param request: The request object containing information about the
                     user's session and cart.
     :type request: django.http.HttpRequest
@@ -16,50 +36,52 @@ def cart_contents(request):
             for use in rendering the cart template.
     :rtype: dict
     """
+    cart = get_cart_store(request).load()
+    memo = getattr(request, '_cart_contents', None)
+    if memo is not None and memo[0] == cart:
+        return memo[1]
 
+    products = Product.objects.in_bulk(cart.product_ids())
+    pricing = price_cart(cart, products)
     cart_items = []
-    total = 0
-    product_count = 0
-    cart = request.session.get('cart', {})
-
-    for item_id, item_data in cart.items():
-        if isinstance(item_data, int):
-            product = get_object_or_404(Product, pk=item_id)
-            total += item_data * product.price
-            product_count += item_data
-            cart_items.append({
-                'item_id': item_id,
-                'quantity': item_data,
-                'product': product,
-            })
-        else:
-            product = get_object_or_404(Product, pk=item_id)
-            for size, quantity in item_data['items_by_size'].items():
-                total += quantity * product.price
-                product_count += quantity
-                cart_items.append({
-                    'item_id': item_id,
-                    'quantity': quantity,
-                    'product': product,
-                    'size': size,
-                })
-    if total < settings.FREE_DELIVERY_THRESHOLD:
-        delivery = total * Decimal(settings.STANDARD_DELIVERY_PERCENTAGE / 100)
-        free_delivery_delta = settings.FREE_DELIVERY_THRESHOLD - total
-    else:
-        delivery = 0
-        free_delivery_delta = 0
-
-    grand_total = delivery + total
+    for line in pricing.lines:
+        item = {
+            'item_id': line.item_id,
+            'line_key': line_key(line.item_id, line.size),
+            'quantity': line.quantity,
+            'product': line.product,
+        }
+        if line.size:
+            item['size'] = line.size
+        cart_items.append(item)
 
     context = {
         'cart_items': cart_items,
-        'total': total,
-        'product_count': product_count,
-        'delivery': delivery,
-        'free_delivery_delta': free_delivery_delta,
+        'total': pricing.subtotal_amount,
+        'product_count': pricing.product_count,
+        'delivery': pricing.delivery_amount,
+        'free_delivery_delta': pricing.free_delivery_delta_amount,
         'free_delivery_threshold': settings.FREE_DELIVERY_THRESHOLD,
-        'grand_total': grand_total,
+        'grand_total': pricing.grand_total_amount,
+        'pricing': pricing,
+        'cart_changes': revalidate_cart(cart, products),
     }
 
+    request._cart_contents = (cart.copy(), context)
+    return context
+
+
+def cart_contents(request):
+    """
+    Context processor exposing the cart contents to every template.
+
+    The values are callables, which templates call when the variable is
+    used, so the cart is only computed (with one query) on pages that
+    display it.
+    """
+    def lazy(key):
+        return lambda: get_cart_contents(request)[key]
+
+    context = {key: lazy(key) for key in CART_CONTEXT_KEYS}
+    context['free_delivery_threshold'] = settings.FREE_DELIVERY_THRESHOLD
     return context
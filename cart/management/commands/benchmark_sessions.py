@@ -0,0 +1,168 @@
+import math
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from products.models import Product
+
+SESSION_CARTS = 'cart.stores.SessionCartStore'
+DATABASE_CARTS = 'cart.stores.DatabaseCartStore'
+DB_SESSIONS = 'django.contrib.sessions.backends.db'
+CACHED_SESSIONS = 'hand_crafted.sessions'
+JSON_SERIALIZER = 'django.contrib.sessions.serializers.JSONSerializer'
+COMPACT_SERIALIZER = 'hand_crafted.sessions.CompactJSONSerializer'
+SESSION_MESSAGES = 'django.contrib.messages.storage.session.SessionStorage'
+COOKIE_MESSAGES = 'django.contrib.messages.storage.fallback.FallbackStorage'
+
+# Session, message and cart settings of each compared setup, in order
+SETUPS = {
+    'session-messages': {
+        'SESSION_ENGINE': DB_SESSIONS,
+        'SESSION_SERIALIZER': JSON_SERIALIZER,
+        'MESSAGE_STORAGE': SESSION_MESSAGES,
+        'CART_STORE': SESSION_CARTS,
+    },
+    'cookie-messages': {
+        'SESSION_ENGINE': DB_SESSIONS,
+        'SESSION_SERIALIZER': JSON_SERIALIZER,
+        'MESSAGE_STORAGE': COOKIE_MESSAGES,
+        'CART_STORE': SESSION_CARTS,
+    },
+    'cached-sessions': {
+        'SESSION_ENGINE': CACHED_SESSIONS,
+        'SESSION_SERIALIZER': COMPACT_SERIALIZER,
+        'MESSAGE_STORAGE': COOKIE_MESSAGES,
+        'CART_STORE': SESSION_CARTS,
+    },
+    'database-carts': {
+        'SESSION_ENGINE': CACHED_SESSIONS,
+        'SESSION_SERIALIZER': COMPACT_SERIALIZER,
+        'MESSAGE_STORAGE': COOKIE_MESSAGES,
+        'CART_STORE': DATABASE_CARTS,
+    },
+}
+
+
+def percentile(values, percent):
+    """ Return the nearest-rank percentile of a list of values """
+    ordered = sorted(values)
+    index = max(math.ceil(len(ordered) * percent / 100) - 1, 0)
+    return ordered[index]
+
+
+class Rollback(Exception):
+    """ Raised to roll back the changes made by a benchmark run """
+
+
+class Command(BaseCommand):
+    """
+    Play a typical anonymous browse-and-add-to-cart flow under several
+    session, message and cart storage setups, and report for each the
+    session writes to the database and the p50/p99 request latency.
+
+    The flow is played with the test client against the configured
+    database, inside a transaction that is rolled back afterwards.
+    """
+    help = 'Compare session writes and latency of session setups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--setup', action='append', dest='setups', choices=SETUPS,
+            help='Setup to compare, may be repeated. All by default, '
+                 'the first one being the baseline')
+        parser.add_argument(
+            '--rounds', type=int, default=20,
+            help='Number of times to play the flow per setup')
+
+    def handle(self, *args, **options):
+        products = list(Product.objects.filter(available=True).order_by(
+            'id').values_list('id', 'slug')[:2])
+        if not products:
+            raise CommandError('The benchmark needs at least one product.')
+
+        results = []
+        for name in options['setups'] or SETUPS:
+            latencies = []
+            writes = 0
+            for _ in range(options['rounds']):
+                flow_latencies, flow_writes = self.run_flow(
+                    SETUPS[name], products)
+                latencies += flow_latencies
+                writes += flow_writes
+            results.append((name, len(latencies), writes,
+                            percentile(latencies, 50),
+                            percentile(latencies, 99)))
+
+        self.stdout.write(f'{"Setup":<18}{"Requests":>10}'
+                          f'{"Session writes":>16}{"p50 ms":>10}'
+                          f'{"p99 ms":>10}')
+        for name, requests, writes, p50, p99 in results:
+            self.stdout.write(f'{name:<18}{requests:>10}{writes:>16}'
+                              f'{p50:>10.2f}{p99:>10.2f}')
+        baseline = results[0]
+        for name, _, writes, _, p99 in results[1:]:
+            saved = baseline[2] - writes
+            percent = round(100 * saved / baseline[2]) if baseline[2] else 0
+            self.stdout.write(self.style.SUCCESS(
+                f'{name} saves {saved} of {baseline[2]} session writes '
+                f'({percent}%), p99 {p99:.2f} ms against '
+                f'{baseline[4]:.2f} ms'))
+
+    def flow(self, products):
+        """ Yield the (method, url, data) requests of the flow """
+        cart_url = reverse('cart:view_cart')
+        yield 'get', reverse('home:index'), None
+        yield 'get', reverse('products:product_list'), None
+        for product_id, slug in products:
+            yield 'get', reverse('products:product_detail',
+                                 args=[product_id, slug]), None
+            yield 'post', reverse('cart:add_to_cart', args=[product_id]), {
+                'quantity': 1, 'redirect_url': cart_url}
+            yield 'get', cart_url, None
+        adjust_url = reverse('cart:adjust_cart', args=[products[0][0]])
+        yield 'post', adjust_url, {'quantity': 2, 'redirect_url': cart_url}
+        yield 'get', cart_url, None
+        # Update clicked again without changing the quantity
+        yield 'post', adjust_url, {'quantity': 2, 'redirect_url': cart_url}
+        yield 'get', reverse('products:product_list'), None
+
+    def run_flow(self, setup, products):
+        """
+        Play the flow with a new visitor and return the request latencies
+        in milliseconds and the number of session writes
+        """
+        table = Session._meta.db_table
+        latencies = []
+        writes = 0
+        try:
+            with transaction.atomic(), override_settings(
+                    ALLOWED_HOSTS=['*'], **setup):
+                client = Client()
+                for method, url, data in self.flow(products):
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        getattr(client, method)(url, data)
+                        latencies.append(
+                            (time.perf_counter() - start) * 1000)
+                    writes += sum(
+                        1 for query in queries
+                        if table in query['sql'] and
+                        query['sql'].lstrip().upper().startswith(
+                            ('INSERT', 'UPDATE')))
+                raise Rollback
+        except Rollback:
+            pass
+        # Cached sessions of the rolled back flow are dropped as well
+        cookie = client.cookies.get(settings.SESSION_COOKIE_NAME)
+        if cookie is not None:
+            caches[settings.SESSION_CACHE_ALIAS].delete(
+                KEY_PREFIX + cookie.value)
+        return latencies, writes
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cart.models import CartRecord
+
+
+class Command(BaseCommand):
+    """
+    Delete the carts kept by the DatabaseCartStore that weren't changed
+    for longer than a session lasts, so their token can no longer be in
+    a live session.
+    """
+    help = 'Delete stored carts older than SESSION_COOKIE_AGE'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only count the carts that would be deleted')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(
+            seconds=settings.SESSION_COOKIE_AGE)
+        expired = CartRecord.objects.filter(updated_on__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f'{expired.count()} carts would be deleted')
+            return
+
+        deleted, _ = expired.delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} carts'))
@@ -0,0 +1,23 @@
+# Generated by Django 3.2 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=32, unique=True)),
+                ('data', models.JSONField(default=list)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0003_cart_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartline',
+            name='unit_price',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
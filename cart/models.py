@@ -1,3 +1,61 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+from products.models import Product
+
+
+class CartRecord(models.Model):
+    """
+    Database model for carts kept by the DatabaseCartStore,
+    keyed on the cart token stored in the visitor's session
+    """
+    token = models.CharField(max_length=32, unique=True)
+    data = models.JSONField(default=list)
+    # Bumped on every write, for compare-and-swap updates
+    version = models.PositiveIntegerField(default=0)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """ Returns a string representation of the cart record """
+        return f'Cart {self.token}'
+
+
+class Cart(models.Model):
+    """
+    Database model for the cart of a logged-in user, kept across
+    sessions and devices by the UserCartStore
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                related_name='cart')
+    # Bumped on every write, for compare-and-swap updates
+    version = models.PositiveIntegerField(default=0)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """ Returns a string representation of the cart """
+        return f'Cart of {self.user}'
+
+
+class CartLine(models.Model):
+    """
+    Database model for a line of a user's cart: a product, optionally
+    in a size, and its quantity
+    """
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE,
+                             related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE,
+                                related_name='+')
+    size = models.CharField(max_length=50, blank=True, default='')
+    quantity = models.PositiveIntegerField()
+    # Unit price in cents when the line was added
+    unit_price = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product', 'size'],
+                                    name='unique_cart_line'),
+        ]
+
+    def __str__(self):
+        """ Returns a string representation of the cart line """
+        return f'{self.quantity} x {self.product_id} {self.size}'.strip()
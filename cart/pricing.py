@@ -0,0 +1,156 @@
+"""
+Cart pricing.
+
+Every amount is computed in integer minor units (cents), so line totals,
+delivery and grand totals add up exactly, and is only converted back to
+a two-place Decimal for display and storage. The cart, the checkout and
+the Order model all price through this module.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+
+from products.models import Product
+
+CENT = Decimal('0.01')
+
+
+def to_minor(amount):
+    """ Convert a Decimal (or int) amount to integer minor units """
+    return int((Decimal(amount) * 100).quantize(Decimal(1), ROUND_HALF_UP))
+
+
+def to_decimal(minor):
+    """ Convert integer minor units to a two-place Decimal amount """
+    return (Decimal(minor) / 100).quantize(CENT)
+
+
+def delivery_for(subtotal):
+    """
+    Return the delivery cost, in minor units, of a subtotal in minor
+    units: a percentage of it below the free delivery threshold
+    """
+    if subtotal >= to_minor(settings.FREE_DELIVERY_THRESHOLD):
+        return 0
+    percentage = Decimal(str(settings.STANDARD_DELIVERY_PERCENTAGE))
+    return int((subtotal * percentage / 100).quantize(
+        Decimal(1), ROUND_HALF_UP))
+
+
+class PricedLine:
+    """
+    A priced cart line
+    """
+    def __init__(self, item_id, size, quantity, product):
+        self.item_id = item_id
+        self.size = size
+        self.quantity = quantity
+        self.product = product
+        self.unit_price = to_minor(product.price)
+        self.total = self.unit_price * quantity
+
+
+class PricedCart:
+    """
+    The priced lines of a cart and its totals, in minor units. The
+    ``*_amount`` properties give the totals as Decimal amounts.
+    """
+    def __init__(self, lines):
+        self.lines = lines
+        self.subtotal = sum(line.total for line in lines)
+        self.product_count = sum(line.quantity for line in lines)
+        self.delivery = delivery_for(self.subtotal)
+        self.grand_total = self.subtotal + self.delivery
+        self.free_delivery_delta = max(
+            to_minor(settings.FREE_DELIVERY_THRESHOLD) - self.subtotal, 0)
+
+    @property
+    def subtotal_amount(self):
+        return to_decimal(self.subtotal)
+
+    @property
+    def delivery_amount(self):
+        return to_decimal(self.delivery)
+
+    @property
+    def grand_total_amount(self):
+        return to_decimal(self.grand_total)
+
+    @property
+    def free_delivery_delta_amount(self):
+        return to_decimal(self.free_delivery_delta)
+
+
+def price_cart(cart, products=None):
+    """
+    Price every line of a cart in a single pass. The products are
+    fetched with one query unless given as an {id: product} mapping.
+    Lines of products that no longer exist are left out.
+    """
+    if products is None:
+        products = Product.objects.in_bulk(cart.product_ids())
+    lines = [PricedLine(item_id, size, quantity, products[item_id])
+             for item_id, size, quantity in cart
+             if item_id in products]
+    return PricedCart(lines)
+
+
+class CartChanges:
+    """
+    What changed in the catalog since the lines of a cart were added:
+    products that no longer exist, products no longer available and
+    unit price changes, in cents
+    """
+    def __init__(self, missing, unavailable, price_changes):
+        # [(product_id, size)]
+        self.missing = missing
+        # [{'product', 'size'}]
+        self.unavailable = unavailable
+        # [{'product', 'size', 'old_price', 'new_price'}]
+        self.price_changes = price_changes
+
+    def __bool__(self):
+        return bool(self.missing or self.unavailable or self.price_changes)
+
+    def apply(self, cart):
+        """
+        Bring a cart up to date: remove the lines of missing and
+        unavailable products and keep the new prices
+        """
+        for product_id, size in self.missing:
+            cart.set(product_id, 0, size)
+        for change in self.unavailable:
+            cart.set(change['product'].id, 0, change['size'])
+        for change in self.price_changes:
+            product = change['product']
+            cart.set(product.id, cart.get(product.id, change['size']),
+                     change['size'], change['new_price'])
+
+
+def revalidate_cart(cart, products=None):
+    """
+    Check every line of a cart against the catalog with one query, or
+    against the given {id: product} mapping, and return the CartChanges
+    """
+    if products is None:
+        products = Product.objects.in_bulk(cart.product_ids())
+    missing = []
+    unavailable = []
+    price_changes = []
+    for product_id, size, _ in cart:
+        product = products.get(product_id)
+        if product is None:
+            missing.append((product_id, size))
+        elif not product.available:
+            unavailable.append({'product': product, 'size': size})
+        else:
+            old_price = cart.price(product_id, size)
+            new_price = to_minor(product.price)
+            if old_price is not None and old_price != new_price:
+                price_changes.append({
+                    'product': product, 'size': size,
+                    'old_price': to_decimal(old_price),
+                    'new_price': new_price,
+                    'new_price_amount': product.price,
+                })
+    return CartChanges(missing, unavailable, price_changes)
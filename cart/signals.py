@@ -0,0 +1,21 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+
+from .stores import UserCartStore, get_anonymous_cart_store, merge_carts
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """
+    Merge the anonymous cart into the user's saved cart on login, then
+    drop the anonymous cart
+    """
+    if request is None or not hasattr(request, 'session'):
+        return
+    store = UserCartStore(request, user)
+    anonymous = get_anonymous_cart_store(request)
+    guest = anonymous.load()
+    if guest:
+        store.mutate(lambda cart: merge_carts(cart, guest))
+        anonymous.clear()
+    request._cart_store = store
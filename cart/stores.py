@@ -0,0 +1,420 @@
+"""
+Cart storage backends.
+
+The backend is picked per deployment with the CART_STORE setting:
+
+* ``DatabaseCartStore`` keeps the cart in a ``CartRecord`` row (the
+  default); rows outliving the session are deleted by the
+  ``purge_carts`` command
+* ``CacheCartStore`` keeps it in the default cache, which must be
+  shared by all processes
+* ``SessionCartStore`` keeps it in the session
+
+The database and cache stores only put a random cart token in the
+session, so cart writes no longer rewrite the whole session.
+
+Logged-in users always get a ``UserCartStore``, which keeps their cart
+in ``Cart`` and ``CartLine`` rows so it outlives the session and follows
+them across devices.
+
+Views change the cart with ``mutate()``. The database, cache and user
+stores version the stored cart and write it with a compare-and-swap:
+when another request changed the cart in the meantime, the change is
+applied again to the new cart instead of overwriting it. Nothing is
+locked, so a request that is alone on its cart costs no extra query.
+The session store has no way to detect concurrent writes and keeps the
+last write.
+"""
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from products.models import Product
+
+from .cart import Cart
+from .models import Cart as CartModel, CartLine, CartRecord
+
+CART_SESSION_KEY = 'cart'
+CART_TOKEN_SESSION_KEY = 'cart_token'
+
+# Number of times a cart change is tried against concurrent changes
+MAX_ATTEMPTS = 10
+
+# Seconds a claim on a cache cart version is kept
+CACHE_CLAIM_TIMEOUT = 30
+
+# Longest pause, in seconds, before the first retry of a cart change.
+# Each further retry may wait one more step.
+RETRY_BACKOFF = 0.005
+
+
+class CartConflict(Exception):
+    """
+    Raised when a cart change could not be stored because of
+    concurrent changes
+    """
+
+
+def backoff(attempt):
+    """ Pause a random time before retrying a conflicting cart change """
+    time.sleep(random.uniform(0, RETRY_BACKOFF * (attempt + 1)))
+
+
+class CartStore:
+    """
+    Base class of the cart stores. Subclasses implement read(), write()
+    and delete() for the encoded cart, and may implement
+    read_versioned() and write_versioned() to make mutate() atomic.
+    """
+    def __init__(self, request):
+        self.request = request
+        self._cart = None
+        # Version of the stored cart as last read or written
+        self._version = None
+
+    def load(self):
+        """ Return the cart, reading it once per request """
+        if self._cart is None:
+            data, self._version = self.read_versioned()
+            self._cart = Cart.decode(data)
+        return self._cart
+
+    def mutate(self, fn):
+        """
+        Apply fn to the cart and store the result. When the stored cart
+        changed since it was read, fn is applied again to the new cart.
+        Returns what fn returns, raises CartConflict when the change
+        could not be stored after MAX_ATTEMPTS tries.
+        """
+        self.load()
+        for attempt in range(MAX_ATTEMPTS):
+            cart = self._cart.copy()
+            result = fn(cart)
+            version = self.write_versioned(
+                cart.encode() if cart else None, self._version)
+            if version is not False:
+                self._cart, self._version = cart, version
+                return result
+            backoff(attempt)
+            data, self._version = self.read_versioned()
+            self._cart = Cart.decode(data)
+        raise CartConflict('The cart was changed by too many requests.')
+
+    def save(self, cart):
+        """ Store the cart, removing it from storage when empty """
+        if cart:
+            self.write(cart.encode())
+        else:
+            self.delete()
+        self._cart = cart
+
+    def clear(self):
+        self.delete()
+        self._cart = Cart()
+
+    def read_versioned(self):
+        """ Return the encoded cart and its version """
+        return self.read(), None
+
+    def write_versioned(self, data, version):
+        """
+        Store the encoded cart, or delete it when data is None, if the
+        stored version is still ``version``. Returns the new version, or
+        False when the cart changed meanwhile.
+        """
+        if data is None:
+            self.delete()
+        else:
+            self.write(data)
+        return None
+
+    def read(self):
+        raise NotImplementedError
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def delete(self):
+        raise NotImplementedError
+
+
+class SessionCartStore(CartStore):
+    """ Keep the encoded cart in the session """
+    def read(self):
+        return self.request.session.get(CART_SESSION_KEY)
+
+    def write(self, data):
+        self.request.session[CART_SESSION_KEY] = data
+
+    def delete(self):
+        self.request.session.pop(CART_SESSION_KEY, None)
+
+
+class TokenCartStore(CartStore):
+    """
+    Base class of the stores keyed on a cart token kept in the session.
+    A cart left in the session by the SessionCartStore is read until the
+    cart is first written.
+    """
+    def get_token(self, create=False):
+        token = self.request.session.get(CART_TOKEN_SESSION_KEY)
+        if token is None and create:
+            token = uuid.uuid4().hex
+            self.request.session[CART_TOKEN_SESSION_KEY] = token
+        return token
+
+    def read_session_cart(self):
+        return self.request.session.get(CART_SESSION_KEY)
+
+    def delete_session_cart(self):
+        self.request.session.pop(CART_SESSION_KEY, None)
+
+
+class CacheCartStore(TokenCartStore):
+    """
+    Keep the encoded cart and its version in the default cache.
+
+    A writer claims the next version with cache.add(), which only one
+    request can do, before storing the cart under that version. Emptied
+    carts are stored as None to keep their version.
+    """
+    def cache_key(self, token):
+        return f'cart:{token}'
+
+    def read_versioned(self):
+        token = self.get_token()
+        if token is None:
+            return self.read_session_cart(), None
+        stored = cache.get(self.cache_key(token))
+        if stored is None:
+            return None, None
+        return stored['data'], stored['version']
+
+    def write_versioned(self, data, version):
+        key = self.cache_key(self.get_token(create=True))
+        new_version = (version or 0) + 1
+        if not cache.add(f'{key}:{new_version}', True, CACHE_CLAIM_TIMEOUT):
+            return False
+        cache.set(key, {'version': new_version, 'data': data},
+                  settings.SESSION_COOKIE_AGE)
+        self.delete_session_cart()
+        return new_version
+
+    def read(self):
+        return self.read_versioned()[0]
+
+    def write(self, data):
+        # Versions only ever grow, so a claim is never made twice
+        for attempt in range(MAX_ATTEMPTS):
+            if self.write_versioned(data, self.read_versioned()[1]) \
+                    is not False:
+                return
+            backoff(attempt)
+        raise CartConflict('The cart was changed by too many requests.')
+
+    def delete(self):
+        if self.get_token() is not None:
+            self.write(None)
+        self.delete_session_cart()
+
+
+class DatabaseCartStore(TokenCartStore):
+    """
+    Keep the encoded cart in a CartRecord row, written with an UPDATE
+    conditioned on the version read
+    """
+    def read_versioned(self):
+        token = self.get_token()
+        if token is None:
+            return self.read_session_cart(), None
+        stored = CartRecord.objects.filter(token=token).values_list(
+            'data', 'version').first()
+        return stored or (None, None)
+
+    def write_versioned(self, data, version):
+        token = self.get_token(create=True)
+        records = CartRecord.objects.filter(token=token)
+        if version is None:
+            # No record was read: create it, unless another request did
+            if data is None:
+                self.delete_session_cart()
+                return None
+            try:
+                with transaction.atomic():
+                    CartRecord.objects.create(token=token, data=data)
+            except IntegrityError:
+                return False
+            self.delete_session_cart()
+            return 0
+        if data is None:
+            deleted, _ = records.filter(version=version).delete()
+            return None if deleted else False
+        updated = records.filter(version=version).update(
+            data=data, version=F('version') + 1, updated_on=timezone.now())
+        return version + 1 if updated else False
+
+    def read(self):
+        return self.read_versioned()[0]
+
+    def write(self, data):
+        token = self.get_token(create=True)
+        updated = CartRecord.objects.filter(token=token).update(
+            data=data, version=F('version') + 1, updated_on=timezone.now())
+        if not updated:
+            CartRecord.objects.create(token=token, data=data)
+        self.delete_session_cart()
+
+    def delete(self):
+        token = self.get_token()
+        if token is not None:
+            CartRecord.objects.filter(token=token).delete()
+        self.delete_session_cart()
+
+
+class UserCartStore(CartStore):
+    """
+    Keep the cart of a logged-in user in Cart and CartLine rows.
+
+    A write bumps the cart version from the one read and then writes the
+    lines that changed since the cart was read, with at most one DELETE,
+    one bulk UPDATE and one bulk INSERT, in one transaction. When another
+    request bumped the version first, mutate() applies the change again
+    to the cart as it is now stored, like the other versioned stores.
+    A cart left in the anonymous store is merged in once, when the user
+    logs in.
+    """
+    def __init__(self, request, user=None):
+        super().__init__(request)
+        self.user = user or request.user
+        self._cart_id = None
+        # {(product_id, size): (line id, quantity, unit price)} as stored
+        self._stored = {}
+
+    def read_versioned(self):
+        rows = CartModel.objects.filter(user=self.user).values_list(
+            'id', 'version', 'lines__id', 'lines__product_id',
+            'lines__size', 'lines__quantity', 'lines__unit_price')
+        self._cart_id = None
+        self._stored = {}
+        version = None
+        for cart_id, version, line_id, *line in rows:
+            self._cart_id = cart_id
+            if line_id is not None:
+                product_id, size, quantity, price = line
+                self._stored[(product_id, size or None)] = (
+                    line_id, quantity, price)
+        data = [[product_id, size, quantity] + (
+                    [price] if price is not None else [])
+                for (product_id, size), (_, quantity, price)
+                in self._stored.items()]
+        return data, version
+
+    def write_versioned(self, data, version):
+        cart = Cart.decode(data)
+        with transaction.atomic():
+            version = self.claim_version(version)
+            if version is False:
+                return False
+            self.write_lines(cart)
+        return version
+
+    def save(self, cart):
+        """ Replace the stored cart """
+        def replace(current):
+            current.lines, current.prices = (
+                dict(cart.lines), dict(cart.prices))
+        self.mutate(replace)
+
+    def clear(self):
+        self.save(Cart())
+
+    def claim_version(self, version):
+        """
+        Bump the cart version from ``version``, creating the cart row
+        when there is none. Returns the new version, or False when the
+        version changed.
+        """
+        if self._cart_id is None:
+            cart, created = CartModel.objects.get_or_create(user=self.user)
+            self._cart_id = cart.id
+            return cart.version if created else False
+        bumped = CartModel.objects.filter(
+            id=self._cart_id, version=version).update(
+            version=F('version') + 1)
+        return version + 1 if bumped else False
+
+    def write_lines(self, cart):
+        """ Write the lines of ``cart`` that differ from the stored ones """
+        lines = cart.lines
+        prices = cart.prices
+        removed = [key for key in self._stored if key not in lines]
+        changed = [key for key, quantity in lines.items()
+                   if key in self._stored and
+                   self._stored[key][1:] != (quantity, prices.get(key))]
+        added = {key: quantity for key, quantity in lines.items()
+                 if key not in self._stored}
+
+        if removed:
+            CartLine.objects.filter(
+                id__in=[self._stored.pop(key)[0] for key in removed]).delete()
+        if changed:
+            updates = []
+            for key in changed:
+                line_id = self._stored[key][0]
+                updates.append(CartLine(id=line_id, quantity=lines[key],
+                                        unit_price=prices.get(key)))
+                self._stored[key] = (line_id, lines[key], prices.get(key))
+            CartLine.objects.bulk_update(updates, ['quantity', 'unit_price'])
+        if added:
+            # Lines of products deleted meanwhile are dropped
+            existing = set(Product.objects.filter(
+                id__in={key[0] for key in added}).values_list(
+                'id', flat=True))
+            CartLine.objects.bulk_create([
+                CartLine(cart_id=self._cart_id, product_id=product_id,
+                         size=size or '', quantity=quantity,
+                         unit_price=prices.get((product_id, size)))
+                for (product_id, size), quantity in added.items()
+                if product_id in existing])
+            # Remember the ids of the new lines for the next write
+            new_lines = CartLine.objects.filter(
+                cart_id=self._cart_id, product_id__in=existing).values_list(
+                'id', 'product_id', 'size')
+            for line_id, product_id, size in new_lines:
+                key = (product_id, size or None)
+                if key in added:
+                    self._stored[key] = (line_id, added[key], prices.get(key))
+
+
+def merge_carts(cart, other):
+    """ Add the lines of another cart to a cart """
+    for product_id, size, quantity in other:
+        cart.add(product_id, quantity, size, other.price(product_id, size))
+
+
+def get_anonymous_cart_store(request):
+    """ Return the configured store for carts of anonymous visitors """
+    return import_string(settings.CART_STORE)(request)
+
+
+def get_cart_store(request):
+    """
+    Return the cart store of a request: the UserCartStore for logged-in
+    users, the configured store otherwise
+    """
+    store = getattr(request, '_cart_store', None)
+    if store is None:
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            store = UserCartStore(request)
+        else:
+            store = get_anonymous_cart_store(request)
+        request._cart_store = store
+    return store
@@ -0,0 +1,155 @@
+import json
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from products.models import Product
+
+from .cart import Cart, line_key
+from .models import CartRecord
+from .stores import CartConflict
+from .test_views import stored_cart
+
+
+class CartAPITest(TestCase):
+    """
+    Test the JSON cart API
+    """
+    def setUp(self):
+        self.client = Client()
+        self.product = Product.objects.create(
+            name='Shadow Box', sku='sb1', price=Decimal('10.00'),
+            has_sizes=True)
+        self.other = Product.objects.create(
+            name='Cake Topper', sku='ct1', price=Decimal('5.00'))
+        self.size = '22.86x22.86cm-9x9in'
+
+    def post_json(self, url, data):
+        return self.client.post(url, json.dumps(data),
+                                content_type='application/json')
+
+    def test_add_returns_totals_and_fragments(self):
+        url = reverse('cart:api_add', args=[self.product.id])
+        response = self.client.post(
+            url, {'quantity': 2, 'product_size': self.size})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['message'],
+                         f'Added size {self.size.upper()} Shadow Box '
+                         'to your cart')
+        self.assertEqual(data['product_count'], 2)
+        self.assertEqual(data['total'], '20.00')
+        self.assertEqual(data['grand_total'], '22.00')
+
+        key = line_key(self.product.id, self.size)
+        line = data['lines'][key]
+        self.assertEqual(line['quantity'], 2)
+        self.assertIn(f'data-cart-line="{key}"', line['row'])
+        self.assertIn('<tr', line['row'])
+        self.assertIn(f'data-cart-line="{key}"', line['card'])
+        self.assertIn('Grand Total: €22.00', data['fragments']['cart_total'])
+        self.assertIn('€22.00', data['fragments']['cart_badge'])
+        self.assertIn('cart-badge-mobile',
+                      data['fragments']['cart_badge_mobile'])
+        self.assertEqual(stored_cart(self.client)[str(self.product.id)],
+                         {'items_by_size': {self.size: 2}})
+
+    def test_adjust_to_zero_removes_line(self):
+        self.client.post(reverse('cart:api_add', args=[self.other.id]),
+                         {'quantity': 1})
+        url = reverse('cart:api_adjust', args=[self.other.id])
+        response = self.post_json(url, {'quantity': 3})
+        self.assertEqual(response.json()['lines'][f'{self.other.id}-0'][
+            'quantity'], 3)
+
+        response = self.post_json(url, {'quantity': 0})
+        data = response.json()
+        self.assertEqual(data['lines'], {f'{self.other.id}-0': None})
+        self.assertEqual(data['product_count'], 0)
+        self.assertEqual(stored_cart(self.client), {})
+
+    def test_remove_without_size_removes_every_line(self):
+        add_url = reverse('cart:api_add', args=[self.product.id])
+        self.client.post(add_url, {'quantity': 1, 'product_size': self.size})
+        self.client.post(add_url, {'quantity': 1, 'product_size': '9x9in'})
+
+        url = reverse('cart:api_remove', args=[self.product.id])
+        data = self.client.post(url).json()
+        self.assertEqual(data['lines'], {
+            line_key(self.product.id, self.size): None,
+            line_key(self.product.id, '9x9in'): None,
+        })
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_batch_updates_several_lines(self):
+        url = reverse('cart:api_batch')
+        response = self.post_json(url, {'lines': [
+            {'item_id': self.product.id, 'size': self.size, 'quantity': 1},
+            {'item_id': self.other.id, 'quantity': 4},
+        ]})
+        data = response.json()
+        self.assertEqual(data['product_count'], 5)
+        self.assertEqual(data['total'], '30.00')
+        self.assertEqual(len(data['lines']), 2)
+
+    def test_batch_keeps_stored_prices(self):
+        self.client.post(reverse('cart:api_add', args=[self.other.id]),
+                         {'quantity': 1})
+        Product.objects.filter(pk=self.other.pk).update(
+            price=Decimal('6.00'))
+        Product.objects.filter(pk=self.product.pk).update(
+            price=Decimal('12.00'))
+
+        response = self.post_json(reverse('cart:api_batch'), {'lines': [
+            {'item_id': self.other.id, 'quantity': 2},
+            {'item_id': self.product.id, 'size': self.size, 'quantity': 1},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        # The existing line keeps the price it was added at, so the
+        # price change is still reported; the new line gets the current
+        # price
+        data = CartRecord.objects.values_list('data', flat=True).get()
+        cart = Cart.decode(data)
+        self.assertEqual(cart.price(self.other.id), 500)
+        self.assertEqual(cart.price(self.product.id, self.size), 1200)
+
+    def test_invalid_requests(self):
+        url = reverse('cart:api_add', args=[self.product.id])
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+        response = self.client.post(url, {'quantity': 'x'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Quantity must be a digit.'})
+        response = self.client.post(url, {'quantity': 100})
+        self.assertEqual(response.status_code, 400)
+
+        missing = reverse('cart:api_add', args=[999999])
+        self.assertEqual(self.client.post(missing, {'quantity': 1})
+                         .status_code, 404)
+        response = self.post_json(reverse('cart:api_batch'),
+                                  {'lines': [{'quantity': 1}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(stored_cart(self.client), {})
+
+    def test_conflicting_change_is_answered_with_409(self):
+        url = reverse('cart:api_add', args=[self.other.id])
+        with mock.patch('cart.stores.CartStore.mutate',
+                        side_effect=CartConflict):
+            response = self.client.post(url, {'quantity': 1})
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('try again', response.json()['error'])
+        self.assertEqual(stored_cart(self.client), {})
+
+    def test_cart_page_renders_line_fragments(self):
+        self.client.post(reverse('cart:api_add', args=[self.other.id]),
+                         {'quantity': 1})
+        response = self.client.get(reverse('cart:view_cart'))
+        self.assertTemplateUsed(response, 'cart/line-row.html')
+        self.assertTemplateUsed(response, 'cart/line-card.html')
+        self.assertContains(response, f'data-cart-line="{self.other.id}-0"',
+                            count=2)
+        self.assertContains(response, reverse('cart:api_adjust',
+                                              args=[self.other.id]))
@@ -0,0 +1,77 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.utils import timezone
+
+from products.models import Product
+
+from .models import CartRecord
+
+
+class MessageStorageTest(TestCase):
+    """
+    Test that messages no longer cost session writes
+    """
+    def setUp(self):
+        self.client = Client()
+        self.products = [
+            Product.objects.create(name=name, price=Decimal('5.00'))
+            for name in ('Cake Topper', 'Shadow Box')]
+
+    def test_messages_are_kept_in_a_cookie(self):
+        url = reverse('cart:add_to_cart', args=[self.products[0].id])
+        response = self.client.post(url, {'quantity': 1,
+                                          'redirect_url': '/cart/'},
+                                    follow=True)
+        self.assertContains(response, 'Added Cake Topper to your cart')
+        self.assertNotIn('_messages', self.client.session)
+
+    def test_benchmark_compares_session_setups(self):
+        out = StringIO()
+        call_command('benchmark_sessions', rounds=2, stdout=out)
+        rows = {line.split()[0]: line.split()[1:]
+                for line in out.getvalue().splitlines()[1:5]}
+        requests, writes = map(int, rows['session-messages'][:2])
+        cookie_requests, cookie_writes = map(
+            int, rows['cookie-messages'][:2])
+        cached_requests, cached_writes = map(
+            int, rows['cached-sessions'][:2])
+        self.assertEqual(requests, 24)
+        self.assertEqual(requests, cookie_requests)
+        self.assertEqual(requests, cached_requests)
+        self.assertLess(cookie_writes, writes)
+        self.assertLess(cached_writes, cookie_writes)
+        self.assertLess(int(rows['database-carts'][1]), cached_writes)
+        self.assertIn('p99', out.getvalue())
+        # The benchmark leaves no sessions behind
+        self.assertFalse(Session.objects.exists())
+
+
+class PurgeCartsTest(TestCase):
+    """
+    Test deleting the stored carts that outlived their session
+    """
+    def setUp(self):
+        self.fresh = CartRecord.objects.create(token='fresh')
+        self.stale = CartRecord.objects.create(token='stale')
+        # auto_now can only be bypassed with an update
+        CartRecord.objects.filter(pk=self.stale.pk).update(
+            updated_on=timezone.now() - timedelta(days=15))
+
+    def test_stale_carts_are_deleted(self):
+        out = StringIO()
+        call_command('purge_carts', stdout=out)
+        self.assertIn('Deleted 1 carts', out.getvalue())
+        self.assertQuerysetEqual(
+            CartRecord.objects.values_list('token', flat=True), ['fresh'])
+
+    def test_dry_run_keeps_carts(self):
+        out = StringIO()
+        call_command('purge_carts', dry_run=True, stdout=out)
+        self.assertIn('1 carts would be deleted', out.getvalue())
+        self.assertEqual(CartRecord.objects.count(), 2)
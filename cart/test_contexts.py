@@ -0,0 +1,58 @@
+from decimal import Decimal
+
+from django.test import TestCase, RequestFactory
+from django.template import Context, Template
+
+from products.models import Product
+
+from .contexts import cart_contents, get_cart_contents
+from .stores import get_cart_store
+
+
+class CartContentsTest(TestCase):
+    """
+    Test the cart context processor
+    """
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Product {index}',
+                                   price=Decimal('2.00'))
+            for index in range(20)]
+        self.request = RequestFactory().get('/')
+        self.request.session = {'cart': {
+            str(product.id): 1 for product in self.products}}
+
+    def test_cart_costs_one_query(self):
+        with self.assertNumQueries(1):
+            contents = get_cart_contents(self.request)
+        self.assertEqual(len(contents['cart_items']), 20)
+        self.assertEqual(contents['total'], Decimal('40.00'))
+        self.assertEqual(contents['grand_total'], Decimal('44.00'))
+
+    def test_context_processor_is_lazy(self):
+        with self.assertNumQueries(0):
+            context = cart_contents(self.request)
+            Template('{{ free_delivery_threshold }}').render(
+                Context(context))
+        with self.assertNumQueries(1):
+            html = Template(
+                '{{ product_count }} {{ grand_total|floatformat:2 }}'
+                '{% for item in cart_items %}.{% endfor %}').render(
+                Context(context))
+        self.assertEqual(html, '20 44.00' + '.' * 20)
+
+    def test_memo_follows_cart_changes(self):
+        get_cart_contents(self.request)
+        store = get_cart_store(self.request)
+        cart = store.load()
+        cart.set(self.products[0].id, 3)
+        store.save(cart)
+        with self.assertNumQueries(1):
+            contents = get_cart_contents(self.request)
+        self.assertEqual(contents['product_count'], 22)
+
+    def test_missing_products_are_skipped(self):
+        self.request.session['cart']['999999'] = 2
+        self.products[0].delete()
+        contents = get_cart_contents(self.request)
+        self.assertEqual(contents['product_count'], 19)
@@ -0,0 +1,77 @@
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from products.models import Product
+
+from .cart import Cart
+from .pricing import (
+    delivery_for, price_cart, revalidate_cart, to_decimal, to_minor)
+
+
+class PricingTest(TestCase):
+    """
+    Test the cart pricing engine
+    """
+    def setUp(self):
+        self.topper = Product.objects.create(
+            name='Cake Topper', price=Decimal('9.99'))
+        self.box = Product.objects.create(
+            name='Shadow Box', price=Decimal('0.10'))
+
+    def test_minor_units(self):
+        self.assertEqual(to_minor(Decimal('9.99')), 999)
+        self.assertEqual(to_minor(60), 6000)
+        self.assertEqual(to_minor(Decimal('0.005')), 1)
+        self.assertEqual(to_decimal(2198), Decimal('21.98'))
+
+    def test_price_cart_in_one_query(self):
+        cart = Cart()
+        cart.add(self.topper.id, 2)
+        cart.add(self.box.id, 3, '9x9in')
+        cart.add(999999, 1)
+        with self.assertNumQueries(1):
+            pricing = price_cart(cart)
+        self.assertEqual([line.total for line in pricing.lines], [1998, 30])
+        self.assertEqual(pricing.subtotal, 2028)
+        self.assertEqual(pricing.product_count, 5)
+        # 10% of 20.28 rounded half up to the cent
+        self.assertEqual(pricing.delivery, 203)
+        self.assertEqual(pricing.grand_total_amount, Decimal('22.31'))
+        self.assertEqual(pricing.free_delivery_delta_amount,
+                         Decimal('39.72'))
+
+    def test_free_delivery_threshold(self):
+        self.assertEqual(delivery_for(5999), 600)
+        self.assertEqual(delivery_for(6000), 0)
+
+    @override_settings(STANDARD_DELIVERY_PERCENTAGE=12.5,
+                       FREE_DELIVERY_THRESHOLD=Decimal('49.99'))
+    def test_fractional_settings(self):
+        self.assertEqual(delivery_for(1001), 125)
+        self.assertEqual(delivery_for(4999), 0)
+
+    def test_revalidate_cart_in_one_query(self):
+        cart = Cart()
+        cart.add(self.topper.id, 2, price=999)
+        cart.add(self.box.id, 3, '9x9in', price=10)
+        cart.add(999999, 1, price=100)
+        self.topper.price = Decimal('12.50')
+        self.topper.save()
+        Product.objects.filter(id=self.box.id).update(available=False)
+
+        with self.assertNumQueries(1):
+            changes = revalidate_cart(cart)
+        self.assertTrue(changes)
+        self.assertEqual(changes.missing, [(999999, None)])
+        self.assertEqual([(change['product'].id, change['size'])
+                          for change in changes.unavailable],
+                         [(self.box.id, '9x9in')])
+        change, = changes.price_changes
+        self.assertEqual((change['old_price'], change['new_price']),
+                         (Decimal('9.99'), 1250))
+
+        changes.apply(cart)
+        self.assertEqual(list(cart), [(self.topper.id, None, 2)])
+        self.assertEqual(cart.price(self.topper.id), 1250)
+        self.assertFalse(revalidate_cart(cart))
@@ -0,0 +1,318 @@
+import sys
+import threading
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.db import connection
+from django.test import (
+    TestCase, TransactionTestCase, Client, RequestFactory, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from products.models import Product
+
+from .cart import Cart
+from .models import CartLine, CartRecord
+from .stores import CartConflict, DatabaseCartStore, UserCartStore
+
+
+class CartEncodingTest(TestCase):
+    """
+    Test the compact cart encoding
+    """
+    def test_known_sizes_are_encoded_as_codes(self):
+        cart = Cart()
+        cart.add(7, 2)
+        cart.add(8, 1, '20.32x20.32cm-8x8in')
+        cart.add(8, 3, '9x9in')
+        self.assertEqual(cart.encode(),
+                         [[7, 0, 2], [8, 1, 1], [8, '9x9in', 3]])
+        self.assertEqual(Cart.decode(cart.encode()), cart)
+
+    def test_legacy_format_round_trip(self):
+        legacy = {'7': 2, '8': {'items_by_size': {
+            '20.32x20.32cm-8x8in': 1, '9x9in': 3}}}
+        cart = Cart.decode(legacy)
+        self.assertEqual(cart.get(8, '9x9in'), 3)
+        self.assertEqual(cart.count(), 6)
+        self.assertEqual(cart.to_legacy(), legacy)
+
+    def test_remove_without_size_removes_every_line(self):
+        cart = Cart.decode([[8, 1, 1], [8, 2, 1], [9, 0, 1]])
+        cart.remove(8)
+        self.assertEqual(cart.product_ids(), [9])
+        with self.assertRaises(KeyError):
+            cart.remove(8)
+
+
+class CartStoreTest(TestCase):
+    """
+    Test the cart views with each cart store
+    """
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.product = Product.objects.create(
+            name='Shadow Box', price=Decimal('10.00'), has_sizes=True)
+        self.add_url = reverse('cart:add_to_cart', args=[self.product.id])
+        self.cart_url = reverse('cart:view_cart')
+
+    def add(self, quantity, size='22.86x22.86cm-9x9in'):
+        return self.client.post(self.add_url, {
+            'quantity': quantity, 'product_size': size,
+            'redirect_url': self.cart_url})
+
+    def assert_cart_page(self, total):
+        response = self.client.get(self.cart_url)
+        self.assertContains(response, 'Shadow Box')
+        self.assertContains(response, total)
+
+    @override_settings(CART_STORE='cart.stores.SessionCartStore')
+    def test_session_store(self):
+        self.add(2)
+        self.assertEqual(self.client.session['cart'],
+                         [[self.product.id, 3, 2, 1000]])
+        self.assert_cart_page('€20.00')
+
+    @override_settings(CART_STORE='cart.stores.DatabaseCartStore')
+    def test_database_store(self):
+        self.add(2)
+        self.add(1)
+        self.assertNotIn('cart', self.client.session)
+        record = CartRecord.objects.get()
+        self.assertEqual(record.token, self.client.session['cart_token'])
+        self.assertEqual(record.data, [[self.product.id, 3, 3, 1000]])
+        self.assert_cart_page('€30.00')
+
+        # The cart survives the session key change on login
+        User.objects.create_user(username='buyer', password='x')
+        self.client.login(username='buyer', password='x')
+        self.assert_cart_page('€30.00')
+
+        remove_url = reverse('cart:remove_from_cart',
+                             args=[self.product.id])
+        self.client.post(remove_url)
+        self.assertFalse(CartRecord.objects.exists())
+
+    @override_settings(CART_STORE='cart.stores.CacheCartStore')
+    def test_cache_store(self):
+        self.add(1)
+        token = self.client.session['cart_token']
+        self.assertEqual(cache.get(f'cart:{token}'),
+                         {'version': 1,
+                          'data': [[self.product.id, 3, 1, 1000]]})
+        self.assert_cart_page('€10.00')
+
+
+class UserCartStoreTest(TestCase):
+    """
+    Test the saved carts of logged-in users
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='x')
+        self.product = Product.objects.create(
+            name='Shadow Box', price=Decimal('10.00'), has_sizes=True)
+        self.other = Product.objects.create(
+            name='Cake Topper', price=Decimal('5.00'))
+        self.size = '22.86x22.86cm-9x9in'
+        self.client = Client()
+
+    def saved_lines(self):
+        return set(CartLine.objects.filter(cart__user=self.user).values_list(
+            'product_id', 'size', 'quantity'))
+
+    def store(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        request.session = SessionStore()
+        return UserCartStore(request)
+
+    def test_anonymous_cart_is_merged_on_login(self):
+        store = self.store()
+        cart = store.load()
+        cart.add(self.product.id, 1, self.size)
+        store.save(cart)
+
+        add_url = reverse('cart:add_to_cart', args=[self.product.id])
+        self.client.post(add_url, {'quantity': 2, 'product_size': self.size,
+                                   'redirect_url': '/cart/'})
+        self.client.post(reverse('cart:add_to_cart', args=[self.other.id]),
+                         {'quantity': 1, 'redirect_url': '/cart/'})
+        self.client.login(username='buyer', password='x')
+
+        self.assertEqual(self.saved_lines(), {
+            (self.product.id, self.size, 3), (self.other.id, '', 1)})
+        self.assertNotIn('cart', self.client.session)
+
+        # The anonymous cart was dropped, requests don't look at it again
+        self.assertFalse(CartRecord.objects.exists())
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('cart:view_cart'))
+        self.assertFalse([query for query in queries
+                          if 'cart_cartrecord' in query['sql']])
+
+    def test_cart_follows_user_across_sessions(self):
+        self.client.login(username='buyer', password='x')
+        self.client.post(reverse('cart:add_to_cart', args=[self.other.id]),
+                         {'quantity': 2, 'redirect_url': '/cart/'})
+        self.assertEqual(self.saved_lines(), {(self.other.id, '', 2)})
+
+        other_device = Client()
+        other_device.login(username='buyer', password='x')
+        response = other_device.get(reverse('cart:view_cart'))
+        self.assertContains(response, 'Cake Topper')
+        self.assertContains(response, '€10.00')
+
+    def test_changes_are_written_with_one_statement_per_kind(self):
+        store = self.store()
+        cart = store.load()
+        cart.add(self.product.id, 1, self.size)
+        cart.add(self.other.id, 1)
+        store.save(cart)
+
+        store = self.store()
+        store.load()
+
+        def change(cart):
+            cart.set(self.other.id, 5)
+            cart.remove(self.product.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            store.mutate(change)
+        # One version bump, then one statement per kind of line change
+        statements = [query['sql'].split()[0] for query in queries
+                      if 'cart_cart' in query['sql']]
+        self.assertEqual(statements.count('UPDATE'), 2)
+        self.assertEqual(statements.count('DELETE'), 1)
+        self.assertNotIn('INSERT', statements)
+        self.assertEqual(self.saved_lines(), {(self.other.id, '', 5)})
+
+        # The cart is stored before the response is built
+        self.assertEqual(store.load().get(self.other.id), 5)
+        store.mutate(lambda cart: cart.add(self.product.id, 2, self.size))
+        store.mutate(lambda cart: cart.add(self.product.id, 1, self.size))
+        self.assertEqual(self.saved_lines(), {
+            (self.other.id, '', 5), (self.product.id, self.size, 3)})
+
+
+class ConcurrentCartTest(TestCase):
+    """
+    Test that concurrent changes to a cart are not lost
+    """
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Shadow Box', price=Decimal('10.00'))
+        self.other = Product.objects.create(
+            name='Cake Topper', price=Decimal('5.00'))
+        self.session = SessionStore()
+        self.session.create()
+
+    def request(self, user=None):
+        request = RequestFactory().post('/')
+        request.session = SessionStore(self.session.session_key)
+        if user is not None:
+            request.user = user
+        return request
+
+    def test_database_store_retries_on_concurrent_change(self):
+        first = DatabaseCartStore(self.request())
+        first.mutate(lambda cart: cart.add(self.product.id, 1))
+        first.request.session.save()
+
+        # Both requests read the cart before either writes it
+        one, two = (DatabaseCartStore(self.request()) for _ in range(2))
+        one.load()
+        two.load()
+        one.mutate(lambda cart: cart.add(self.product.id, 2))
+        with self.assertNumQueries(3):
+            # A failed UPDATE, a read and a successful UPDATE
+            two.mutate(lambda cart: cart.add(self.other.id, 1))
+
+        cart = DatabaseCartStore(self.request()).load()
+        self.assertEqual(cart.get(self.product.id), 3)
+        self.assertEqual(cart.get(self.other.id), 1)
+        self.assertEqual(CartRecord.objects.get().version, 2)
+
+    def test_user_store_replays_changes_on_concurrent_change(self):
+        user = User.objects.create_user(username='buyer', password='x')
+        first = UserCartStore(self.request(user))
+        first.mutate(lambda cart: cart.add(self.product.id, 1))
+
+        # Both requests read the cart before either writes it
+        one, two = (UserCartStore(self.request(user)) for _ in range(2))
+        one.load()
+        two.load()
+        one.mutate(lambda cart: cart.add(self.product.id, 2))
+        two.mutate(lambda cart: cart.add(self.other.id, 1))
+        two.mutate(lambda cart: cart.add(self.product.id, 1))
+
+        cart = UserCartStore(self.request(user)).load()
+        self.assertEqual(cart.get(self.product.id), 4)
+        self.assertEqual(cart.get(self.other.id), 1)
+
+        # A change that keeps losing is reported, not stored
+        with mock.patch.object(UserCartStore, 'claim_version',
+                               return_value=False), \
+                mock.patch('cart.stores.backoff'):
+            with self.assertRaises(CartConflict):
+                one.mutate(lambda cart: cart.add(self.other.id, 1))
+        cart = UserCartStore(self.request(user)).load()
+        self.assertEqual(cart.get(self.other.id), 1)
+
+
+@override_settings(CART_STORE='cart.stores.CacheCartStore')
+class ParallelAddToCartTest(TransactionTestCase):
+    """
+    Fire parallel add_to_cart requests at one cart
+    """
+    threads = 8
+    adds = 5
+
+    def setUp(self):
+        cache.clear()
+        self.products = [
+            Product.objects.create(name=f'Product {index}',
+                                   price=Decimal('2.00'))
+            for index in range(2)]
+        self.client = Client()
+        self.client.post(reverse('cart:add_to_cart',
+                                 args=[self.products[0].id]),
+                         {'quantity': 1, 'redirect_url': '/cart/'})
+
+    def add_to_cart(self, barrier, errors):
+        client = Client()
+        client.cookies = self.client.cookies
+        try:
+            barrier.wait()
+            for index in range(self.adds):
+                product = self.products[index % 2]
+                client.post(reverse('cart:add_to_cart', args=[product.id]),
+                            {'quantity': 1, 'redirect_url': '/cart/'})
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    def test_parallel_adds_are_all_counted(self):
+        # Switch threads often so that the requests interleave
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, interval)
+        barrier = threading.Barrier(self.threads)
+        errors = []
+        threads = [threading.Thread(target=self.add_to_cart,
+                                    args=(barrier, errors))
+                   for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        token = self.client.session['cart_token']
+        cart = Cart.decode(cache.get(f'cart:{token}')['data'])
+        self.assertEqual(cart.get(self.products[0].id), 1 + 3 * self.threads)
+        self.assertEqual(cart.get(self.products[1].id), 2 * self.threads)
@@ -5,6 +5,17 @@ from django.contrib.messages import get_messages
 
 from products.models import Product
 
+from .cart import Cart
+from .models import CartRecord
+
+
+def stored_cart(client):
+    """ Decode the stored cart of the test client's visitor """
+    data = CartRecord.objects.filter(
+        token=client.session.get('cart_token')).values_list(
+        'data', flat=True).first()
+    return Cart.decode(data).to_legacy()
+
 
 class CartViewTests(TestCase):
     """
@@ -107,7 +118,7 @@ class AddToCartViewTests(TestCase):
         response = self.client.post(url, data=data)
 
         # Verify that the product is added to the cart
-        cart = self.client.session['cart']
+        cart = stored_cart(self.client)
         self.assertEqual(cart[str(self.product.id)], 1)
 
         # Verify that a success message is displayed
@@ -128,7 +139,7 @@ class AddToCartViewTests(TestCase):
         response = self.client.post(url, data=data)
 
         # Verify that the product is added to the cart with the correct size
-        cart = self.client.session['cart']
+        cart = stored_cart(self.client)
         self.assertEqual(cart[str(self.product.id)],
                          {'items_by_size': {'9x9in': 1}})
 
@@ -152,7 +163,7 @@ class AddToCartViewTests(TestCase):
         # add the product to the cart again
         response = self.client.post(add_url,
                                     {'quantity': 1, 'redirect_url': self.url})
-        cart = self.client.session['cart']
+        cart = stored_cart(self.client)
 
         # check that the quantity of the product in the cart is 2
         self.assertEqual(cart[str(self.product.id)], 2)
@@ -184,7 +195,7 @@ class AddToCartViewTests(TestCase):
              'redirect_url': self.url,
              'product_size': '9x9in',
              })
-        cart = self.client.session['cart']
+        cart = stored_cart(self.client)
 
         # check that the quantity of the product in the cart with the 
         # specified size is 2
@@ -260,7 +271,7 @@ class UpdateCartViewTests(TestCase):
 
         # Check that the cart is updated with new quantity
         expected_cart = {'1': 2}
-        self.assertEqual(self.client.session['cart'], expected_cart)
+        self.assertEqual(stored_cart(self.client), expected_cart)
 
         self.assertRedirects(response, self.url)
 
@@ -396,7 +407,7 @@ class RemoveFromCartViewTest(TestCase):
              'product_size': '9x9in'},)
         # assert cart is empty after removing product with size
         response = self.client.post(remove_url)
-        cart = self.client.session['cart']
+        cart = stored_cart(self.client)
         self.assertEqual(cart, {})
         # assert toast message is correct
         messages = list(get_messages(response.wsgi_request))
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'cart'
 
@@ -8,4 +8,8 @@ urlpatterns = [
     path('add/<item_id>/', views.add_to_cart, name='add_to_cart'),
     path('adjust/<item_id>/', views.adjust_cart, name='adjust_cart'),
     path('remove/<item_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('api/add/<item_id>/', api.add, name='api_add'),
+    path('api/adjust/<item_id>/', api.adjust, name='api_adjust'),
+    path('api/remove/<item_id>/', api.remove, name='api_remove'),
+    path('api/batch/', api.batch, name='api_batch'),
 ]
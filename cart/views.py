@@ -9,11 +9,33 @@ from django.contrib import messages
 
 from products.models import Product
 
+from .contexts import get_cart_contents
+from .pricing import to_minor
+from .stores import CartConflict, get_cart_store
+
+# Message shown when a cart change lost to concurrent changes
+CONFLICT_MESSAGE = ('Your cart was changed by another request at the '
+                    'same time, please try again.')
+
 
 def view_cart(request):
-    """ View to render cart contents page """
+    """
+    View to render cart contents page. Lines of products that were
+    removed or are no longer available are dropped from the cart and
+    price changes are kept, and the customer is shown what changed.
+    """
 
-    return render(request, "cart/cart.html")
+    # check the cart against the catalog
+    changes = get_cart_contents(request)['cart_changes']
+    if changes:
+        try:
+            # bring the stored cart up to date
+            get_cart_store(request).mutate(changes.apply)
+        except CartConflict:
+            # the changes are found and applied again on the next visit
+            pass
+
+    return render(request, "cart/cart.html", {'cart_changes': changes})
 
 
 def add_to_cart(request, item_id):
@@ -62,53 +84,45 @@ def add_to_cart(request, item_id):
     if 'product_size' in request.POST:
         size = request.POST['product_size']
 
-    # get the current cart from the session, or initialize an empty cart
-    cart = request.session.get('cart', {})
+    # add the quantity to the cart line, atomically against concurrent
+    # changes to the same cart
+    store = get_cart_store(request)
+    try:
+        new_quantity = store.mutate(
+            lambda cart: cart.add(product.id, quantity, size,
+                                  to_minor(product.price)))
+    except CartConflict:
+        # display an error message if the change could not be stored
+        messages.error(request, CONFLICT_MESSAGE)
+        return redirect(redirect_url)
+    # check whether the product (in this size) was already in the cart
+    in_cart = new_quantity != quantity
 
     # if the product has a specified size
     if size:
-        # if the product is already in the cart
-        if item_id in list(cart.keys()):
-            # if the size is already in the cart for this product
-            if size in cart[item_id]['items_by_size'].keys():
-                # add the quantity to the existing size quantity
-                cart[item_id]['items_by_size'][size] += quantity
-                # display a success message indicating the updated quantity
-                messages.success(
-                    request,
-                    f'Updated size {size.upper()} {product.name} \
-quantity to {cart[item_id]["items_by_size"][size]}')
-            else:
-                # add a new size to the cart for this product
-                cart[item_id]['items_by_size'][size] = quantity
-                # display a success message indicating the added item
-                messages.success(
-                    request,
-                    f'Added size {size.upper()} {product.name} to your cart')
+        # if the size is already in the cart for this product
+        if in_cart:
+            # display a success message indicating the updated quantity
+            messages.success(
+                request,
+                f'Updated size {size.upper()} {product.name} \
+quantity to {new_quantity}')
         else:
-            # add the product and size to the cart
-            cart[item_id] = {'items_by_size': {size: quantity}}
             # display a success message indicating the added item
             messages.success(
                 request,
                 f'Added size {size.upper()} {product.name} to your cart')
     else:
         # if the product does not have a specified size
-        if item_id in list(cart.keys()):
-            # add the quantity to the existing quantity
-            cart[item_id] += quantity
+        if in_cart:
             # display a success message indicating the updated quantity
             messages.success(
                 request,
-                f'Updated {product.name} quantity to {cart[item_id]}')
+                f'Updated {product.name} quantity to {new_quantity}')
         else:
-            # add the product to the cart
-            cart[item_id] = quantity
             # display a success message indicating the added item
             messages.success(request, f'Added {product.name} to your cart')
 
-    # update the cart in the session
-    request.session['cart'] = cart
     # redirect back to the previous page
     return redirect(redirect_url)
 
@@ -151,30 +165,27 @@ def adjust_cart(request, item_id):
     if 'product_size' in request.POST:
         size = request.POST['product_size']
 
-    # Get the current cart dictionary from the user's session,
-    # or initialize it to an empty dictionary
-    cart = request.session.get('cart', {})
+    # Set the quantity of the cart line, removing it when the quantity
+    # is zero or less, atomically against concurrent changes to the cart
+    store = get_cart_store(request)
+    try:
+        store.mutate(lambda cart: cart.set(product.id, quantity, size))
+    except CartConflict:
+        # Add an error message if the change could not be stored
+        messages.error(request, CONFLICT_MESSAGE)
+        return redirect(reverse('cart:view_cart'))
 
     # If a size was specified
     if size:
         # If the quantity is greater than zero
         if quantity > 0:
-            # Update the quantity for the specified size in the cart dictionary
-            cart[item_id]['items_by_size'][size] = quantity
             # Add a success message indicating the size and quantity that were
             # updated
             messages.success(
                 request,
                 f'Updated size {size.upper()} {product.name} quantity to \
-{cart[item_id]["items_by_size"][size]}')
+{quantity}')
         else:
-            # If the quantity is zero or less, remove the size from the cart
-            # dictionary
-            del cart[item_id]['items_by_size'][size]
-            # If there are no more sizes in the items_by_size dictionary, #
-            # remove the entire product from the cart
-            if not cart[item_id]['items_by_size']:
-                cart.pop(item_id)
             # Add a success message indicating the size that was removed
             messages.success(
                 request,
@@ -183,22 +194,14 @@ def adjust_cart(request, item_id):
     else:
         # If the quantity is greater than zero
         if quantity > 0:
-            # Update the quantity for the specified product ID in the cart.
-            # dictionary
-            cart[item_id] = quantity
             # Add a success message indicating the quantity that was updated
             messages.success(
                 request,
-                f'Updated {product.name} quantity to {cart[item_id]}')
+                f'Updated {product.name} quantity to {quantity}')
         else:
-            # If the quantity is zero or less, remove the product from the
-            # cart dictionary
-            cart.pop(item_id)
             # Add a success message indicating the product that was removed
             messages.success(request, f'Removed {product.name} from your cart')
 
-    # Save the updated cart dictionary back to the user's session
-    request.session['cart'] = cart
     # Redirect the user back to the cart view
     return redirect(reverse('cart:view_cart'))
 
@@ -233,36 +236,30 @@ def remove_from_cart(request, item_id):
         if 'product_size' in request.POST:
             size = request.POST['product_size']
 
-        # Get the user's cart from the session or set it to an empty
-        # dictionary if it doesn't exist
-        cart = request.session.get('cart', {})
-
+        # Remove the line with the specified size, or every line of the
+        # product when no size is specified
+        store = get_cart_store(request)
+        store.mutate(lambda cart: cart.remove(product.id, size))
         if size:
-            # If the size is specified, remove the item with the specified
-            # size from the cart
-            del cart[item_id]['items_by_size'][size]
-            # If the cart no longer contains any items with the specified
-            # product ID, remove the product from the cart entirely
-            if not cart[item_id]['items_by_size']:
-                cart.pop(item_id)
             # Add a success message to the user's session indicating that the
             # item was removed
             messages.success(
                 request,
                 f'Removed size {size.upper()} {product.name} from your cart')
         else:
-            # If the size is not specified, remove the entire product from the
-            # cart
-            cart.pop(item_id)
             # Add a success message to the user's session indicating that the
             # item was removed
             messages.success(request, f'Removed {product.name} from your cart')
 
-        # Set the updated cart back into the session
-        request.session['cart'] = cart
         # Return an HTTP response with a status code of 200 to indicate success
         return HttpResponse(status=200)
 
+    except CartConflict:
+        # If the change lost to concurrent changes of the cart, add an error
+        # message and return an HTTP response with a status code of 409
+        messages.error(request, CONFLICT_MESSAGE)
+        return HttpResponse(status=409)
+
     except Exception as e:
         # If an error occurs, add an error message to the user's session and
         # return an HTTP response with a status code of 500
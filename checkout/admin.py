@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderLineItem
+from .models import Order, OrderLineItem, WebhookEvent
 
 
 class OrderLineItemAdminInline(admin.TabularInline):
@@ -33,3 +33,18 @@ class OrderAdmin(admin.ModelAdmin):
                     'grand_total',)
 
     ordering = ('-date',)
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    """
+    Queued Stripe webhook events in admin panel
+    """
+    list_display = ('event_id', 'event_type', 'status', 'attempts',
+                    'received_on', 'processed_on',)
+    list_filter = ('status', 'event_type',)
+    search_fields = ('event_id',)
+    readonly_fields = ('event_id', 'event_type', 'payload', 'attempts',
+                       'received_on', 'processed_on', 'last_error',)
+
+    ordering = ('-received_on',)
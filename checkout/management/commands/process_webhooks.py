@@ -0,0 +1,19 @@
+from checkout.models import WebhookEvent
+from checkout.webhook_queue import process_due_events
+from hand_crafted.queue import QueueCommand
+
+
+class Command(QueueCommand):
+    """
+    Handle the queued Stripe webhook events, see QueueCommand for the
+    options
+    """
+    help = 'Handle the queued Stripe webhook events'
+    model = WebhookEvent
+    noun = 'events'
+
+    def process_batch(self, limit):
+        return process_due_events(limit)
+
+    def report(self, done, failed):
+        return f'Processed {done} events, {failed} failed'
@@ -0,0 +1,42 @@
+# Generated by Django 3.2 on 2026-10-18 11:51
+
+from django.db import migrations, models
+
+
+def prepare_unique_pids(apps, schema_editor):
+    """
+    Store missing payment intent ids as NULL so the ids can be made
+    unique. An id recorded on several orders can't be resolved here
+    without losing track of a payment, so the migration stops and lists
+    them to be fixed by hand.
+    """
+    Order = apps.get_model('checkout', 'Order')
+    Order.objects.filter(stripe_pid='').update(stripe_pid=None)
+    orders = {}
+    for pid, order_number in Order.objects.exclude(
+            stripe_pid=None).order_by('date', 'id').values_list(
+            'stripe_pid', 'order_number'):
+        orders.setdefault(pid, []).append(order_number)
+    duplicates = [f'{pid}: {", ".join(numbers)}'
+                  for pid, numbers in orders.items() if len(numbers) > 1]
+    if duplicates:
+        raise RuntimeError(
+            'These payment intent ids are recorded on several orders. '
+            'Keep each one on the order it paid for and clear it on the '
+            'others, then migrate again:\n' + '\n'.join(duplicates))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='stripe_pid',
+            field=models.CharField(blank=True, max_length=254, null=True),
+        ),
+        migrations.RunPython(prepare_unique_pids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 12:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0004_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhookevent',
+            name='payment_intent',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+    ]
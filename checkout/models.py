@@ -1,11 +1,14 @@
 import uuid
+from datetime import timedelta
 
 from django.db import models
 from django.db.models import Sum
-from django.conf import settings
 
 from django_countries.fields import CountryField
 
+from cart.pricing import delivery_for, to_decimal, to_minor
+from hand_crafted.queue import QueueItem
+
 from products.models import Product
 from profiles.models import UserProfile
 
@@ -35,8 +38,10 @@ class Order(models.Model):
     grand_total = models.DecimalField(
                         max_digits=10, decimal_places=2, null=False, default=0)
     original_cart = models.TextField(null=False, blank=False, default='')
+    # The payment intent id, unique so an order is created only once per
+    # payment by the checkout view or the webhook, whichever comes first
     stripe_pid = models.CharField(
-                        max_length=254, null=False, blank=False, default='')
+                        max_length=254, null=True, blank=True, unique=True)
 
     def _generate_order_number(self):
         """
@@ -49,15 +54,21 @@ class Order(models.Model):
         Update grand total each time a line item is added,
         accounting for delivery costs.
         """
-        self.order_total = self.lineitems.aggregate(
+        order_total = self.lineitems.aggregate(
                             Sum('lineitem_total'))['lineitem_total__sum'] or 0
-        if self.order_total < settings.FREE_DELIVERY_THRESHOLD:
-            self.delivery_cost = self.order_total * settings \
-                                .STANDARD_DELIVERY_PERCENTAGE / 100
-        else:
-            self.delivery_cost = 0
-        self.grand_total = self.order_total + self.delivery_cost
-        self.save()
+        self.set_totals(to_minor(order_total))
+        self.save(update_fields=[
+            'order_total', 'delivery_cost', 'grand_total'])
+
+    def set_totals(self, subtotal):
+        """
+        Set the order, delivery and grand totals from the order
+        subtotal in minor units, priced by cart.pricing
+        """
+        delivery = delivery_for(subtotal)
+        self.order_total = to_decimal(subtotal)
+        self.delivery_cost = to_decimal(delivery)
+        self.grand_total = to_decimal(subtotal + delivery)
 
     def save(self, *args, **kwargs):
         """
@@ -66,6 +77,9 @@ class Order(models.Model):
         """
         if not self.order_number:
             self.order_number = self._generate_order_number()
+        # Orders without a payment intent don't share an empty one
+        if not self.stripe_pid:
+            self.stripe_pid = None
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -92,14 +106,59 @@ class OrderLineItem(models.Model):
                     max_digits=6, decimal_places=2,
                     null=False, blank=False, editable=False)
 
+    def set_lineitem_total(self):
+        """ Set the lineitem total from the product price """
+        self.lineitem_total = self.product.price * self.quantity
+
     def save(self, *args, **kwargs):
         """
         Override the original save method to set the lineitem total
         and update the order total.
         """
-        self.lineitem_total = self.product.price * self.quantity
+        self.set_lineitem_total()
         super().save(*args, **kwargs)
 
     def __str__(self):
         """ Return SKU and order number """
         return f'SKU {self.product.sku} on order {self.order.order_number}'
+
+
+class WebhookEvent(QueueItem):
+    """
+    A Stripe webhook event, stored when received and handled later by
+    the process_webhooks command
+    """
+    PENDING = 'pending'
+    PROCESSED = 'processed'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (PROCESSED, 'Processed'),
+        (FAILED, 'Failed'),
+    )
+    WAITING = PENDING
+    MAX_ATTEMPTS = 8
+    RETRY_BACKOFF = timedelta(seconds=30)
+    MAX_RETRY_BACKOFF = timedelta(hours=6)
+    CLAIM_TIMEOUT = timedelta(minutes=5)
+
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=255)
+    # The PaymentIntent the event is about, if any
+    payment_intent = models.CharField(
+        max_length=255, blank=True, default='', db_index=True)
+    # The verified request body, as sent by Stripe
+    payload = models.TextField()
+    status = models.CharField(
+        max_length=10, choices=STATUSES, default=PENDING)
+    received_on = models.DateTimeField(auto_now_add=True)
+    processed_on = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_on'],
+                         name='webhook_event_due'),
+        ]
+
+    def __str__(self):
+        return f'{self.event_type} {self.event_id}'
@@ -0,0 +1,95 @@
+"""
+Stripe PaymentIntents of the checkout.
+
+The PaymentIntent of a visitor's checkout is kept in the session with a
+fingerprint of the cart lines and total. Whether it can be reused is
+decided from local state only: it is dropped once an order or a queued
+payment_intent.succeeded webhook event holds its id. Visiting the
+checkout again with the same cart reuses it without calling Stripe, and
+a changed total only modifies its amount. A new PaymentIntent is created
+when there is none left to reuse or Stripe refuses the change (e.g. it
+was paid meanwhile), so refreshing the page doesn't leave abandoned
+intents behind.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+
+import stripe
+
+from cart.contexts import get_cart_contents
+from cart.stores import get_cart_store
+
+from .models import Order, WebhookEvent
+
+# Session key of the current PaymentIntent
+SESSION_KEY = 'payment_intent'
+
+
+def cart_fingerprint(cart, amount):
+    """ Return a hash of the cart lines and the amount to pay """
+    lines = sorted([product_id, size or '', quantity]
+                   for product_id, size, quantity in cart)
+    data = json.dumps([lines, amount, settings.STRIPE_CURRENCY])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def is_paid(intent_id):
+    """
+    Check whether a PaymentIntent already paid for an order, recorded by
+    the checkout or received from the webhook
+    """
+    return (Order.objects.filter(stripe_pid=intent_id).exists() or
+            WebhookEvent.objects.filter(
+                payment_intent=intent_id,
+                event_type='payment_intent.succeeded').exists())
+
+
+def get_client_secret(request):
+    """
+    Return the client secret of the PaymentIntent paying for the cart
+    of the request. The one stored in the session is reused until it
+    paid for an order, with its amount changed if the total changed.
+    """
+    cart = get_cart_store(request).load()
+    amount = get_cart_contents(request)['pricing'].grand_total
+    fingerprint = cart_fingerprint(cart, amount)
+
+    stored = request.session.get(SESSION_KEY)
+    if stored and is_paid(stored['id']):
+        forget_payment_intent(request)
+        stored = None
+    if stored and stored['fingerprint'] == fingerprint:
+        return stored['client_secret']
+
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    intent = None
+    if stored:
+        if stored['amount'] == amount:
+            intent = stored
+        else:
+            try:
+                stripe.PaymentIntent.modify(stored['id'], amount=amount)
+                intent = stored
+            except stripe.error.InvalidRequestError:
+                # Paid or canceled meanwhile, start a new one
+                intent = None
+    if intent is None:
+        intent = stripe.PaymentIntent.create(
+            amount=amount,
+            currency=settings.STRIPE_CURRENCY,
+        )
+
+    request.session[SESSION_KEY] = {
+        'id': intent['id'],
+        'client_secret': intent['client_secret'],
+        'amount': amount,
+        'fingerprint': fingerprint,
+    }
+    return intent['client_secret']
+
+
+def forget_payment_intent(request):
+    """ Drop the PaymentIntent of the session once it paid an order """
+    request.session.pop(SESSION_KEY, None)
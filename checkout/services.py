@@ -0,0 +1,49 @@
+"""
+Order building.
+
+``create_order`` saves an order and its line items from a cart in one
+transaction and a fixed number of queries: the products are fetched at
+once, the totals are computed once through cart.pricing and the line
+items are inserted with a single bulk_create. bulk_create sends no
+post_save signals, so the per-line total updates in checkout.signals
+only run for line items saved one by one, e.g. from the admin.
+"""
+from django.db import transaction
+
+from cart.pricing import to_minor
+from products.models import Product
+
+from .models import OrderLineItem
+
+
+def create_order(order, cart, products=None):
+    """
+    Save an unsaved order with a line item for every line of the cart
+    and return it. The products are fetched with one query unless given
+    as an {id: product} mapping. Nothing is saved when a product no
+    longer exists.
+    """
+    if products is None:
+        products = Product.objects.in_bulk(cart.product_ids())
+    missing = set(cart.product_ids()) - set(products)
+    if missing:
+        raise Product.DoesNotExist(
+            f'Products {sorted(missing)} no longer exist.')
+
+    line_items = []
+    for item_id, size, quantity in cart:
+        line_item = OrderLineItem(
+            order=order,
+            product=products[item_id],
+            quantity=quantity,
+            product_size=size,
+        )
+        line_item.set_lineitem_total()
+        line_items.append(line_item)
+    order.set_totals(sum(to_minor(line_item.lineitem_total)
+                         for line_item in line_items))
+
+    with transaction.atomic():
+        order.save()
+        OrderLineItem.objects.bulk_create(line_items)
+    return order
@@ -105,9 +105,10 @@ class TestOrderLineItemModel(TestCase):
         # Check that the order total is equal to the expected order total
         self.assertEqual(self.order.order_total, expected_order_total)
 
-        # Get the expected delivery cost
-        expected_delivery_cost = expected_order_total * \
-            settings.STANDARD_DELIVERY_PERCENTAGE / 100
+        # Get the expected delivery cost, rounded to the cent
+        expected_delivery_cost = (expected_order_total *
+                                  settings.STANDARD_DELIVERY_PERCENTAGE /
+                                  100).quantize(Decimal('0.01'))
         # Get the expected grand total
         expected_grand_total = expected_order_total + expected_delivery_cost
         self.assertEqual(self.order.grand_total, expected_grand_total)
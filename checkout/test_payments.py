@@ -0,0 +1,228 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+import stripe
+
+from products.models import Product
+
+from .models import Order, WebhookEvent
+from .payments import SESSION_KEY
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    """ PaymentIntent endpoints of the fake Stripe API """
+    def log_message(self, *args):
+        pass
+
+    def respond(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def not_found(self):
+        self.respond(404, {'error': {
+            'type': 'invalid_request_error',
+            'message': f'No such resource: {self.path}'}})
+
+    def do_GET(self):
+        server = self.server
+        server.calls.append(('GET', self.path))
+        intent_id = self.path.rpartition('/')[2]
+        if intent_id not in server.intents:
+            return self.not_found()
+        self.respond(200, server.intents[intent_id])
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        params = dict(parse_qsl(self.rfile.read(length).decode()))
+        server.calls.append(('POST', self.path))
+        if self.path == '/v1/payment_intents':
+            intent_id = f'pi_{len(server.intents) + 1}'
+            server.intents[intent_id] = {
+                'id': intent_id,
+                'object': 'payment_intent',
+                'amount': int(params['amount']),
+                'currency': params['currency'],
+                'client_secret': f'{intent_id}_secret_fake',
+                'status': 'requires_payment_method',
+                'metadata': {},
+            }
+            return self.respond(200, server.intents[intent_id])
+
+        intent_id = self.path.rpartition('/')[2]
+        intent = server.intents.get(intent_id)
+        if intent is None:
+            return self.not_found()
+        if intent['status'] in ('succeeded', 'canceled'):
+            return self.respond(400, {'error': {
+                'type': 'invalid_request_error',
+                'message': 'This PaymentIntent can no longer be updated.'}})
+        if 'amount' in params:
+            intent['amount'] = int(params['amount'])
+        for key, value in params.items():
+            if key.startswith('metadata['):
+                intent['metadata'][key[9:-1]] = value
+        self.respond(200, intent)
+
+
+class FakeStripe(ThreadingHTTPServer):
+    """
+    Local stand-in for the Stripe API, recording the calls it receives
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeStripeHandler)
+        self.intents = {}
+        self.calls = []
+
+    def start(self, test):
+        """ Serve the Stripe API calls made while a test runs """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.start()
+        api_base = stripe.api_base
+        stripe.api_base = f'http://127.0.0.1:{self.server_address[1]}'
+        settings = override_settings(STRIPE_SECRET_KEY='sk_test_fake')
+        settings.enable()
+        test.addCleanup(thread.join)
+        test.addCleanup(self.server_close)
+        test.addCleanup(self.shutdown)
+        test.addCleanup(setattr, stripe, 'api_base', api_base)
+        test.addCleanup(settings.disable)
+        return self
+
+
+class PaymentIntentReuseTest(TestCase):
+    """
+    Test reusing the PaymentIntent of the checkout
+    """
+    def setUp(self):
+        self.stripe = FakeStripe().start(self)
+        self.client = Client()
+        self.checkout_url = reverse('checkout:checkout')
+        self.product = Product.objects.create(name='Shadow Box', price=10)
+        self.other = Product.objects.create(name='Cake Topper', price=10)
+        self.add(self.product, 2)
+
+    def add(self, product, quantity):
+        self.client.post(reverse('cart:add_to_cart', args=[product.id]),
+                         {'quantity': quantity, 'redirect_url': '/'})
+
+    def test_same_cart_reuses_intent(self):
+        first = self.client.get(self.checkout_url)
+        second = self.client.get(self.checkout_url)
+
+        # The refresh reuses the stored intent without calling Stripe
+        self.assertEqual(self.stripe.calls, [
+            ('POST', '/v1/payment_intents'),
+        ])
+        self.assertEqual(first.context['client_secret'], 'pi_1_secret_fake')
+        self.assertEqual(second.context['client_secret'], 'pi_1_secret_fake')
+        self.assertEqual(self.stripe.intents['pi_1']['amount'], 2200)
+
+    def test_changed_total_modifies_intent(self):
+        self.client.get(self.checkout_url)
+        self.add(self.product, 1)
+        response = self.client.get(self.checkout_url)
+
+        self.assertEqual(response.context['client_secret'], 'pi_1_secret_fake')
+        self.assertEqual(self.stripe.calls, [
+            ('POST', '/v1/payment_intents'),
+            ('POST', '/v1/payment_intents/pi_1'),
+        ])
+        self.assertEqual(self.stripe.intents['pi_1']['amount'], 3300)
+        self.assertEqual(self.client.session[SESSION_KEY]['amount'], 3300)
+
+        # Same total with other lines: Stripe isn't called
+        self.client.post(reverse('cart:adjust_cart', args=[self.product.id]),
+                         {'quantity': 2, 'redirect_url': '/'})
+        self.add(self.other, 1)
+        self.client.get(self.checkout_url)
+        self.assertEqual(len(self.stripe.calls), 2)
+        self.assertEqual(self.client.session[SESSION_KEY]['id'], 'pi_1')
+
+    def test_paid_intent_is_replaced(self):
+        # Paid meanwhile, so Stripe refuses the new amount
+        self.client.get(self.checkout_url)
+        self.stripe.intents['pi_1']['status'] = 'succeeded'
+        self.add(self.product, 1)
+        response = self.client.get(self.checkout_url)
+
+        self.assertEqual(response.context['client_secret'], 'pi_2_secret_fake')
+        self.assertEqual(self.stripe.intents['pi_2']['amount'], 3300)
+
+    def test_paid_intent_is_not_reused_for_same_cart(self):
+        # e.g. the form submit was lost after the card payment, and only
+        # the webhook event was queued
+        self.client.get(self.checkout_url)
+        WebhookEvent.objects.create(
+            event_id='evt_1', event_type='payment_intent.succeeded',
+            payment_intent='pi_1', payload='{}')
+        response = self.client.get(self.checkout_url)
+
+        self.assertEqual(response.context['client_secret'], 'pi_2_secret_fake')
+        self.assertEqual(self.client.session[SESSION_KEY]['id'], 'pi_2')
+
+    def test_failed_payment_event_keeps_intent(self):
+        self.client.get(self.checkout_url)
+        WebhookEvent.objects.create(
+            event_id='evt_1', event_type='payment_intent.payment_failed',
+            payment_intent='pi_1', payload='{}')
+        response = self.client.get(self.checkout_url)
+
+        self.assertEqual(response.context['client_secret'], 'pi_1_secret_fake')
+
+    def test_intent_with_recorded_order_is_forgotten(self):
+        # e.g. the order was recorded by the webhook only
+        self.client.get(self.checkout_url)
+        Order.objects.create(full_name='Test User', email='a@example.com',
+                             phone_number='1', country='IE',
+                             town_or_city='Town', street_address1='1 St',
+                             stripe_pid='pi_1')
+        response = self.client.get(self.checkout_url)
+
+        self.assertEqual(response.context['client_secret'], 'pi_2_secret_fake')
+        self.assertNotIn(('POST', '/v1/payment_intents/pi_1'),
+                         self.stripe.calls)
+
+    def test_order_forgets_intent(self):
+        self.client.get(self.checkout_url)
+        self.client.post(reverse('checkout:cache_checkout_data'), {
+            'client_secret': 'pi_1_secret_fake', 'save_info': ''})
+        self.assertEqual(self.stripe.intents['pi_1']['metadata']['cart'],
+                         json.dumps({str(self.product.id): 2}))
+
+        self.client.post(self.checkout_url, {
+            'full_name': 'Test User',
+            'email': 'testuser@example.com',
+            'phone_number': '3530123456',
+            'street_address1': '1 Test St',
+            'street_address2': '',
+            'county': '',
+            'town_or_city': 'Test Town',
+            'postcode': 'A1234',
+            'country': 'IE',
+            'client_secret': 'pi_1_secret_fake',
+        })
+        self.assertNotIn(SESSION_KEY, self.client.session)
+
+    def test_invalid_form_keeps_intent(self):
+        self.client.get(self.checkout_url)
+        response = self.client.post(self.checkout_url, {
+            'full_name': '', 'email': '', 'phone_number': '',
+            'street_address1': '', 'street_address2': '', 'county': '',
+            'town_or_city': '', 'postcode': '', 'country': '',
+            'client_secret': 'pi_1_secret_fake',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['client_secret'], 'pi_1_secret_fake')
+        self.assertEqual(len(self.stripe.calls), 1)
@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from cart.cart import Cart
+from products.models import Product
+
+from .models import Order, OrderLineItem
+from .services import create_order
+
+
+class CreateOrderTest(TestCase):
+    """
+    Test building orders from a cart
+    """
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Product {number}',
+                                   price=Decimal('9.99'))
+            for number in range(10)]
+        self.cart = Cart()
+        for product in self.products:
+            self.cart.add(product.id, 2)
+        self.cart.add(self.products[0].id, 1, '9x9in')
+
+    def new_order(self):
+        return Order(full_name='Test User', email='test@example.com',
+                     phone_number='3530123456', country='IE',
+                     town_or_city='Test Town', street_address1='1 Test St')
+
+    def test_order_in_fixed_number_of_queries(self):
+        # Product fetch, savepoint, order insert, line items insert,
+        # savepoint release
+        with self.assertNumQueries(5):
+            order = create_order(self.new_order(), self.cart)
+
+        self.assertEqual(order.lineitems.count(), 11)
+        line_item = order.lineitems.get(product_size='9x9in')
+        self.assertEqual(line_item.lineitem_total, Decimal('9.99'))
+        # 21 x 9.99, above the free delivery threshold
+        order.refresh_from_db()
+        self.assertEqual(order.order_total, Decimal('209.79'))
+        self.assertEqual(order.delivery_cost, Decimal('0.00'))
+        self.assertEqual(order.grand_total, Decimal('209.79'))
+
+    def test_totals_match_line_item_saves(self):
+        order = create_order(self.new_order(), self.cart)
+        totals = (order.order_total, order.delivery_cost, order.grand_total)
+        # Saving a line item, as the admin does, recomputes the same totals
+        order.lineitems.first().save()
+        order.refresh_from_db()
+        self.assertEqual(
+            (order.order_total, order.delivery_cost, order.grand_total),
+            totals)
+
+        line_item = order.lineitems.first()
+        line_item.quantity += 1
+        line_item.save()
+        order.refresh_from_db()
+        self.assertEqual(order.order_total, totals[0] + Decimal('9.99'))
+
+    def test_missing_product_saves_nothing(self):
+        self.cart.add(999999, 1)
+        with self.assertRaises(Product.DoesNotExist):
+            create_order(self.new_order(), self.cart)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderLineItem.objects.exists())
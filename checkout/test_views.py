@@ -8,10 +8,12 @@ import json
 from products.models import Product
 
 from .models import Order, OrderLineItem
+from .test_payments import FakeStripe
 
 
 class CheckoutViewTest(TestCase):
     def setUp(self):
+        FakeStripe().start(self)
         self.client = Client()
         self.checkout_url = reverse('checkout:checkout')
         self.product = Product.objects.create(
@@ -20,10 +22,11 @@ class CheckoutViewTest(TestCase):
         self.user = User.objects.create_user(
             username='testuser',
             password='password')
-        self.client.login(username='testuser', password='password')
+        # The anonymous cart is merged into the user's cart on login
         self.session = self.client.session
         self.session['cart'] = {str(self.product.id): 2}
         self.session.save()
+        self.client.login(username='testuser', password='password')
 
     def test_checkout_url_exists_at_correct_location(self):
         """
@@ -98,6 +101,30 @@ class CheckoutViewTest(TestCase):
         # # Check that the cart was cleared
         # self.assertNotIn('cart', self.session)
 
+    def test_repeated_post_creates_one_order(self):
+        data = {
+            'full_name': 'Test User',
+            'email': 'testuser@example.com',
+            'phone_number': '3530123456',
+            'street_address1': '1 Test St',
+            'street_address2': '',
+            'county': '',
+            'town_or_city': 'Test Town',
+            'postcode': 'A1234',
+            'country': 'IE',
+            'client_secret': 'pi_1_secret_x'
+        }
+        first = self.client.post(self.checkout_url, data=data)
+        second = self.client.post(self.checkout_url, data=data)
+
+        order = Order.objects.get()
+        self.assertEqual(order.stripe_pid, 'pi_1')
+        for response in (first, second):
+            self.assertRedirects(
+                response, reverse('checkout:checkout_success',
+                                  args=[order.order_number]),
+                fetch_redirect_response=False)
+
     def test_checkout_view_post_with_invalid_data(self):
         data = {
             'full_name': '',
@@ -127,3 +154,80 @@ class CheckoutViewTest(TestCase):
 #         self.assertEqual(len(messages), 1)
 #         self.assertEqual(str(messages[0]), 'There was an error with your form.\
 #  Please double check your information.')
+
+
+class CartRevalidationTest(TestCase):
+    """
+    Test that checkout sends the customer back to the cart when it
+    changed since the products were added
+    """
+    def setUp(self):
+        self.client = Client()
+        self.checkout_url = reverse('checkout:checkout')
+        self.product = Product.objects.create(
+            name='Test Product', price=10.00)
+        self.client.post(reverse('cart:add_to_cart', args=[self.product.id]),
+                         {'quantity': 2, 'redirect_url': '/'})
+
+    def test_changed_cart_is_not_paid_for(self):
+        self.product.price = 12.00
+        self.product.save()
+        response = self.client.post(reverse('checkout:cache_checkout_data'),
+                                    {'client_secret': 'pi_1_secret_fake'})
+        # The page reloads instead of confirming the card payment
+        self.assertEqual(response.status_code, 409)
+
+        response = self.client.get(self.checkout_url)
+        self.assertRedirects(response, reverse('cart:view_cart'),
+                             fetch_redirect_response=False)
+
+        # The cart page shows the change and keeps the new price
+        response = self.client.get(reverse('cart:view_cart'))
+        self.assertContains(
+            response, 'The price of Test Product changed from €10.00 '
+                      'to €12.00.')
+        response = self.client.get(reverse('cart:view_cart'))
+        self.assertNotContains(response, 'cart-changes')
+
+    def test_post_with_changed_cart_still_records_order(self):
+        self.product.price = 12.00
+        self.product.save()
+        gone = Product.objects.create(name='Gone', price=5.00)
+        self.client.post(reverse('cart:add_to_cart', args=[gone.id]),
+                         {'quantity': 1, 'redirect_url': '/'})
+        gone.delete()
+        data = {
+            'full_name': 'Test User',
+            'email': 'testuser@example.com',
+            'phone_number': '3530123456',
+            'street_address1': '1 Test St',
+            'street_address2': '',
+            'county': '',
+            'town_or_city': 'Test Town',
+            'postcode': 'A1234',
+            'country': 'IE',
+            'client_secret': 'pi_1_secret_fake'
+        }
+        response = self.client.post(self.checkout_url, data=data)
+
+        # The card was charged, so the order is recorded anyway
+        order = Order.objects.get(stripe_pid='pi_1')
+        self.assertRedirects(
+            response, reverse('checkout:checkout_success',
+                              args=[order.order_number]),
+            fetch_redirect_response=False)
+        self.assertEqual(list(order.lineitems.values_list(
+            'product_id', 'quantity')), [(self.product.id, 2)])
+        messages = [str(m) for m in get_messages(response.wsgi_request)]
+        self.assertIn('changed while your payment was processed',
+                      messages[-1])
+
+    def test_unavailable_product_is_removed_from_cart(self):
+        Product.objects.filter(id=self.product.id).update(available=False)
+        response = self.client.get(self.checkout_url)
+        self.assertRedirects(response, reverse('cart:view_cart'),
+                             fetch_redirect_response=False)
+
+        response = self.client.get(reverse('cart:view_cart'))
+        self.assertContains(response, 'Test Product is no longer available')
+        self.assertContains(response, 'Your cart is empty.')
@@ -0,0 +1,92 @@
+import json
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.core import mail
+from django.db import IntegrityError, transaction
+from django.test import RequestFactory, TestCase
+
+import stripe
+
+from products.models import Product
+
+from .models import Order
+from .webhook_handler import StripeWH_Handler
+
+
+class PaymentIntentSucceededTest(TestCase):
+    """
+    Test matching and creating orders from payment_intent.succeeded
+    """
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Shadow Box', price=Decimal('10.00'))
+        self.cart = json.dumps({str(self.product.id): 2})
+        self.event = stripe.Event.construct_from({
+            'id': 'evt_1',
+            'type': 'payment_intent.succeeded',
+            'data': {'object': {
+                'id': 'pi_1',
+                'object': 'payment_intent',
+                'latest_charge': 'ch_1',
+                'metadata': {'cart': self.cart, 'save_info': '',
+                             'username': 'AnonymousUser'},
+                'shipping': {
+                    'name': 'Test User', 'phone': '3530123456',
+                    'address': {
+                        'line1': '1 Test St', 'line2': '',
+                        'city': 'Test Town', 'state': '',
+                        'postal_code': 'A1234', 'country': 'IE'}},
+            }},
+        }, 'sk_test')
+        charge = stripe.Charge.construct_from({
+            'id': 'ch_1', 'object': 'charge', 'amount': 2200,
+            'billing_details': {'email': 'test@example.com'},
+        }, 'sk_test')
+        patcher = patch('stripe.Charge.retrieve', return_value=charge)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.handler = StripeWH_Handler(RequestFactory().post('/'))
+
+    def test_order_is_matched_on_payment_intent(self):
+        order = Order.objects.create(
+            full_name='Someone Else', email='other@example.com',
+            phone_number='1', country='FR', town_or_city='Paris',
+            street_address1='2 Rue', stripe_pid='pi_1')
+        with self.assertNumQueries(1):
+            response = self.handler.handle_payment_intent_succeeded(
+                self.event)
+        self.assertContains(response, 'Verified order already in database')
+        self.assertEqual(list(Order.objects.all()), [order])
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_missing_order_is_created_once(self):
+        response = self.handler.handle_payment_intent_succeeded(self.event)
+        self.assertContains(response, 'Created order in webhook')
+        order = Order.objects.get()
+        self.assertEqual(order.stripe_pid, 'pi_1')
+        self.assertEqual(order.grand_total, Decimal('22.00'))
+        self.assertEqual(order.lineitems.get().quantity, 2)
+
+        # A repeated delivery of the event finds the order
+        response = self.handler.handle_payment_intent_succeeded(self.event)
+        self.assertContains(response, 'Verified order already in database')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_payment_intent_is_unique(self):
+        Order.objects.create(
+            full_name='Test User', email='test@example.com',
+            phone_number='1', country='IE', town_or_city='Dublin',
+            street_address1='1 Test St', stripe_pid='pi_1')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(
+                full_name='Test User', email='test@example.com',
+                phone_number='1', country='IE', town_or_city='Dublin',
+                street_address1='1 Test St', stripe_pid='pi_1')
+        # Orders without a payment intent don't collide
+        for _ in range(2):
+            Order.objects.create(
+                full_name='Test User', email='test@example.com',
+                phone_number='1', country='IE', town_or_city='Dublin',
+                street_address1='1 Test St', stripe_pid='')
+        self.assertEqual(Order.objects.filter(stripe_pid=None).count(), 2)
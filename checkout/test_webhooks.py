@@ -0,0 +1,114 @@
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+import stripe
+
+from .models import WebhookEvent
+from .webhook_queue import process_due_events
+
+WH_SECRET = 'whsec_test'
+
+
+@override_settings(STRIPE_WH_SECRET=WH_SECRET)
+class WebhookQueueTest(TestCase):
+    """
+    Test queueing Stripe webhook events and handling them later
+    """
+    def post_event(self, event_id, event_type='charge.refunded'):
+        payload = json.dumps({
+            'id': event_id, 'object': 'event', 'type': event_type,
+            'data': {'object': {
+                'id': 'pi_1', 'object': 'payment_intent',
+                'latest_charge': 'ch_1',
+                'metadata': {'cart': '{}', 'save_info': '',
+                             'username': 'AnonymousUser'}}},
+        })
+        timestamp = int(time.time())
+        signature = hmac.new(
+            WH_SECRET.encode(), f'{timestamp}.{payload}'.encode(),
+            hashlib.sha256).hexdigest()
+        return self.client.post(
+            reverse('checkout:webhook'), payload,
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}')
+
+    def test_events_are_queued_once(self):
+        response = self.post_event('evt_1')
+        self.assertContains(response, 'charge.refunded | queued')
+        response = self.post_event('evt_1')
+        self.assertContains(response, 'already received')
+
+        webhook_event = WebhookEvent.objects.get()
+        self.assertEqual(webhook_event.event_id, 'evt_1')
+        self.assertEqual(webhook_event.status, WebhookEvent.PENDING)
+        self.assertEqual(json.loads(webhook_event.payload)['type'],
+                         'charge.refunded')
+        self.assertEqual(webhook_event.payment_intent, '')
+
+    def test_payment_intent_of_event_is_recorded(self):
+        self.post_event('evt_1', 'payment_intent.succeeded')
+        webhook_event = WebhookEvent.objects.get()
+        self.assertEqual(webhook_event.payment_intent, 'pi_1')
+
+    def test_invalid_signature_is_rejected(self):
+        response = self.client.post(
+            reverse('checkout:webhook'), '{}',
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE='t=1,v1=x')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_command_processes_due_events(self):
+        self.post_event('evt_1')
+        self.post_event('evt_2')
+        out = StringIO()
+        call_command('process_webhooks', '--once', stdout=out)
+        self.assertIn('Processed 2 events, 0 failed', out.getvalue())
+
+        for webhook_event in WebhookEvent.objects.all():
+            self.assertEqual(webhook_event.status, WebhookEvent.PROCESSED)
+            self.assertEqual(webhook_event.attempts, 1)
+            self.assertIsNotNone(webhook_event.processed_on)
+        self.assertEqual(process_due_events(), (0, 0))
+
+    @patch('stripe.Charge.retrieve',
+           side_effect=stripe.error.APIConnectionError('Stripe is down'))
+    def test_failed_events_are_retried_with_backoff(self, retrieve):
+        self.post_event('evt_1', 'payment_intent.succeeded')
+        self.assertEqual(process_due_events(), (0, 1))
+
+        webhook_event = WebhookEvent.objects.get()
+        self.assertEqual(webhook_event.status, WebhookEvent.PENDING)
+        self.assertEqual(webhook_event.attempts, 1)
+        self.assertIn('Stripe is down', webhook_event.last_error)
+        self.assertGreater(webhook_event.next_attempt_on,
+                           timezone.now() + timedelta(seconds=20))
+        # Not due again before the backoff
+        self.assertEqual(process_due_events(), (0, 0))
+
+        for attempt in range(2, WebhookEvent.MAX_ATTEMPTS + 1):
+            WebhookEvent.objects.update(next_attempt_on=timezone.now())
+            self.assertEqual(process_due_events(), (0, 1))
+        webhook_event.refresh_from_db()
+        self.assertEqual(webhook_event.status, WebhookEvent.FAILED)
+        self.assertEqual(webhook_event.attempts,
+                         WebhookEvent.MAX_ATTEMPTS)
+
+    def test_event_is_claimed_by_one_worker(self):
+        self.post_event('evt_1')
+        first = WebhookEvent.objects.get()
+        second = WebhookEvent.objects.get()
+        self.assertTrue(first.claim())
+        self.assertFalse(second.claim())
+        # The claimed event is not due until the claim expires
+        self.assertEqual(process_due_events(), (0, 0))
@@ -8,17 +8,19 @@ from django.shortcuts import (
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.conf import settings
+from django.db import IntegrityError
 
 from .forms import OrderForm
-from .models import Order, OrderLineItem
+from .models import Order
+from .payments import forget_payment_intent, get_client_secret
+from .services import create_order
 
-from products.models import Product
 from profiles.models import UserProfile
 from profiles.forms import UserProfileForm
-from cart.contexts import cart_contents
+from cart.contexts import get_cart_contents
+from cart.stores import get_cart_store
 
 import stripe
-import json
 
 
 @require_POST
@@ -36,6 +38,12 @@ def cache_checkout_data(request):
     an error occurs
     """
 
+    # Check the cart against the catalog before the card is charged. The
+    # checkout page reloads on an error and sends the customer to the
+    # cart to review the changes, so the payment is never confirmed.
+    if get_cart_contents(request)['cart_changes']:
+        return HttpResponse(status=409)
+
     try:
         # Get the payment intent ID from the POST data
         pid = request.POST.get('client_secret').split('_secret')[0]
@@ -45,7 +53,7 @@ def cache_checkout_data(request):
 
         # Modify the payment intent with the given ID and add metadata to it
         stripe.PaymentIntent.modify(pid, metadata={
-            'cart': json.dumps(request.session.get('cart', {})),
+            'cart': get_cart_store(request).load().dumps(),
             'save_info': request.POST.get('save_info'),
             'username': request.user,
         })
@@ -62,19 +70,36 @@ Please try again later.')
         return HttpResponse(content=e, status=400)
 
 
+def cart_changed(request):
+    """
+    Redirect to the cart page, which shows what changed in the cart
+    """
+    messages.error(request, "Some items in your cart have changed since \
+you added them. Please review your cart before checking out.")
+    return redirect(reverse('cart:view_cart'))
+
+
 def checkout(request):
     """
     Render the checkout page, handle the form submission and process
     the payment using Stripe.
     """
 
-    # Get the Stripe API keys from settings
+    # Get the Stripe public key from settings
     stripe_public_key = settings.STRIPE_PUBLIC_KEY
-    stripe_secret_key = settings.STRIPE_SECRET_KEY
 
     if request.method == 'POST':
-        # Get the cart data from the session
-        cart = request.session.get('cart', {})
+        # Get the cart from the configured cart store
+        cart = get_cart_store(request).load()
+
+        # The card was already charged when the form is submitted, so the
+        # order is recorded even if the cart changed during the payment.
+        # Lines of products that no longer exist are left out.
+        changes = get_cart_contents(request)['cart_changes']
+        if changes.missing:
+            cart = cart.copy()
+            for product_id, size in changes.missing:
+                cart.set(product_id, 0, size)
 
         # Get the data submitted in the form
         form_data = {
@@ -101,42 +126,27 @@ def checkout(request):
             order.stripe_pid = pid
 
             # Save the original cart data in the order object
-            order.original_cart = json.dumps(cart)
-
-            # Save the order object to the database
-            order.save()
-
-            # Create order line items for each product in the cart
-            for item_id, item_data in cart.items():
-                try:
-                    # Get the product object for the current item
-                    product = Product.objects.get(id=item_id)
-
-                    # Create an order line item object for the current item
-                    if isinstance(item_data, int):
-                        order_line_item = OrderLineItem(
-                            order=order,
-                            product=product,
-                            quantity=item_data,
-                        )
-                        order_line_item.save()
-                    else:
-                        for size, quantity in item_data['items_by_size'] \
-                                                                .items():
-                            order_line_item = OrderLineItem(
-                                order=order,
-                                product=product,
-                                quantity=quantity,
-                                product_size=size,
-                            )
-                            order_line_item.save()
-                except Product.DoesNotExist:
-                    # If the product no longer exists, delete the order and
-                    # redirect to the cart page
-                    messages.error(request, "One of the products in your cart \
-wasn't found in our database. Please call us for assistance!")
-                    order.delete()
-                    return redirect(reverse('cart:view_cart'))
+            order.original_cart = cart.dumps()
+
+            # Save the order and a line item for each product in the
+            # cart in one transaction. The products were fetched and
+            # checked with the cart above.
+            pricing = get_cart_contents(request)['pricing']
+            try:
+                create_order(order, cart, {line.item_id: line.product
+                                           for line in pricing.lines})
+            except IntegrityError:
+                # The order of this payment was already saved, by the
+                # webhook or a repeated submission of the form
+                order = Order.objects.get(stripe_pid=pid)
+            # The payment intent paid for this order, the next checkout
+            # needs a new one
+            forget_payment_intent(request)
+
+            # Tell the customer about the changes made during the payment
+            if changes:
+                messages.warning(request, "Some items in your cart changed \
+while your payment was processed. We will contact you about your order.")
 
             # Save the info to the user's profile if all is well
             request.session['save_info'] = 'save-info' in request.POST
@@ -150,7 +160,7 @@ Please double check your information.')
     else:
         # If the request is not a POST request, render the checkout page
         # with the form and payment intent
-        cart = request.session.get('cart', {})
+        cart = get_cart_store(request).load()
         if not cart:
             # If there are no items in the cart, display an error message
             # and redirect to the product list page
@@ -158,15 +168,10 @@ Please double check your information.')
                 request, "There's nothing in your cart at the moment")
             return redirect(reverse('products:product_list'))
 
-        # Calculate total and create stripe payment intent
-        current_cart = cart_contents(request)
-        total = current_cart['grand_total']
-        stripe_total = round(total * 100)
-        stripe.api_key = stripe_secret_key
-        intent = stripe.PaymentIntent.create(
-            amount=stripe_total,
-            currency=settings.STRIPE_CURRENCY,
-        )
+        # Send the customer back to the cart if it changed since the
+        # products were added, before a payment can be made
+        if get_cart_contents(request)['cart_changes']:
+            return cart_changed(request)
 
         # Attempt to prefill the form with any info the user maintains in
         # their profile
@@ -190,6 +195,11 @@ Please double check your information.')
         # if the user is not authenticated, create a new order form.
         else:
             order_form = OrderForm()
+    # Get the stripe payment intent of the cart, reused from the session
+    # unless the cart changed. The cart pricing is memoized, so the page
+    # reuses it for the cart totals.
+    client_secret = get_client_secret(request)
+
     # if the Stripe public key is missing, show a warning message
     if not stripe_public_key:
         messages.warning(request, 'Stripe public key is missing. \
@@ -202,7 +212,7 @@ Did you forget to set it in your environment?')
     context = {
         'order_form': order_form,
         'stripe_public_key': stripe_public_key,
-        'client_secret': intent.client_secret,
+        'client_secret': client_secret,
     }
 
     return render(request, template, context)
@@ -252,9 +262,8 @@ def checkout_success(request, order_number):
 Your order number is {order_number}. A confirmation \
 email will be sent to {order.email}.')
 
-    # If the user had a cart in the session, delete it
-    if 'cart' in request.session:
-        del request.session['cart']
+    # Empty the user's cart
+    get_cart_store(request).clear()
 
     # Render the checkout_success.html template with the order object
     # as the context variable
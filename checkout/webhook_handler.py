@@ -2,14 +2,15 @@ from django.http import HttpResponse
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
+from django.db import IntegrityError
 
-from .models import Order, OrderLineItem
-from products.models import Product
+from .models import Order
+from .services import create_order
+from cart.cart import Cart
 from profiles.models import UserProfile
 
 import stripe
 import json
-import time
 
 
 class StripeWH_Handler:
@@ -60,7 +61,6 @@ class StripeWH_Handler:
 
         billing_details = stripe_charge.billing_details  # updated
         shipping_details = intent.shipping
-        grand_total = round(stripe_charge.amount / 100, 2)  # updated
 
         # Clean data in the shipping details
         for field, value in shipping_details.address.items():
@@ -84,39 +84,18 @@ class StripeWH_Handler:
                 profile.default_country = shipping_details.address.country
                 profile.save()
 
-        order_exists = False
-        attempt = 1
-        while attempt <= 5:
+        # Match the order on its payment intent id alone. It is usually
+        # saved by the checkout view already, otherwise it is created
+        # here. The unique stripe_pid makes this idempotent: if the view
+        # saves the same order meanwhile, the insert below waits at most
+        # for the view's transaction and then fails, and that order is
+        # used instead.
+        order = Order.objects.filter(stripe_pid=pid).first()
+        if order is None:
             try:
-                order = Order.objects.get(
-                    full_name__iexact=shipping_details.name,
-                    email__iexact=billing_details.email,
-                    phone_number__iexact=shipping_details.phone,
-                    country__iexact=shipping_details.address.country,
-                    postcode__iexact=shipping_details.address.postal_code,
-                    town_or_city__iexact=shipping_details.address.city,
-                    street_address1__iexact=shipping_details.address.line1,
-                    street_address2__iexact=shipping_details.address.line2,
-                    county__iexact=shipping_details.address.state,
-                    grand_total=grand_total,
-                    original_cart=cart,
-                    stripe_pid=pid,
-                )
-                order_exists = True
-                break
-            except Order.DoesNotExist:
-                attempt += 1
-                time.sleep(1)
-        if order_exists:
-            self._send_confirmation_email(order)
-            return HttpResponse(
-                content=f'Webhook received: {event["type"]} | SUCCESS: \
-Verified order already in database',
-                status=200)
-        else:
-            order = None
-            try:
-                order = Order.objects.create(
+                # Save the order and its line items in one transaction,
+                # so nothing is left behind if a product is missing
+                order = create_order(Order(
                     full_name=shipping_details.name,
                     user_profile=profile,
                     email=billing_details.email,
@@ -129,35 +108,23 @@ Verified order already in database',
                     county=shipping_details.address.state,
                     original_cart=cart,
                     stripe_pid=pid,
-                )
-                for item_id, item_data in json.loads(cart).items():
-                    product = Product.objects.get(id=item_id)
-                    if isinstance(item_data, int):
-                        order_line_item = OrderLineItem(
-                            order=order,
-                            product=product,
-                            quantity=item_data,
-                        )
-                        order_line_item.save()
-                    else:
-                        for size, quantity in item_data['items_by_size'].items():
-                            order_line_item = OrderLineItem(
-                                order=order,
-                                product=product,
-                                quantity=quantity,
-                                product_size=size,
-                            )
-                            order_line_item.save()
+                ), Cart.decode(json.loads(cart)))
+            except IntegrityError:
+                order = Order.objects.get(stripe_pid=pid)
             except Exception as e:
-                if order:
-                    order.delete()
                 return HttpResponse(
                     content=f'Webhook received: {event["type"]} | ERROR: {e}',
                     status=500)
+            else:
+                self._send_confirmation_email(order)
+                return HttpResponse(
+                    content=f'Webhook received: {event["type"]} | SUCCESS: \
+Created order in webhook',
+                    status=200)
         self._send_confirmation_email(order)
         return HttpResponse(
             content=f'Webhook received: {event["type"]} | SUCCESS: \
-Created order in webhook',
+Verified order already in database',
             status=200)
 
     def handle_payment_intent_payment_failed(self, event):
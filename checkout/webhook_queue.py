@@ -0,0 +1,96 @@
+"""
+Durable queue of Stripe webhook events.
+
+The webhook view only verifies the signature and stores the event, once
+per Stripe event id, and answers Stripe right away. The events are
+handled by the process_webhooks command, which claims and retries them
+as described in hand_crafted/queue.py.
+"""
+import json
+
+from django.conf import settings
+from django.utils import timezone
+
+import stripe
+
+from .models import WebhookEvent
+from .webhook_handler import StripeWH_Handler
+
+
+def enqueue_event(event, payload):
+    """
+    Store a verified event with its raw payload unless it was already
+    received. Return the WebhookEvent and whether it was created.
+    """
+    if event['type'].startswith('payment_intent.'):
+        payment_intent = event['data']['object']['id']
+    else:
+        payment_intent = ''
+    return WebhookEvent.objects.get_or_create(
+        event_id=event['id'],
+        defaults={
+            'event_type': event['type'],
+            'payment_intent': payment_intent,
+            'payload': payload,
+        })
+
+
+def handle_event(event):
+    """ Run the handler of a Stripe event and return its response """
+    handler = StripeWH_Handler(None)
+
+    # Map webhook events to relevant handler functions
+    event_map = {
+        'payment_intent.succeeded': handler.handle_payment_intent_succeeded,
+        'payment_intent.payment_failed': handler.
+        handle_payment_intent_payment_failed,
+    }
+    # Use the generic handler by default
+    event_handler = event_map.get(event['type'], handler.handle_event)
+    return event_handler(event)
+
+
+def process_event(webhook_event):
+    """
+    Handle a claimed event and record the outcome: processed, retried
+    later or failed. Return True when processed.
+    """
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    try:
+        event = stripe.Event.construct_from(
+            json.loads(webhook_event.payload), stripe.api_key)
+        response = handle_event(event)
+        if response.status_code >= 400:
+            error = response.content.decode(errors='replace')
+        else:
+            error = None
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+
+    if error is not None:
+        webhook_event.record_failure(error)
+        return False
+    webhook_event.status = WebhookEvent.PROCESSED
+    webhook_event.processed_on = timezone.now()
+    webhook_event.last_error = ''
+    webhook_event.save(
+        update_fields=['status', 'processed_on', 'last_error'])
+    return True
+
+
+def process_due_events(limit=100):
+    """
+    Handle up to ``limit`` due events, oldest first. Return the number
+    of events processed and failed (including those retried later).
+    """
+    processed = failed = 0
+    for webhook_event in WebhookEvent.due(limit):
+        # Claimed one at a time, so the claim doesn't expire while
+        # the events before it are handled
+        if not webhook_event.claim():
+            continue
+        if process_event(webhook_event):
+            processed += 1
+        else:
+            failed += 1
+    return processed, failed
@@ -3,7 +3,7 @@ from django.http import HttpResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 
-from checkout.webhook_handler import StripeWH_Handler
+from checkout.webhook_queue import enqueue_event
 
 import stripe
 
@@ -11,7 +11,7 @@ import stripe
 @require_POST
 @csrf_exempt
 def webhook(request):
-    """Listen for webhooks from Stripe"""
+    """Listen for webhooks from Stripe and queue them"""
     # Setup
     stripe.api_key = settings.STRIPE_SECRET_KEY
     wh_secret = settings.STRIPE_WH_SECRET
@@ -34,23 +34,11 @@ def webhook(request):
     except Exception as e:
         return HttpResponse(content=e, status=400)
 
-    # Set up a webhook handler
-    handler = StripeWH_Handler(request)
-
-    # Map webhook events to relevant handler functions
-    event_map = {
-        'payment_intent.succeeded': handler.handle_payment_intent_succeeded,
-        'payment_intent.payment_failed': handler.
-        handle_payment_intent_payment_failed,
-    }
-
-    # Get the webhook type from Stripe
-    event_type = event['type']
-
-    # If there's a handler for it, get it from the event map
-    # Use the generic one by default
-    event_handler = event_map.get(event_type, handler.handle_event)
-
-    # Call the event handler with the event
-    response = event_handler(event)
-    return response
+    # Store the event, once per event id, and acknowledge it right away.
+    # It is handled by the process_webhooks command.
+    webhook_event, created = enqueue_event(
+        event, payload.decode('utf-8'))
+    status = 'queued' if created else 'already received'
+    return HttpResponse(
+        content=f'Webhook received: {event["type"]} | {status}',
+        status=200)
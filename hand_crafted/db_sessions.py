@@ -0,0 +1,17 @@
+"""
+Database session engine for deployments without a shared Memcached.
+
+Sessions are read from and written to the database like with Django's db
+engine, skipping writes that would not change them as
+``hand_crafted.sessions`` does.
+"""
+from django.contrib.sessions.backends import db
+
+from .sessions import SkipUnchangedMixin
+
+
+class SessionStore(SkipUnchangedMixin, db.SessionStore):
+    """
+    Database backed sessions that are only written when their data
+    changed
+    """
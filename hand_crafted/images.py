@@ -0,0 +1,183 @@
+"""
+Responsive image derivatives.
+
+When a product or blog image is uploaded, fixed-width WebP and JPEG
+copies are generated with Pillow and stored next to the original through
+the configured file storage. The names of the generated files are kept
+in a JSON field on the model and turned into ``srcset`` attributes by the
+``responsive_image`` template tag.
+
+Uploading an image only marks the instance as pending; the copies are
+generated by the ``generate_image_derivatives`` worker, so the work
+neither slows down the request nor gets lost when a web worker is
+recycled. With IMAGE_DERIVATIVES_INLINE they are generated right after
+the upload commits instead (e.g. in development).
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Derivative names and their widths in pixels
+DERIVATIVE_WIDTHS = {
+    'thumb': 160,
+    'card': 480,
+    'detail': 1200,
+}
+# File extension, Pillow format and mime type of each derivative format
+DERIVATIVE_FORMATS = (
+    ('webp', 'WEBP', 'image/webp'),
+    ('jpg', 'JPEG', 'image/jpeg'),
+)
+QUALITY = 80
+# Models with image derivatives: model label, image field, derivatives
+# field and the flag marking derivatives as waiting to be generated
+IMAGE_MODELS = (
+    ('products.Product', 'image', 'image_derivatives',
+     'image_derivatives_pending'),
+    ('blog.Post', 'featured_image', 'featured_image_derivatives',
+     'featured_image_derivatives_pending'),
+)
+
+
+def derivative_name(name, size, extension):
+    """ Name of a derivative, stored next to the original image """
+    base, _ = os.path.splitext(name)
+    return f'{base}_{size}.{extension}'
+
+
+def _resize(image, width):
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def generate_derivatives(field_file):
+    """
+    Generate the derivatives of an image and save them with the file's
+    storage. Images are never scaled up: sizes wider than the original
+    are generated at the original width.
+
+    Returns a dict of the form
+    {'source': name, 'card': {'width': 480, 'webp': name, 'jpg': name}}
+    """
+    storage = field_file.storage
+    field_file.open('rb')
+    try:
+        image = Image.open(field_file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    finally:
+        field_file.close()
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    derivatives = {'source': field_file.name}
+    for size, width in DERIVATIVE_WIDTHS.items():
+        width = min(width, image.width)
+        resized = _resize(image, width) if width < image.width else image
+        derivative = {'width': width}
+        for extension, image_format, _ in DERIVATIVE_FORMATS:
+            output = resized
+            if image_format == 'JPEG' and output.mode != 'RGB':
+                output = output.convert('RGB')
+            buffer = BytesIO()
+            output.save(buffer, image_format, quality=QUALITY)
+            name = derivative_name(field_file.name, size, extension)
+            if storage.exists(name):
+                storage.delete(name)
+            derivative[extension] = storage.save(
+                name, ContentFile(buffer.getvalue()))
+        derivatives[size] = derivative
+    return derivatives
+
+
+def update_derivatives(model_label, pk, image_field, derivatives_field,
+                       pending_field):
+    """
+    Generate the derivatives of an instance's image and store their names
+    on the instance, unless the image changed in the meantime. Returns
+    True when they were stored, False when they couldn't be generated
+    and None when there was nothing to do.
+    """
+    model = apps.get_model(model_label)
+    try:
+        instance = model.objects.get(pk=pk)
+        field_file = getattr(instance, image_field)
+        if not field_file:
+            model.objects.filter(pk=pk).update(**{pending_field: False})
+            return None
+        derivatives = generate_derivatives(field_file)
+        instance.refresh_from_db(fields=[image_field])
+        if getattr(instance, image_field).name != derivatives['source']:
+            # Replaced meanwhile, the new image is still pending
+            return None
+        setattr(instance, derivatives_field, derivatives)
+        setattr(instance, pending_field, False)
+        instance.save(
+            update_fields=[derivatives_field, pending_field, 'updated_on'])
+        return True
+    except model.DoesNotExist:
+        return None
+    except Exception:
+        logger.exception('Could not generate image derivatives for %s %s',
+                         model_label, pk)
+        # Don't retry an unreadable image forever, a new upload marks
+        # it as pending again
+        model.objects.filter(pk=pk).update(**{pending_field: False})
+        return False
+
+
+def generate_pending_derivatives(limit=20):
+    """
+    Generate the derivatives of up to ``limit`` pending instances of
+    each model. Returns the number of images generated and failed.
+    """
+    generated = failed = 0
+    for model_label, *fields in IMAGE_MODELS:
+        pending_field = fields[-1]
+        model = apps.get_model(model_label)
+        pks = list(model.objects.filter(**{pending_field: True}).order_by(
+            'pk').values_list('pk', flat=True)[:limit])
+        for pk in pks:
+            stored = update_derivatives(model_label, pk, *fields)
+            if stored:
+                generated += 1
+            elif stored is not None:
+                failed += 1
+    return generated, failed
+
+
+def schedule_derivatives(instance, image_field, derivatives_field,
+                         pending_field):
+    """
+    Mark a saved instance whose image changed as pending, for the
+    generate_image_derivatives worker. With IMAGE_DERIVATIVES_INLINE
+    the derivatives are generated once the transaction commits instead.
+    """
+    field_file = getattr(instance, image_field)
+    derivatives = getattr(instance, derivatives_field) or {}
+    if not field_file:
+        if derivatives or getattr(instance, pending_field):
+            # The image was removed, forget its derivatives
+            type(instance).objects.filter(pk=instance.pk).update(
+                **{derivatives_field: {}, pending_field: False})
+        return
+    if derivatives.get('source') == field_file.name:
+        return
+
+    type(instance).objects.filter(pk=instance.pk).update(
+        **{pending_field: True})
+    setattr(instance, pending_field, True)
+
+    if settings.IMAGE_DERIVATIVES_INLINE:
+        args = (instance._meta.label, instance.pk, image_field,
+                derivatives_field, pending_field)
+        transaction.on_commit(lambda: update_derivatives(*args))
@@ -0,0 +1,221 @@
+import datetime
+import json
+from decimal import Decimal
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import QueryDict
+
+
+class CursorSerializer:
+    """
+    Compact JSON serializer for signed cursor tokens
+    """
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':')).encode('latin-1')
+
+    def loads(self, data):
+        return json.loads(data.decode('latin-1'))
+
+
+def _encode_value(value):
+    """
+    Convert a sort key value into something JSON can carry without
+    losing precision (microseconds, decimal places)
+    """
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class KeysetPage:
+    """
+    A single page of a KeysetPaginator.
+    Iterable like django.core.paginator.Page, but navigated with opaque
+    next/previous cursors instead of page numbers.
+    """
+    def __init__(self, object_list, paginator, has_next, has_previous,
+                 query=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.query = query
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __repr__(self):
+        return f'<KeysetPage of {len(self)} items>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        """ Opaque token for the page after this one """
+        if not self._has_next:
+            return None
+        return self.paginator.make_cursor(self.object_list[-1], 'next')
+
+    @property
+    def previous_cursor(self):
+        """ Opaque token for the page before this one """
+        if not self._has_previous:
+            return None
+        return self.paginator.make_cursor(self.object_list[0], 'previous')
+
+    def _querystring(self, cursor):
+        """
+        Return the current query string with the cursor replaced, so
+        sorting, search and category parameters survive page changes
+        """
+        if self.query is not None:
+            query = self.query.copy()
+        else:
+            query = QueryDict(mutable=True)
+        query.pop('page', None)
+        query[self.paginator.cursor_param] = cursor
+        return query.urlencode()
+
+    @property
+    def next_query(self):
+        if not self._has_next:
+            return ''
+        return self._querystring(self.next_cursor)
+
+    @property
+    def previous_query(self):
+        if not self._has_previous:
+            return ''
+        return self._querystring(self.previous_cursor)
+
+
+class KeysetPaginator:
+    """
+    Cursor (keyset) paginator.
+
+    Pages are fetched with a WHERE clause on the sort key of the last
+    row seen instead of OFFSET, and no COUNT(*) query is run, so every
+    page costs the same however deep it is. The ordering always ends
+    with the primary key as a stable tie-breaker.
+
+    Sort keys must be non-null; annotate with Coalesce where needed.
+    Cursors carry the ordering they were made for and are ignored under
+    any other ordering.
+    """
+    cursor_param = 'cursor'
+    salt = 'hand_crafted.pagination'
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.per_page = int(per_page)
+        if ordering is None:
+            ordering = (queryset.query.order_by or
+                        queryset.model._meta.ordering or [])
+        ordering = [field for field in ordering if isinstance(field, str)]
+        keys = [field.lstrip('-') for field in ordering]
+        if 'pk' not in keys and 'id' not in keys:
+            descending = bool(ordering) and ordering[0].startswith('-')
+            ordering.append('-pk' if descending else 'pk')
+        self.ordering = ordering
+        self.queryset = queryset.order_by(*ordering)
+
+    def _fields(self):
+        """ Yield (field name, descending) pairs for the ordering """
+        for field in self.ordering:
+            yield field.lstrip('-'), field.startswith('-')
+
+    def _values(self, obj):
+        values = []
+        for name, _ in self._fields():
+            value = obj
+            for attr in name.split('__'):
+                value = getattr(value, attr)
+            values.append(_encode_value(value))
+        return values
+
+    def make_cursor(self, obj, direction):
+        """ Build an opaque token pointing just past ``obj`` """
+        return signing.dumps(
+            {'d': direction[0], 'o': ','.join(self.ordering),
+             'v': self._values(obj)},
+            salt=self.salt, serializer=CursorSerializer, compress=True)
+
+    def _decode_cursor(self, cursor):
+        try:
+            data = signing.loads(
+                cursor, salt=self.salt, serializer=CursorSerializer)
+            direction, ordering, values = data['d'], data['o'], data['v']
+        except (signing.BadSignature, ValueError, KeyError, TypeError):
+            return None, None
+        if direction not in ('n', 'p') or len(values) != len(self.ordering):
+            return None, None
+        # A cursor made for another sort order points nowhere in this one
+        if ordering != ','.join(self.ordering):
+            return None, None
+        return direction, values
+
+    def _seek(self, values, backwards):
+        """
+        Build (a > x) OR (a = x AND b > y) OR ... for the sort keys,
+        flipping each comparison for descending fields and when paging
+        backwards
+        """
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self._fields(), values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_page(self, cursor=None, query=None):
+        """
+        Return the page for ``cursor``, falling back to the first page
+        when the cursor is missing or invalid. ``query`` is the request's
+        QueryDict, used to build the next/previous links.
+        """
+        direction, values = (None, None)
+        if cursor:
+            direction, values = self._decode_cursor(cursor)
+
+        if direction is not None:
+            backwards = direction == 'p'
+            try:
+                queryset = self.queryset.filter(self._seek(values, backwards))
+                if backwards:
+                    queryset = queryset.reverse()
+                rows = list(queryset[:self.per_page + 1])
+            except (ValidationError, ValueError, TypeError):
+                # Values that don't fit the sort fields, e.g. a cursor
+                # signed before a field changed type
+                direction = None
+
+        if direction is None:
+            rows = list(self.queryset[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            return KeysetPage(rows[:self.per_page], self, has_next, False,
+                              query)
+
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            return KeysetPage(rows, self, True, has_more, query)
+        return KeysetPage(rows, self, has_more, True, query)
@@ -0,0 +1,162 @@
+"""
+Durable work queues kept in database tables.
+
+The Stripe webhook events and the outbox emails are rows of a
+``QueueItem`` model, drained by a ``QueueCommand`` worker which retries
+failed items with an exponential backoff and gives them up as failed
+after MAX_ATTEMPTS.
+
+A worker claims an item by moving its next attempt past the claim
+timeout with a conditional UPDATE, so several workers can drain the
+queue without handling an item twice. A worker that dies leaves the
+item to be claimed again once the claim expires.
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+
+class QueueItem(models.Model):
+    """
+    Abstract base of the rows of a queue. Subclasses declare a
+    ``status`` field, with WAITING as the status of the items still to
+    be attempted and FAILED as the one of the items given up on, and
+    tune the retry policy.
+    """
+    WAITING = 'pending'
+    FAILED = 'failed'
+    # Attempts before an item is given up as failed
+    MAX_ATTEMPTS = 5
+    # Delay before the first retry, doubled on every further attempt
+    RETRY_BACKOFF = timedelta(minutes=1)
+    MAX_RETRY_BACKOFF = timedelta(hours=1)
+    # Time a worker has to handle a claimed item
+    CLAIM_TIMEOUT = timedelta(minutes=5)
+
+    attempts = models.PositiveIntegerField(default=0)
+    # When the item may be (re)tried, or the end of the current claim
+    next_attempt_on = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def retry_delay(cls, attempts):
+        """ Return the delay before the next attempt of a failed item """
+        return min(cls.RETRY_BACKOFF * 2 ** (attempts - 1),
+                   cls.MAX_RETRY_BACKOFF)
+
+    @classmethod
+    def due(cls, limit):
+        """ Return up to ``limit`` items due for an attempt, oldest first """
+        return cls.objects.filter(
+            status=cls.WAITING, next_attempt_on__lte=timezone.now(),
+        ).order_by('next_attempt_on', 'id')[:limit]
+
+    @classmethod
+    def claim_due(cls, limit):
+        """ Claim up to ``limit`` due items and return them """
+        return [item for item in cls.due(limit) if item.claim()]
+
+    @classmethod
+    def retry_failed(cls):
+        """ Queue the items given up as failed again, return their number """
+        return cls.objects.filter(status=cls.FAILED).update(
+            status=cls.WAITING, attempts=0, next_attempt_on=timezone.now())
+
+    def claim(self):
+        """ Claim a due item for this worker, False if another one did """
+        claimed = type(self).objects.filter(
+            pk=self.pk, status=self.WAITING, attempts=self.attempts,
+        ).update(
+            attempts=F('attempts') + 1,
+            next_attempt_on=timezone.now() + self.CLAIM_TIMEOUT)
+        self.attempts += 1
+        return bool(claimed)
+
+    def record_failure(self, error):
+        """
+        Record a failed attempt of a claimed item: retried later, or
+        failed after MAX_ATTEMPTS
+        """
+        self.last_error = error
+        if self.attempts >= self.MAX_ATTEMPTS:
+            self.status = self.FAILED
+        else:
+            self.next_attempt_on = timezone.now() + self.retry_delay(
+                self.attempts)
+        self.save(update_fields=['status', 'last_error', 'next_attempt_on'])
+
+
+def run_worker(process_batch, once=False, interval=2):
+    """
+    Call ``process_batch`` until it finds nothing to do, then wait
+    ``interval`` seconds and poll again, or return with ``once``.
+    ``process_batch`` returns a tuple of counts, e.g. (done, failed),
+    and the totals are returned.
+    """
+    totals = None
+    while True:
+        counts = process_batch()
+        if totals is None:
+            totals = counts
+        else:
+            totals = tuple(map(sum, zip(totals, counts)))
+        if any(counts):
+            continue
+        if once:
+            return totals
+        time.sleep(interval)
+
+
+class QueueCommand(BaseCommand):
+    """
+    Base of the commands draining a queue.
+
+    Runs as a worker polling for due items until stopped, or drains the
+    due items and exits with --once (e.g. from a scheduler). The items
+    given up as failed can be queued again with --retry-failed.
+    """
+    # The QueueItem model drained, and the name of its items
+    model = None
+    noun = 'items'
+    # Defaults of --batch-size and --interval
+    batch_size = 100
+    interval = 2
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help=f'Handle the due {self.noun} and exit')
+        parser.add_argument(
+            '--batch-size', type=int, default=self.batch_size,
+            help=f'Number of {self.noun} to claim per batch')
+        parser.add_argument(
+            '--interval', type=float, default=self.interval,
+            help=f'Seconds to wait when no {self.noun} are due')
+        parser.add_argument(
+            '--retry-failed', action='store_true',
+            help=f'Queue the {self.noun} given up as failed again first')
+
+    def process_batch(self, limit):
+        """ Handle up to ``limit`` due items, return (done, failed) """
+        raise NotImplementedError
+
+    def report(self, done, failed):
+        """ Return the summary line written when the command exits """
+        return f'Handled {done} {self.noun}, {failed} failed'
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            retried = self.model.retry_failed()
+            self.stdout.write(f'Queued {retried} failed {self.noun} again')
+
+        done, failed = run_worker(
+            lambda: self.process_batch(options['batch_size']),
+            once=options['once'], interval=options['interval'])
+        self.stdout.write(self.style.SUCCESS(self.report(done, failed)))
@@ -0,0 +1,97 @@
+"""
+Session engine and serializer.
+
+``SessionStore`` is Django's cached_db engine: sessions are read from the
+cache and written through to the database. On top of it, saving a
+session whose data did not change since it was loaded is skipped, so
+reassigning an unchanged value (e.g. the same cart) costs no write.
+The cache must be shared by every process, or a session changed by one
+worker is read back stale by the others. ``hand_crafted.db_sessions``
+skips unchanged writes the same way without the cache.
+
+``CompactJSONSerializer`` replaces the long, well-known session keys and
+authentication backend paths with short aliases before encoding.
+
+Enable both with::
+
+    SESSION_ENGINE = 'hand_crafted.sessions'
+    SESSION_SERIALIZER = 'hand_crafted.sessions.CompactJSONSerializer'
+"""
+import json
+
+from django.contrib.sessions.backends import cached_db
+
+# Session keys stored under a short alias
+KEY_ALIASES = {
+    '_auth_user_id': '~u',
+    '_auth_user_backend': '~b',
+    '_auth_user_hash': '~h',
+    '_session_expiry': '~e',
+}
+ALIASED_KEYS = {alias: key for key, alias in KEY_ALIASES.items()}
+
+# Authentication backends stored under a short alias
+BACKEND_ALIASES = {
+    'django.contrib.auth.backends.ModelBackend': '~m',
+    'allauth.account.auth_backends.AuthenticationBackend': '~a',
+}
+ALIASED_BACKENDS = {alias: path for path, alias in BACKEND_ALIASES.items()}
+
+
+class CompactJSONSerializer:
+    """
+    Compact JSON serializer for session data. Data written by Django's
+    JSONSerializer is read back unchanged.
+    """
+    def dumps(self, obj):
+        data = {KEY_ALIASES.get(key, key): value
+                for key, value in obj.items()}
+        backend = data.get('~b')
+        if backend in BACKEND_ALIASES:
+            data['~b'] = BACKEND_ALIASES[backend]
+        return json.dumps(data, separators=(',', ':')).encode('latin-1')
+
+    def loads(self, data):
+        obj = {ALIASED_KEYS.get(key, key): value
+               for key, value in json.loads(data.decode('latin-1')).items()}
+        backend = obj.get('_auth_user_backend')
+        if backend in ALIASED_BACKENDS:
+            obj['_auth_user_backend'] = ALIASED_BACKENDS[backend]
+        return obj
+
+
+class SkipUnchangedMixin:
+    """
+    Session store mixin only writing sessions whose data changed
+    """
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        # Serialized data as last loaded or saved
+        self._saved_state = None
+
+    def _state(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        data = super().load()
+        if self.session_key is not None:
+            self._saved_state = self._state(data)
+        return data
+
+    def save(self, must_create=False):
+        state = self._state(self._get_session(no_load=must_create))
+        if not must_create and state == self._saved_state:
+            return
+        super().save(must_create)
+        self._saved_state = state
+
+    def delete(self, session_key=None):
+        super().delete(session_key)
+        self._saved_state = None
+
+
+class SessionStore(SkipUnchangedMixin, cached_db.SessionStore):
+    """
+    Cached, database backed sessions that are only written when their
+    data changed
+    """
@@ -52,6 +52,7 @@ INSTALLED_APPS = [
     'checkout.apps.CheckoutConfig',
     'profiles.apps.ProfilesConfig',
     'blog.apps.BlogConfig',
+    'outbox.apps.OutboxConfig',
 
     # 3rd party
     'allauth',
@@ -108,7 +109,19 @@ TEMPLATES = [
     },
 ]
 
-MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
+# Messages travel in a signed cookie and only overflow into the session,
+# so showing a message does not cost a session write
+MESSAGE_STORAGE = 'django.contrib.messages.storage.fallback.FallbackStorage'
+
+# Sessions are written to the database, skipping writes that would not
+# change them. They are only read from the cache when it is Memcached:
+# reading them from the database cache table would not save anything.
+if 'MEMCACHED_LOCATION' in os.environ:
+    SESSION_ENGINE = 'hand_crafted.sessions'
+else:
+    SESSION_ENGINE = 'hand_crafted.db_sessions'
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', SESSION_ENGINE)
+SESSION_SERIALIZER = 'hand_crafted.sessions.CompactJSONSerializer'
 
 AUTHENTICATION_BACKENDS = [
     # Needed to login by username in Django admin, regardless of `allauth`
@@ -146,6 +159,36 @@ else:
         'default': dj_database_url.parse(os.environ.get('DATABASE_URL'))
     }
 
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+#
+# The page cache versions and cached carts must be seen by every process,
+# so deployments use a cache shared by all of them: Memcached when
+# MEMCACHED_LOCATION is set, otherwise the database cache table created
+# by `python manage.py createcachetable`.
+
+if 'DEVELOPMENT' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+elif 'MEMCACHED_LOCATION' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': os.environ['MEMCACHED_LOCATION'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -191,6 +234,17 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
+# Generate resized product and blog images right after the upload instead
+# of leaving them to the generate_image_derivatives worker
+IMAGE_DERIVATIVES_INLINE = False
+
+# Where carts are kept: SessionCartStore, DatabaseCartStore or
+# CacheCartStore from cart.stores
+CART_STORE = os.environ.get('CART_STORE', 'cart.stores.DatabaseCartStore')
+
+# Seconds anonymous product pages are kept in the page cache
+PAGE_CACHE_TIMEOUT = 60 * 10
+
 # Stripe
 
 FREE_DELIVERY_THRESHOLD = 60
@@ -206,9 +260,13 @@ STRIPE_WH_SECRET = os.environ.get('STRIPE_WH_SECRET', '')
 
 if 'DEVELOPMENT' in os.environ:
     EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+    OUTBOX_EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
     DEFAULT_FROM_EMAIL = 'handcrafteddesigns@store.com'
 else:
-    EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+    # Emails are queued in the outbox and delivered over SMTP by the
+    # send_queued_email command
+    EMAIL_BACKEND = 'outbox.backends.QueuedEmailBackend'
+    OUTBOX_EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
     EMAIL_USE_TLS = True
     EMAIL_PORT = 587
     EMAIL_HOST = 'smtp.gmail.com'
@@ -0,0 +1,155 @@
+import shutil
+import tempfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from blog.models import Post
+from products.models import Product
+
+from .images import generate_derivatives
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_image(width, height, name='photo.png'):
+    """ Create an uploaded PNG image of the given size """
+    buffer = BytesIO()
+    Image.new('RGBA', (width, height), (120, 80, 40, 255)).save(
+        buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type='image/png')
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage',
+    IMAGE_DERIVATIVES_INLINE=True)
+class ImageDerivativesTest(TestCase):
+    """
+    Test the responsive image derivatives
+    """
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def test_generate_derivatives(self):
+        name = default_storage.save('product_images/wide.png',
+                                    make_image(2000, 1000))
+        product = Product(name='Wide', price=Decimal('1.00'), image=name)
+        derivatives = generate_derivatives(product.image)
+        self.assertEqual(derivatives['source'], name)
+        for size, width in (('thumb', 160), ('card', 480),
+                            ('detail', 1200)):
+            self.assertEqual(derivatives[size]['width'], width)
+            with default_storage.open(derivatives[size]['webp']) as webp:
+                image = Image.open(webp)
+                self.assertEqual(image.format, 'WEBP')
+                self.assertEqual(image.size, (width, width // 2))
+            with default_storage.open(derivatives[size]['jpg']) as jpg:
+                self.assertEqual(Image.open(jpg).format, 'JPEG')
+
+    def test_small_images_are_not_scaled_up(self):
+        name = default_storage.save('product_images/small.png',
+                                    make_image(300, 300))
+        product = Product(name='Small', price=Decimal('1.00'), image=name)
+        derivatives = generate_derivatives(product.image)
+        self.assertEqual(derivatives['card']['width'], 300)
+        self.assertEqual(derivatives['detail']['width'], 300)
+
+    def test_product_upload_generates_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                name='Shadow Box', price=Decimal('10.00'),
+                image=make_image(1000, 800))
+        product.refresh_from_db()
+        self.assertEqual(product.image_derivatives['source'],
+                         product.image.name)
+
+        html = Template(
+            '{% load responsive_images %}'
+            "{% responsive_image product.image product.image_derivatives "
+            "'card' alt=product.name %}").render(
+            Context({'product': product}))
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('_card.webp 480w', html)
+        self.assertIn('_detail.jpg 1000w', html)
+        self.assertIn('loading="lazy"', html)
+
+        self.assertFalse(product.image_derivatives_pending)
+
+        # Saving without a new image does not regenerate anything
+        with self.captureOnCommitCallbacks() as callbacks:
+            product.save()
+        self.assertNotIn('schedule_derivatives.<locals>.<lambda>',
+                         [callback.__qualname__ for callback in callbacks])
+
+    def test_post_upload_generates_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(
+                title='Paper flowers', content='Content',
+                featured_image=make_image(600, 400))
+        post.refresh_from_db()
+        self.assertEqual(post.featured_image_derivatives['thumb']['width'],
+                         160)
+
+    @override_settings(IMAGE_DERIVATIVES_INLINE=False)
+    def test_upload_is_left_to_the_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                name='Shadow Box', price=Decimal('10.00'),
+                image=make_image(1000, 800))
+            post = Post.objects.create(
+                title='Paper flowers', content='Content',
+                featured_image=make_image(600, 400))
+        product.refresh_from_db()
+        self.assertTrue(product.image_derivatives_pending)
+        self.assertEqual(product.image_derivatives, {})
+
+        out = StringIO()
+        call_command('generate_image_derivatives', once=True, stdout=out)
+        self.assertIn('Generated 2 images, 0 failed', out.getvalue())
+        product.refresh_from_db()
+        post.refresh_from_db()
+        self.assertFalse(product.image_derivatives_pending)
+        self.assertEqual(product.image_derivatives['source'],
+                         product.image.name)
+        self.assertFalse(post.featured_image_derivatives_pending)
+        self.assertEqual(post.featured_image_derivatives['thumb']['width'],
+                         160)
+
+    @override_settings(IMAGE_DERIVATIVES_INLINE=False)
+    def test_unreadable_image_is_not_retried(self):
+        name = default_storage.save('product_images/broken.png',
+                                    SimpleUploadedFile('broken.png', b'x'))
+        product = Product.objects.create(
+            name='Broken', price=Decimal('10.00'), image=name)
+        self.assertTrue(product.image_derivatives_pending)
+
+        out = StringIO()
+        with self.assertLogs('hand_crafted.images', 'ERROR'):
+            call_command('generate_image_derivatives', once=True,
+                         stdout=out)
+        self.assertIn('Generated 0 images, 1 failed', out.getvalue())
+        product.refresh_from_db()
+        self.assertFalse(product.image_derivatives_pending)
+        self.assertEqual(product.image_derivatives, {})
+
+    def test_image_without_derivatives_uses_original(self):
+        product = Product(name='New', price=Decimal('1.00'),
+                          image='product_images/new.png')
+        html = Template(
+            '{% load responsive_images %}'
+            "{% responsive_image product.image product.image_derivatives "
+            "'detail' alt=product.name %}").render(
+            Context({'product': product}))
+        self.assertIn('src="/media/product_images/new.png"', html)
+        self.assertNotIn('srcset', html)
+        self.assertNotIn('loading', html)
@@ -0,0 +1,92 @@
+from decimal import Decimal
+
+from django.core import signing
+from django.http import QueryDict
+from django.test import TestCase
+
+from products.models import Product
+
+from .pagination import CursorSerializer, KeysetPaginator
+
+
+class KeysetPaginatorTest(TestCase):
+    """
+    Test the cursor paginator
+    """
+    def setUp(self):
+        # Duplicate prices make the id tie-breaker matter
+        for index, price in enumerate(['5.00', '5.00', '5.00', '7.50',
+                                       '7.50', '9.99', '12.00']):
+            Product.objects.create(
+                name=f'Product {index}', price=Decimal(price))
+
+    def walk(self, queryset, per_page, ordering=None):
+        """ Follow next cursors to the end, collecting every page """
+        paginator = KeysetPaginator(queryset, per_page, ordering)
+        page = paginator.get_page()
+        pages = [list(page)]
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            pages.append(list(page))
+        return paginator, pages
+
+    def test_pages_cover_the_ordering_without_gaps(self):
+        for ordering in (['price'], ['-price'], ['name'], ['-name']):
+            queryset = Product.objects.order_by(*ordering)
+            _, pages = self.walk(queryset, 3)
+            flat = [product for page in pages for product in page]
+            expected = list(Product.objects.order_by(
+                *ordering, '-pk' if ordering[0][0] == '-' else 'pk'))
+            self.assertEqual(flat, expected)
+            self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+    def test_previous_cursor_returns_the_previous_page(self):
+        queryset = Product.objects.order_by('-price')
+        paginator = KeysetPaginator(queryset, 3)
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        back = paginator.get_page(second.previous_cursor)
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_pages_do_not_count_or_offset(self):
+        paginator = KeysetPaginator(Product.objects.order_by('price'), 3)
+        page = paginator.get_page()
+        with self.assertNumQueries(1) as context:
+            list(paginator.get_page(page.next_cursor))
+        sql = context.captured_queries[0]['sql'].upper()
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        paginator = KeysetPaginator(Product.objects.order_by('price'), 3)
+        page = paginator.get_page('not-a-cursor')
+        self.assertEqual(list(page), list(paginator.get_page()))
+        self.assertFalse(page.has_previous())
+
+    def test_cursor_of_another_ordering_falls_back_to_first_page(self):
+        by_price = KeysetPaginator(Product.objects.order_by('price'), 3)
+        by_name = KeysetPaginator(Product.objects.order_by('-name'), 3)
+        cursor = by_price.get_page().next_cursor
+        page = by_name.get_page(cursor)
+        self.assertEqual(list(page), list(by_name.get_page()))
+        self.assertFalse(page.has_previous())
+
+    def test_cursor_values_of_wrong_type_fall_back_to_first_page(self):
+        paginator = KeysetPaginator(Product.objects.order_by('created_on'), 3)
+        cursor = signing.dumps(
+            {'d': 'n', 'o': 'created_on,pk', 'v': ['not a date', 1]},
+            salt=paginator.salt, serializer=CursorSerializer)
+        page = paginator.get_page(cursor)
+        self.assertEqual(list(page), list(paginator.get_page()))
+
+    def test_querystring_keeps_other_parameters(self):
+        paginator = KeysetPaginator(Product.objects.order_by('price'), 3)
+        query = QueryDict('sort=price&direction=asc&page=4')
+        page = paginator.get_page(None, query)
+        next_query = QueryDict(page.next_query)
+        self.assertEqual(next_query['sort'], 'price')
+        self.assertEqual(next_query['direction'], 'asc')
+        self.assertNotIn('page', next_query)
+        self.assertEqual(next_query['cursor'], page.next_cursor)
@@ -0,0 +1,88 @@
+from django.contrib.sessions.serializers import JSONSerializer
+from django.core.cache import cache
+from django.test import TestCase
+
+from .db_sessions import SessionStore as DatabaseSessionStore
+from .sessions import CompactJSONSerializer, SessionStore
+
+AUTH_SESSION = {
+    '_auth_user_id': '12',
+    '_auth_user_backend':
+        'allauth.account.auth_backends.AuthenticationBackend',
+    '_auth_user_hash': 'f' * 64,
+    'cart': [[7, 3, 2]],
+}
+
+
+class CompactJSONSerializerTest(TestCase):
+    """
+    Test the compact session serializer
+    """
+    def test_round_trip_is_smaller(self):
+        serializer = CompactJSONSerializer()
+        data = serializer.dumps(AUTH_SESSION)
+        self.assertEqual(serializer.loads(data), AUTH_SESSION)
+        self.assertLess(len(data),
+                        len(JSONSerializer().dumps(AUTH_SESSION)) - 60)
+
+    def test_reads_plain_json(self):
+        data = JSONSerializer().dumps(AUTH_SESSION)
+        self.assertEqual(CompactJSONSerializer().loads(data), AUTH_SESSION)
+
+
+class SessionStoreTest(TestCase):
+    """
+    Test the cached session engine
+    """
+    def setUp(self):
+        cache.clear()
+        session = SessionStore()
+        session['cart'] = [[7, 3, 2]]
+        session.save()
+        self.session_key = session.session_key
+
+    def test_loads_from_cache(self):
+        session = SessionStore(self.session_key)
+        with self.assertNumQueries(0):
+            self.assertEqual(session['cart'], [[7, 3, 2]])
+
+    def test_unchanged_data_is_not_saved(self):
+        session = SessionStore(self.session_key)
+        session['cart'] = [[7, 3, 2]]
+        with self.assertNumQueries(0):
+            session.save()
+
+        session['cart'] = [[7, 3, 3]]
+        session.save()
+        self.assertEqual(SessionStore(self.session_key)['cart'], [[7, 3, 3]])
+
+    def test_changes_made_in_place_are_saved(self):
+        session = SessionStore(self.session_key)
+        cart = session['cart']
+        cart.append([8, 0, 1])
+        session['cart'] = cart
+        session.save()
+        cache.clear()
+        self.assertEqual(SessionStore(self.session_key)['cart'],
+                         [[7, 3, 2], [8, 0, 1]])
+
+
+class DatabaseSessionStoreTest(TestCase):
+    """
+    Test the database session engine used without a shared cache
+    """
+    def test_unchanged_data_is_not_saved(self):
+        session = DatabaseSessionStore()
+        session['cart'] = [[7, 3, 2]]
+        session.save()
+
+        session = DatabaseSessionStore(session.session_key)
+        with self.assertNumQueries(1):
+            session['cart'] = [[7, 3, 2]]
+            session.save()
+
+        session['cart'] = [[7, 3, 3]]
+        session.save()
+        cache.clear()
+        self.assertEqual(
+            DatabaseSessionStore(session.session_key)['cart'], [[7, 3, 3]])
@@ -165,3 +165,25 @@ class ContactPageTests(TestCase):
         response = self.client.get(url, data=data)
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'home/contact.html')
+
+
+class PageFragmentsTests(TestCase):
+    """
+    Test the fragments endpoint filling in cached pages
+    """
+    def test_user_menu_fragment(self):
+        url = reverse('home:page_fragments')
+        name = 'includes/user-menu.html'
+        response = self.client.get(url, {'name': name})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('Register', response.json()['fragments'][name])
+
+        User.objects.create_user(username='buyer', password='x')
+        self.client.login(username='buyer', password='x')
+        response = self.client.get(url, {'name': name})
+        self.assertIn('Logout', response.json()['fragments'][name])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_post_not_allowed(self):
+        response = self.client.post(reverse('home:page_fragments'))
+        self.assertEqual(response.status_code, 405)
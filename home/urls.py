@@ -10,5 +10,6 @@ urlpatterns = [
          name='privacy_policy'),
     path('pages/about/', views.about_view, name='about_view'),
     path('pages/faq/', views.frequently_asked_questions_view, name='faq_view'),
+    path('fragments/', views.page_fragments, name='page_fragments'),
     path('', views.index, name='index'),
 ]
@@ -2,15 +2,19 @@ from django.shortcuts import render, redirect
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.mail import BadHeaderError, send_mail
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.contrib import messages
 
+from django.middleware.csrf import get_token
 from django.template.loader import render_to_string
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
 
 from .models import FAQ
 from .forms import ContactForm
 
 from blog.models import Post
+from products.cache import FRAGMENTS
 
 
 def index(request):
@@ -20,6 +24,23 @@ def index(request):
     return render(request, "home/index.html")
 
 
+@require_GET
+@never_cache
+def page_fragments(request):
+    """
+    Render the visitor dependent fragments of a cached page, named by
+    the ``name`` parameters, and return them with a CSRF token for the
+    page forms
+    """
+    names = [name for name in request.GET.getlist('name')
+             if name in FRAGMENTS]
+    return JsonResponse({
+        'fragments': {name: render_to_string(name, request=request)
+                      for name in names},
+        'csrf_token': get_token(request),
+    })
+
+
 def about_view(request):
     """
     Render the about page template
@@ -0,0 +1,18 @@
+from django.contrib import admin
+
+from .models import OutboundEmail
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    """
+    Queued emails in admin panel
+    """
+    list_display = ('subject', 'to', 'status', 'attempts',
+                    'created_on', 'sent_on',)
+    list_filter = ('status',)
+    search_fields = ('subject', 'to',)
+    readonly_fields = ('subject', 'to', 'data', 'attempts',
+                       'created_on', 'sent_on', 'last_error',)
+
+    ordering = ('-created_on',)
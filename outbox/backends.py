@@ -0,0 +1,39 @@
+"""
+Email backend queueing messages in the database outbox.
+
+Sending an email only inserts an OutboundEmail, so no SMTP connection is
+made while handling a request. The send_queued_email command delivers
+the queued emails through OUTBOX_EMAIL_BACKEND. Enable with::
+
+    EMAIL_BACKEND = 'outbox.backends.QueuedEmailBackend'
+    OUTBOX_EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+"""
+from email.utils import formatdate
+
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.message import make_msgid
+
+from .models import OutboundEmail
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """
+    Store email messages in the outbox instead of sending them
+    """
+    def send_messages(self, email_messages):
+        emails = []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            # Build the MIME message once to fail on bad headers now
+            message.message()
+            email = OutboundEmail.from_message(message)
+            # Keep the same Message-ID and Date over delivery attempts
+            headers = email.data['headers']
+            headers.setdefault('Message-ID', make_msgid())
+            headers.setdefault('Date', formatdate(
+                localtime=settings.EMAIL_USE_LOCALTIME))
+            emails.append(email)
+        OutboundEmail.objects.bulk_create(emails)
+        return len(emails)
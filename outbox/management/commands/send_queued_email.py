@@ -0,0 +1,21 @@
+from hand_crafted.queue import QueueCommand
+from outbox.models import OutboundEmail
+from outbox.sender import send_due
+
+
+class Command(QueueCommand):
+    """
+    Deliver the emails queued in the outbox, see QueueCommand for the
+    options. Each batch is sent over a single connection.
+    """
+    help = 'Deliver the emails queued in the outbox'
+    model = OutboundEmail
+    noun = 'emails'
+    batch_size = 50
+    interval = 5
+
+    def process_batch(self, limit):
+        return send_due(limit)
+
+    def report(self, done, failed):
+        return f'Sent {done} emails, {failed} failed'
@@ -0,0 +1,102 @@
+import base64
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives
+from django.db import models
+
+from hand_crafted.queue import QueueItem
+
+
+class OutboundEmail(QueueItem):
+    """
+    An email queued by QueuedEmailBackend and delivered by the
+    send_queued_email command
+    """
+    QUEUED = 'queued'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+    WAITING = QUEUED
+    MAX_ATTEMPTS = 6
+    RETRY_BACKOFF = timedelta(minutes=1)
+    MAX_RETRY_BACKOFF = timedelta(hours=2)
+    # Time a worker has to deliver a claimed batch
+    CLAIM_TIMEOUT = timedelta(minutes=10)
+
+    subject = models.TextField(blank=True, default='')
+    to = models.TextField(blank=True, default='')
+    # The fields of the email message, see from_message()
+    data = models.JSONField()
+    status = models.CharField(
+        max_length=10, choices=STATUSES, default=QUEUED)
+    created_on = models.DateTimeField(auto_now_add=True)
+    sent_on = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_on'],
+                         name='outbound_email_due'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {self.to}'
+
+    @classmethod
+    def from_message(cls, message):
+        """ Return an unsaved OutboundEmail of an EmailMessage """
+        attachments = []
+        for attachment in message.attachments:
+            if isinstance(attachment, tuple):
+                filename, content, mimetype = attachment
+            else:
+                # A MIMEBase attachment
+                filename = attachment.get_filename()
+                content = attachment.get_payload(decode=True)
+                mimetype = attachment.get_content_type()
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            attachments.append(
+                [filename, base64.b64encode(content).decode('ascii'),
+                 mimetype])
+        return cls(
+            subject=message.subject,
+            to=', '.join(message.to),
+            data={
+                'subject': message.subject,
+                'body': message.body,
+                'from_email': message.from_email,
+                'to': list(message.to),
+                'cc': list(message.cc),
+                'bcc': list(message.bcc),
+                'reply_to': list(message.reply_to),
+                'headers': dict(message.extra_headers),
+                'content_subtype': message.content_subtype,
+                'alternatives': [list(alternative) for alternative in
+                                 getattr(message, 'alternatives', [])],
+                'attachments': attachments,
+            })
+
+    def to_message(self, connection=None):
+        """ Rebuild the EmailMessage to deliver """
+        data = self.data
+        message = EmailMultiAlternatives(
+            subject=data['subject'],
+            body=data['body'],
+            from_email=data['from_email'],
+            to=data['to'],
+            cc=data['cc'],
+            bcc=data['bcc'],
+            reply_to=data['reply_to'],
+            headers=data['headers'],
+            alternatives=[tuple(alternative)
+                          for alternative in data['alternatives']],
+            connection=connection,
+        )
+        message.content_subtype = data['content_subtype']
+        for filename, content, mimetype in data['attachments']:
+            message.attach(filename, base64.b64decode(content), mimetype)
+        return message
@@ -0,0 +1,46 @@
+"""
+Delivery of the queued emails.
+
+Due emails are claimed in batches, as described in hand_crafted/queue.py,
+and each batch is delivered over one connection of OUTBOX_EMAIL_BACKEND.
+"""
+from django.conf import settings
+from django.core.mail import get_connection
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+
+def send_due(limit=100):
+    """
+    Deliver up to ``limit`` due emails over one connection. Return the
+    number of emails sent and failed (including those retried later).
+    """
+    emails = OutboundEmail.claim_due(limit)
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection(settings.OUTBOX_EMAIL_BACKEND)
+    is_open = False
+    for email in emails:
+        try:
+            if not is_open:
+                connection.open()
+                is_open = True
+            connection.send_messages([email.to_message(connection)])
+        except Exception as error:
+            email.record_failure(f'{type(error).__name__}: {error}')
+            failed += 1
+            # Start over with a new connection for the next email
+            connection.close()
+            is_open = False
+        else:
+            email.status = OutboundEmail.SENT
+            email.sent_on = timezone.now()
+            email.last_error = ''
+            email.save(update_fields=['status', 'sent_on', 'last_error'])
+            sent += 1
+    if is_open:
+        connection.close()
+    return sent, failed
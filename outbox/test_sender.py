@@ -0,0 +1,178 @@
+import socketserver
+import threading
+from datetime import timedelta
+from email import message_from_bytes
+from io import StringIO
+
+from django.core.mail import EmailMultiAlternatives, send_mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import OutboundEmail
+from .sender import send_due
+
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+QUEUED_BACKEND = 'outbox.backends.QueuedEmailBackend'
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """ One SMTP session with the stand-in server """
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply('220 localhost stand-in SMTP')
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().rstrip('\r\n')
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            if command == 'EHLO':
+                self.reply('250 localhost')
+            elif command == 'RCPT':
+                address = line.split(':', 1)[1].strip(' <>')
+                if address in server.refused:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b'.\r\n', b''):
+                        break
+                    lines.append(data[1:] if data.startswith(b'.') else data)
+                server.messages.append(
+                    (recipients, message_from_bytes(b''.join(lines))))
+                recipients = []
+                self.reply('250 OK queued')
+            else:
+                # MAIL, RSET, NOOP, HELO
+                if command in ('MAIL', 'RSET'):
+                    recipients = []
+                self.reply('250 OK')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """ Local SMTP server recording the connections and messages """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.refused = set()
+
+
+class SendQueuedEmailTest(TestCase):
+    """
+    Test queueing emails in the outbox and delivering them over SMTP
+    """
+    def setUp(self):
+        self.smtp = SMTPStandIn()
+        thread = threading.Thread(target=self.smtp.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.smtp.server_close)
+        self.addCleanup(self.smtp.shutdown)
+        settings = override_settings(
+            EMAIL_BACKEND=QUEUED_BACKEND,
+            OUTBOX_EMAIL_BACKEND=SMTP_BACKEND,
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.smtp.server_address[1],
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def queue(self, count, **kwargs):
+        for number in range(count):
+            send_mail(f'Order {number}', 'Thank you', 'shop@example.com',
+                      [f'buyer{number}@example.com'], **kwargs)
+
+    def test_send_mail_only_queues(self):
+        self.queue(1, html_message='<p>Thank you</p>')
+        self.assertEqual(self.smtp.connections, 0)
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.status, OutboundEmail.QUEUED)
+        self.assertEqual(email.to, 'buyer0@example.com')
+        self.assertIn('Message-ID', email.data['headers'])
+
+    def test_batch_is_sent_over_one_connection(self):
+        self.queue(5, html_message='<p>Thank you</p>')
+        self.assertEqual(send_due(), (5, 0))
+
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual(len(self.smtp.messages), 5)
+        recipients, message = self.smtp.messages[0]
+        self.assertEqual(recipients, ['buyer0@example.com'])
+        self.assertEqual(message['Subject'], 'Order 0')
+        self.assertEqual(message.get_content_type(), 'multipart/alternative')
+        email = OutboundEmail.objects.get(subject='Order 0')
+        self.assertEqual(message['Message-ID'],
+                         email.data['headers']['Message-ID'])
+        self.assertFalse(OutboundEmail.objects.exclude(
+            status=OutboundEmail.SENT).exists())
+        self.assertEqual(send_due(), (0, 0))
+
+    def test_failed_email_is_retried_with_backoff(self):
+        self.smtp.refused.add('buyer1@example.com')
+        self.queue(3)
+        self.assertEqual(send_due(), (2, 1))
+
+        email = OutboundEmail.objects.get(subject='Order 1')
+        self.assertEqual(email.status, OutboundEmail.QUEUED)
+        self.assertEqual(email.attempts, 1)
+        self.assertIn('SMTPRecipientsRefused', email.last_error)
+        self.assertGreater(email.next_attempt_on, timezone.now())
+        self.assertEqual(send_due(), (0, 0))
+
+        for attempt in range(2, OutboundEmail.MAX_ATTEMPTS + 1):
+            OutboundEmail.objects.update(next_attempt_on=timezone.now())
+            self.assertEqual(send_due(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.FAILED)
+
+        # Given up emails can be queued again
+        self.smtp.refused.clear()
+        out = StringIO()
+        call_command('send_queued_email', '--once', '--retry-failed',
+                     stdout=out)
+        self.assertIn('Sent 1 emails, 0 failed', out.getvalue())
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.SENT)
+
+    def test_attachments_and_recipients_are_kept(self):
+        message = EmailMultiAlternatives(
+            'Invoice', 'Attached', 'shop@example.com',
+            ['buyer@example.com'], bcc=['books@example.com'],
+            reply_to=['help@example.com'])
+        message.attach('invoice.txt', b'Total: 22.00', 'text/plain')
+        message.send()
+        self.assertEqual(send_due(), (1, 0))
+
+        recipients, sent = self.smtp.messages[0]
+        self.assertEqual(recipients,
+                         ['buyer@example.com', 'books@example.com'])
+        self.assertNotIn('Bcc', sent)
+        self.assertEqual(sent['Reply-To'], 'help@example.com')
+        attachment = sent.get_payload()[1]
+        self.assertEqual(attachment.get_filename(), 'invoice.txt')
+        self.assertEqual(attachment.get_payload(decode=True),
+                         b'Total: 22.00')
+
+    def test_claimed_email_is_not_sent_twice(self):
+        self.queue(1)
+        OutboundEmail.objects.update(
+            attempts=1, next_attempt_on=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(send_due(), (0, 0))
+        self.assertEqual(self.smtp.messages, [])
@@ -33,6 +33,8 @@ class ProductAdmin(SummernoteModelAdmin):
         'category',
         'price',
         'available',
+        'avg_rating',
+        'review_count',
         'created_on',
         'updated_on',
         'image',
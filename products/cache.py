@@ -0,0 +1,213 @@
+"""
+Full-page cache for anonymous visitors of the product pages.
+
+Cached pages are stored under versioned key namespaces: saving a product,
+review or category bumps the versions of the namespaces it affects, so
+stale entries are never read again and simply expire. The versions live
+in the default cache, which deployments share between all processes so
+a change made through one worker invalidates the pages of all of them.
+
+Parts of the page that depend on the visitor (the cart badges, the user
+menus, flash messages) are rendered through the ``{% nocache %}`` tag.
+While a page is being cached they are wrapped in markers and stored as
+empty placeholders, and CSRF tokens are stored empty. A page served from
+the cache is therefore the same for every visitor and is returned as is:
+the page fills the placeholders and CSRF tokens in from the
+``home:page_fragments`` JSON endpoint.
+
+The product cards of the listing are cached as template fragments. The
+listing page is fetched with only the columns their cache keys are built
+from, and only the products whose card misses the cache are loaded in
+full.
+"""
+import hashlib
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.encoding import force_bytes
+from django.utils.safestring import mark_safe
+
+# Templates that can be rendered through {% nocache %} and the fragments
+# endpoint
+FRAGMENTS = (
+    'includes/cart-badge.html',
+    'includes/cart-badge-mobile.html',
+    'includes/user-menu.html',
+    'includes/user-menu-mobile.html',
+    'includes/messages.html',
+)
+
+# Query string parameters the product pages respond to
+PAGE_CACHE_PARAMS = ('sort', 'direction', 'category', 'q', 'cursor')
+
+# Product columns the cache key of a listing card is built from
+CARD_KEY_FIELDS = ('id', 'updated_on', 'rating_version', 'category',
+                   'category__name', 'category__friendly_name')
+
+HOLE_RE = re.compile(
+    r'<!--nocache:(?P<name>[\w./-]+)-->(?P<content>.*?)<!--/nocache-->',
+    re.S)
+CSRF_RE = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def _version_key(namespace):
+    return f'page_cache:version:{namespace}'
+
+
+def get_versions(namespaces):
+    """
+    Return the current version of each namespace, starting a namespace
+    at the current time when it has no version yet so a lost version
+    can never bring old entries back
+    """
+    keys = [_version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = time.time_ns()
+            if not cache.add(key, versions[key], None):
+                versions[key] = cache.get(key, versions[key])
+    return [str(versions[key]) for key in keys]
+
+
+def bump_versions(*namespaces):
+    """
+    Invalidate every page cached under the given namespaces.
+    The versions are bumped again once the current transaction commits,
+    so a page rendered from data that was not committed yet cannot
+    survive under the new version.
+    """
+    def bump():
+        cache.set_many({_version_key(namespace): time.time_ns()
+                        for namespace in namespaces}, None)
+    bump()
+    transaction.on_commit(bump)
+
+
+def product_list_key(request):
+    """ Cache key of the product list for the normalized query string """
+    params = []
+    for name in PAGE_CACHE_PARAMS:
+        if name in request.GET:
+            value = request.GET[name].strip()
+            if name == 'category':
+                value = ','.join(sorted(set(value.split(','))))
+            params.append(f'{name}={value}')
+    return _page_key('product_list', ['products', 'categories'], params)
+
+
+def product_detail_key(request, product_id, slug):
+    """ Cache key of a product detail page """
+    return _page_key('product_detail',
+                     [f'product:{product_id}', 'categories'],
+                     [str(product_id), slug])
+
+
+def _page_key(name, namespaces, parts):
+    versions = '.'.join(get_versions(namespaces))
+    digest = hashlib.md5(force_bytes('&'.join(parts))).hexdigest()
+    return f'page_cache:{name}:{versions}:{digest}'
+
+
+def fragment_placeholder(name, content='', pending=True):
+    """
+    Return the element holding a fragment. A pending placeholder is
+    filled in client-side.
+    """
+    pending = ' data-fragment-pending' if pending else ''
+    return (f'<div class="page-fragment" data-fragment="{name}"{pending}>'
+            f'{content}</div>')
+
+
+def _strip_markers(content):
+    return HOLE_RE.sub(lambda match: match.group('content'), content)
+
+
+def _punch_holes(content):
+    """
+    Replace the visitor dependent parts of a page with placeholders
+    before caching it
+    """
+    content = HOLE_RE.sub(
+        lambda match: fragment_placeholder(match.group('name')), content)
+    return CSRF_RE.sub(r'\1\2', content)
+
+
+def anonymous_page_cache(key_func):
+    """
+    Cache the successful GET responses of a view for anonymous users.
+    ``key_func`` receives the view arguments and returns the cache key.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD') or
+                    request.user.is_authenticated):
+                return view_func(request, *args, **kwargs)
+
+            key = key_func(request, *args, **kwargs)
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+                response['X-Page-Cache'] = 'hit'
+                return response
+
+            request.page_cache_holes = True
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                content = response.content.decode(response.charset)
+                cache.set(key, (_punch_holes(content),
+                                response['Content-Type']),
+                          settings.PAGE_CACHE_TIMEOUT)
+                response.content = _strip_markers(content)
+                response['X-Page-Cache'] = 'miss'
+            return response
+        return wrapper
+    return decorator
+
+
+def _fragment_cache():
+    """ Cache used by the {% cache %} template tag """
+    try:
+        return caches['template_fragments']
+    except InvalidCacheBackendError:
+        return cache
+
+
+def product_card_key(product, user):
+    """
+    Cache key of the listing card of a product, the same as the one
+    built by the {% cache %} tag in products/list.html
+    """
+    category = product.category
+    return make_template_fragment_key('product_card', [
+        product.id, product.updated_on, product.rating_version,
+        category.name if category else '',
+        category.friendly_name if category else '',
+        user.is_superuser])
+
+
+def load_product_cards(page, user):
+    """
+    Attach the cached card of each product of a page fetched with only
+    the CARD_KEY_FIELDS, as ``card``, and load the products whose card
+    missed the cache in full with one query
+    """
+    keys = {product.pk: product_card_key(product, user) for product in page}
+    cards = _fragment_cache().get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in cards]
+    if missing:
+        loaded = page.paginator.queryset.defer(None).in_bulk(missing)
+        page.object_list = [loaded.get(product.pk, product)
+                            for product in page.object_list]
+    for product in page:
+        card = cards.get(keys[product.pk])
+        product.card = mark_safe(card) if card is not None else None
+    return page
@@ -0,0 +1,132 @@
+"""
+Readers and writers for the CSV / JSONL catalog files used by the
+import_products and export_products management commands.
+
+Every row describes one product. Categories are referenced by slug and
+products are matched on their sku when importing.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import DecimalValidator
+
+from .models import Product
+
+# Columns of a catalog file, in export order
+CATALOG_FIELDS = (
+    'sku', 'name', 'description', 'category', 'price', 'has_sizes',
+    'image_url', 'available',
+)
+FORMATS = ('csv', 'jsonl')
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 't')
+
+
+class CatalogError(ValueError):
+    """ Raised for a catalog row that cannot be imported """
+
+
+def guess_format(path, default='csv'):
+    """ Pick the file format from the file extension """
+    for extension in FORMATS:
+        if str(path).lower().endswith(f'.{extension}'):
+            return extension
+    return default
+
+
+def read_rows(stream, file_format):
+    """
+    Yield each row of a catalog file as a dict, one line at a time.
+    A JSONL line that is not a JSON object is yielded as a CatalogError,
+    which clean_row() raises so it is reported with the other rows.
+    """
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                yield CatalogError(f'invalid JSON: {error}')
+                continue
+            if isinstance(row, dict):
+                yield row
+            else:
+                yield CatalogError('row is not a JSON object')
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def _to_text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _to_price(value):
+    """ Convert a price to a Decimal that fits Product.price """
+    try:
+        price = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise CatalogError(f'invalid price {value!r}')
+    if not price.is_finite() or price < 0:
+        raise CatalogError(f'invalid price {value!r}')
+    field = Product._meta.get_field('price')
+    try:
+        DecimalValidator(field.max_digits, field.decimal_places)(price)
+    except ValidationError as error:
+        raise CatalogError(f'invalid price {value!r}: {error.messages[0]}')
+    return price
+
+
+def clean_row(row):
+    """
+    Convert a raw row to model field values, keeping only the catalog
+    columns present in the row. The category is returned as a slug.
+    """
+    if isinstance(row, CatalogError):
+        raise row
+    values = {}
+    for field in CATALOG_FIELDS:
+        if field not in row:
+            continue
+        value = row[field]
+        if field in ('has_sizes', 'available'):
+            value = _to_bool(value)
+        elif field == 'price':
+            value = _to_price(value)
+        elif field == 'description':
+            value = value or ''
+        else:
+            value = _to_text(value)
+        values[field] = value
+    if not values.get('name'):
+        raise CatalogError('missing name')
+    if 'price' not in values:
+        raise CatalogError('missing price')
+    return values
+
+
+class CatalogWriter:
+    """ Write catalog rows to a text stream as CSV or JSONL """
+    def __init__(self, stream, file_format):
+        self.stream = stream
+        self.file_format = file_format
+        if file_format == 'csv':
+            self.writer = csv.DictWriter(stream, fieldnames=CATALOG_FIELDS)
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.file_format == 'csv':
+            self.writer.writerow(row)
+        else:
+            self.stream.write(
+                json.dumps(row, separators=(',', ':')) + '\n')
@@ -0,0 +1,59 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from products.catalog import (
+    CATALOG_FIELDS, FORMATS, CatalogWriter, guess_format)
+from products.models import Product
+
+
+class Command(BaseCommand):
+    """
+    Export every product to a CSV or JSONL catalog file that can be
+    loaded back with import_products.
+
+    Rows are streamed from the database with a server-side cursor, so
+    memory use stays flat however large the catalog is.
+    """
+    help = 'Export products to a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='File to write, stdout by default')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='File format, guessed from the file extension by default')
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Number of products to fetch per query')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or guess_format(path)
+
+        if path == '-':
+            count = self.export(sys.stdout, file_format, options)
+        else:
+            try:
+                with open(path, 'w', newline='', encoding='utf-8') as stream:
+                    count = self.export(stream, file_format, options)
+            except OSError as error:
+                raise CommandError(error)
+            self.stdout.write(
+                self.style.SUCCESS(f'Exported {count} products'))
+
+    def export(self, stream, file_format, options):
+        writer = CatalogWriter(stream, file_format)
+        columns = [field for field in CATALOG_FIELDS if field != 'category']
+        rows = Product.objects.order_by('id').annotate(
+            category_slug=F('category__slug')).values(
+            *columns, 'category_slug')
+        count = 0
+        for row in rows.iterator(chunk_size=options['chunk_size']):
+            row['category'] = row.pop('category_slug')
+            row['price'] = str(row['price'])
+            writer.write(row)
+            count += 1
+        return count
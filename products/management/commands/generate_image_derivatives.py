@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from hand_crafted.images import generate_pending_derivatives
+from hand_crafted.queue import run_worker
+
+
+class Command(BaseCommand):
+    """
+    Generate the resized copies of the product and blog images marked as
+    pending on upload.
+
+    Runs as a worker polling for pending images until stopped, or
+    handles the pending images and exits with --once (e.g. from a
+    scheduler).
+    """
+    help = 'Generate the pending responsive image derivatives'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Handle the pending images and exit')
+        parser.add_argument(
+            '--batch-size', type=int, default=20,
+            help='Number of images of each model to handle per batch')
+        parser.add_argument(
+            '--interval', type=float, default=10,
+            help='Seconds to wait when no image is pending')
+
+    def handle(self, *args, **options):
+        generated, failed = run_worker(
+            lambda: generate_pending_derivatives(options['batch_size']),
+            once=options['once'], interval=options['interval'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {generated} images, {failed} failed'))
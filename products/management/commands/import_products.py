@@ -0,0 +1,142 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from products.cache import bump_versions
+from products.catalog import (
+    FORMATS, CatalogError, clean_row, guess_format, read_rows)
+from products.models import Category, Product
+from products.search import index_products
+
+
+class Command(BaseCommand):
+    """
+    Import products from a CSV or JSONL catalog file.
+
+    Rows are matched to existing products on their sku and written with
+    bulk_create / bulk_update in batches, skipping the per-object
+    Product.save(). The search index and the page cache are refreshed
+    for the imported products afterwards.
+    """
+    help = 'Import products from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Catalog file to import, or - for stdin')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='File format, guessed from the file extension by default')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows to write per batch')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or guess_format(path)
+        self.batch_size = options['batch_size']
+        # Resolve every category slug once for the whole import
+        self.categories = dict(
+            Category.objects.values_list('slug', 'id'))
+        self.created = self.updated = self.skipped = 0
+        self.updated_ids = []
+        last_id = Product.objects.aggregate(last=Max('id'))['last'] or 0
+
+        if path == '-':
+            self.import_stream(sys.stdin, file_format)
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8') as stream:
+                    self.import_stream(stream, file_format)
+            except OSError as error:
+                raise CommandError(error)
+
+        self.refresh_search_index(last_id)
+        if self.created or self.updated:
+            bump_versions('products', *[
+                f'product:{pk}' for pk in self.updated_ids])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {self.created}, updated {self.updated} and '
+            f'skipped {self.skipped} products'))
+
+    def import_stream(self, stream, file_format):
+        batch = []
+        for line, row in enumerate(read_rows(stream, file_format), 1):
+            try:
+                values = clean_row(row)
+                slug = values.get('category')
+                if slug is not None and slug not in self.categories:
+                    raise CatalogError(f'unknown category {slug!r}')
+            except CatalogError as error:
+                self.stderr.write(f'Row {line} skipped: {error}')
+                self.skipped += 1
+                continue
+            batch.append(values)
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+
+    def build(self, product, values):
+        """ Copy the row values onto a product instance """
+        for field, value in values.items():
+            if field == 'category':
+                product.category_id = self.categories.get(value)
+            else:
+                setattr(product, field, value)
+        product.slug = slugify(product.name)
+
+    def write_batch(self, batch):
+        skus = {values['sku'] for values in batch if values.get('sku')}
+        existing = {}
+        for product in Product.objects.filter(sku__in=skus):
+            existing.setdefault(product.sku, product)
+
+        now = timezone.now()
+        to_create = []
+        to_update = {}
+        new_by_sku = {}
+        fields = {'slug', 'updated_on'}
+        for values in batch:
+            sku = values.get('sku')
+            if sku in existing:
+                product = existing[sku]
+                to_update[product.pk] = product
+            elif sku in new_by_sku:
+                # Repeated sku in the same batch, the last row wins
+                product = new_by_sku[sku]
+            else:
+                product = Product()
+                to_create.append(product)
+                if sku:
+                    new_by_sku[sku] = product
+            self.build(product, values)
+            product.updated_on = now
+            fields.update(values)
+
+        with transaction.atomic():
+            Product.objects.bulk_create(to_create, self.batch_size)
+            Product.objects.bulk_update(
+                to_update.values(), sorted(fields), self.batch_size)
+
+        index_products(to_update.values())
+        self.updated_ids.extend(to_update)
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+    def refresh_search_index(self, last_id):
+        """ Index the products created by the import """
+        products = Product.objects.filter(id__gt=last_id).only(
+            'id', 'name', 'description')
+        batch = []
+        for product in products.iterator(chunk_size=self.batch_size):
+            batch.append(product)
+            if len(batch) >= self.batch_size:
+                index_products(batch)
+                batch = []
+        index_products(batch)
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import (
+    Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value)
+from django.db.models.functions import Coalesce
+
+from products.models import Product, ProductReview
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the stored review count, stars total and average rating
+    of every product from its reviews.
+    """
+    help = 'Rebuild the denormalized product rating aggregates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of products to update per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        reviews = ProductReview.objects.filter(
+            product=OuterRef('pk')).order_by().values('product')
+
+        with transaction.atomic():
+            # Count and total every product in a single UPDATE statement
+            updated = Product.objects.update(
+                review_count=Coalesce(
+                    Subquery(reviews.annotate(c=Count('id')).values('c'),
+                             output_field=IntegerField()),
+                    Value(0)),
+                rating_total=Coalesce(
+                    Subquery(reviews.annotate(s=Sum('stars')).values('s'),
+                             output_field=DecimalField()),
+                    Value(0), output_field=DecimalField()),
+                avg_rating=0,
+                rating_version=F('rating_version') + 1)
+
+            # Derive the averages from the stored columns in batches
+            batch = []
+            rated = Product.objects.filter(review_count__gt=0).only(
+                'id', 'review_count', 'rating_total')
+            for product in rated.iterator(chunk_size=batch_size):
+                product.avg_rating = round(
+                    product.rating_total / product.review_count, 2)
+                batch.append(product)
+                if len(batch) >= batch_size:
+                    Product.objects.bulk_update(batch, ['avg_rating'])
+                    batch = []
+            if batch:
+                Product.objects.bulk_update(batch, ['avg_rating'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt ratings for {updated} products'))
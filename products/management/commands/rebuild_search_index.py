@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+from products.search import index_products
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the full-text search index for every product, e.g. after
+    products were changed with queryset.update() or bulk operations.
+    """
+    help = 'Rebuild the full-text product search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Number of products to fetch and index per query')
+
+    def handle(self, *args, **options):
+        count = 0
+        chunk_size = options['chunk_size']
+        products = Product.objects.only('id', 'name', 'description')
+        batch = []
+        for product in products.iterator(chunk_size=chunk_size):
+            batch.append(product)
+            if len(batch) >= chunk_size:
+                index_products(batch)
+                count += len(batch)
+                batch = []
+        index_products(batch)
+        count += len(batch)
+        self.stdout.write(
+            self.style.SUCCESS(f'Indexed {count} products'))
@@ -0,0 +1,43 @@
+# Generated by Django 3.2 on 2026-10-18 11:11
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_ratings(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductReview = apps.get_model('products', 'ProductReview')
+    rows = ProductReview.objects.order_by().values('product').annotate(
+        review_count=Count('id'), rating_total=Sum('stars'))
+    for row in rows:
+        rating_total = row['rating_total'] or 0
+        Product.objects.filter(pk=row['product']).update(
+            review_count=row['review_count'],
+            rating_total=rating_total,
+            avg_rating=round(rating_total / row['review_count'], 2))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='avg_rating',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-18 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['avg_rating', 'id'], name='products_pr_avg_rat_7d76da_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.2 on 2026-10-18 11:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_closure(apps, schema_editor):
+    """
+    Build the closure rows for existing categories by walking the tree
+    one level at a time from the roots
+    """
+    Category = apps.get_model('products', 'Category')
+    CategoryClosure = apps.get_model('products', 'CategoryClosure')
+    db_alias = schema_editor.connection.alias
+    children = {}
+    for pk, parent_id in Category.objects.using(db_alias).values_list(
+            'pk', 'parent_id'):
+        children.setdefault(parent_id, []).append(pk)
+    # Ancestors of each category as {ancestor_id: depth}
+    ancestors = {}
+    level = [(pk, {}) for pk in children.get(None, [])]
+    while level:
+        next_level = []
+        for pk, parent_ancestors in level:
+            ancestors[pk] = {a: d + 1 for a, d in parent_ancestors.items()}
+            ancestors[pk][pk] = 0
+            next_level += [(child, ancestors[pk])
+                           for child in children.get(pk, [])]
+        level = next_level
+    CategoryClosure.objects.using(db_alias).bulk_create(
+        [CategoryClosure(ancestor_id=ancestor_id, descendant_id=pk,
+                         depth=depth)
+         for pk, links in ancestors.items()
+         for ancestor_id, depth in links.items()],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(default=0)),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='products.category')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='products.category')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='categoryclosure',
+            index=models.Index(fields=['descendant', 'ancestor'], name='products_ca_descend_8417a9_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='categoryclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_category_closure'),
+        ),
+        migrations.RunPython(backfill_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 11:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_category_closure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
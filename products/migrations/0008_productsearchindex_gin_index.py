@@ -0,0 +1,36 @@
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+OLD_NAME = 'products_productsearchindex_vector_gin'
+NEW_NAME = 'products_search_vector_gin'
+
+
+def rename_index(old_name, new_name):
+    def rename(apps, schema_editor):
+        # The index was created with raw SQL by 0004, on Postgres only
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(
+                f'ALTER INDEX IF EXISTS {old_name} RENAME TO {new_name}')
+    return rename
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(rename_index(OLD_NAME, NEW_NAME),
+                                     rename_index(NEW_NAME, OLD_NAME)),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='productsearchindex',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='products_search_vector_gin'),
+                ),
+            ],
+        ),
+    ]
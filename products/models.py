@@ -1,8 +1,14 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Count, F, Sum
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.urls import reverse
 from django.utils.text import slugify
 
+from .search import index_product
+
 
 RATING = [
     (1, "1"),
@@ -46,6 +52,88 @@ class Category(models.Model):
         """ Get the category friendly name """
         return self.friendly_name
 
+    def creates_cycle(self):
+        """ Check whether the parent is the category or one below it """
+        return bool(self.pk and self.parent_id) and (
+            CategoryClosure.objects.filter(
+                ancestor_id=self.pk, descendant_id=self.parent_id).exists())
+
+    def clean(self):
+        """ Reject a parent that would create a cycle in the tree """
+        if self.creates_cycle():
+            raise ValidationError({'parent': (
+                'A category cannot be moved below itself or one of its '
+                'descendants.')})
+
+    def save(self, *args, **kwargs):
+        """Save method override preventing cycles in the tree"""
+        if self.creates_cycle():
+            raise ValueError(
+                'A category cannot be moved below one of its descendants.')
+        super(Category, self).save(*args, **kwargs)
+
+    def update_closure(self):
+        """
+        Update the closure table each time a category is created or moved,
+        linking every category of its subtree to every new ancestor.
+        """
+        subtree = dict(CategoryClosure.objects.filter(
+            ancestor=self).values_list('descendant_id', 'depth'))
+        if not subtree:
+            subtree = {self.pk: 0}
+            links = [CategoryClosure(
+                ancestor_id=self.pk, descendant_id=self.pk, depth=0)]
+        else:
+            links = []
+        # Detach the subtree from its previous ancestors
+        CategoryClosure.objects.filter(
+            descendant_id__in=subtree).exclude(
+            ancestor_id__in=subtree).delete()
+        # Attach it below the parent and all of the parent's ancestors
+        if self.parent_id:
+            ancestors = CategoryClosure.objects.filter(
+                descendant_id=self.parent_id).values_list(
+                'ancestor_id', 'depth')
+            links += [
+                CategoryClosure(ancestor_id=ancestor_id,
+                                descendant_id=descendant_id,
+                                depth=ancestor_depth + depth + 1)
+                for ancestor_id, ancestor_depth in ancestors
+                for descendant_id, depth in subtree.items()]
+        CategoryClosure.objects.bulk_create(links)
+
+
+class CategoryClosure(models.Model):
+    """
+    Database model for the Category tree closure table.
+    Holds one row for every (ancestor, descendant) pair, including each
+    category paired with itself at depth 0.
+    """
+    ancestor = models.ForeignKey(Category,
+                                 related_name='descendant_links',
+                                 on_delete=models.CASCADE)
+    descendant = models.ForeignKey(Category,
+                                   related_name='ancestor_links',
+                                   on_delete=models.CASCADE)
+    depth = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        """
+        Ensure each pair is stored once and creates an index of
+        ancestors with their descendants for subtree lookups
+        """
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'],
+                                    name='unique_category_closure'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'ancestor']),
+        ]
+
+    def __str__(self):
+        """ Returns a string representation of the closure link """
+        return f'{self.ancestor} > {self.descendant} ({self.depth})'
+
 
 class Product(models.Model):
     """
@@ -63,23 +151,40 @@ class Product(models.Model):
     image_url = models.URLField(max_length=1024, null=True, blank=True)
     image = models.ImageField(upload_to='product_images/',
                               null=True, blank=True)
+    # Names of the resized copies of the image, see hand_crafted/images.py
+    image_derivatives = models.JSONField(default=dict, blank=True,
+                                         editable=False)
+    # Set while the resized copies wait for the derivatives worker
+    image_derivatives_pending = models.BooleanField(
+        default=False, editable=False, db_index=True)
     available = models.BooleanField(default=True)
     created_on = models.DateTimeField(auto_now_add=True)
     updated_on = models.DateTimeField(auto_now=True)
     wishlist = models.ManyToManyField(User, related_name='wishlist',
                                       blank=True, default=None)
+    # Denormalized review aggregates, kept up to date by the
+    # ProductReview signals in products/signals.py
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_total = models.DecimalField(max_digits=10, decimal_places=2,
+                                       default=0, editable=False)
+    avg_rating = models.DecimalField(max_digits=3, decimal_places=2,
+                                     default=0, editable=False)
+    # Bumped on every rating change so cached product cards expire
+    rating_version = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         """
         Set the order of products by ascending order
         Creates indexes of products by id, slug and name in ascending order
         Creates an index of products creation date in descending order
+        Creates an index of products average rating for rating sorting
         """
         ordering = ['name']
         indexes = [
             models.Index(fields=['id', 'slug']),
             models.Index(fields=['name']),
             models.Index(fields=['-created_on']),
+            models.Index(fields=['avg_rating', 'id']),
         ]
 
     def __str__(self):
@@ -87,9 +192,10 @@ class Product(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        """Save method override with slugify"""
+        """Save method override with slugify and search indexing"""
         self.slug = slugify(self.name)
         super(Product, self).save(*args, **kwargs)
+        index_product(self, using=kwargs.get('using') or 'default')
 
     def get_absolute_url(self):
         """ Get the product detail absolute url """
@@ -98,11 +204,29 @@ class Product(models.Model):
 
     def get_rating(self):
         """ Get product average rating """
-        total = sum(int(review['stars']) for review in self.reviews.values())
-        if self.reviews.count() > 0:
-            return total / self.reviews.count()
+        return self.avg_rating
+
+    def update_rating(self):
+        """
+        Update the stored review count, stars total and average rating
+        each time a review is added, edited or deleted.
+        """
+        aggregates = self.reviews.aggregate(
+            review_count=Count('id'), rating_total=Sum('stars'))
+        self.review_count = aggregates['review_count']
+        self.rating_total = aggregates['rating_total'] or 0
+        if self.review_count > 0:
+            self.avg_rating = round(
+                self.rating_total / self.review_count, 2)
         else:
-            return 0
+            self.avg_rating = 0
+        self.rating_version += 1
+        # Update the row directly so the slug and updated_on are untouched
+        Product.objects.filter(pk=self.pk).update(
+            review_count=self.review_count,
+            rating_total=self.rating_total,
+            avg_rating=self.avg_rating,
+            rating_version=F('rating_version') + 1)
 
 
 class ProductReview(models.Model):
@@ -126,3 +250,25 @@ class ProductReview(models.Model):
         """ Returns a string representation of Product Review """
         return f'{self.user.username} rated {self.stars} stars to \
 {self.product.name}'
+
+
+class ProductSearchIndex(models.Model):
+    """
+    Database model for the weighted full-text index of a product's
+    name and description, used by the Postgres search backend
+    """
+    product = models.OneToOneField(Product,
+                                   primary_key=True,
+                                   related_name='search_index',
+                                   on_delete=models.CASCADE)
+    search_vector = SearchVectorField(null=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'],
+                     name='products_search_vector_gin'),
+        ]
+
+    def __str__(self):
+        """ Returns a string representation of Product Search Index """
+        return f'Search index for {self.product_id}'
@@ -0,0 +1,139 @@
+"""
+Full-text product search.
+
+Postgres keeps a weighted ``tsvector`` in ``ProductSearchIndex`` backed
+by a GIN index. SQLite keeps the same text in the ``products_product_fts``
+FTS5 table, keyed by product id. Any other database falls back to the
+original ``icontains`` search.
+"""
+import re
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector)
+from django.db import connections, transaction
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+from django.db.models.expressions import RawSQL
+from django.utils.html import strip_tags
+
+# Text search configuration used for stemming on Postgres
+SEARCH_CONFIG = 'english'
+# Name matches are weighted above description matches
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+FTS_TABLE = 'products_product_fts'
+
+
+def _vendor(using):
+    return connections[using].vendor
+
+
+def _search_vector(name, description):
+    """ Build the weighted search vector for a product's text """
+    return (
+        SearchVector(Value(name), weight='A', config=SEARCH_CONFIG) +
+        SearchVector(Value(description), weight='B', config=SEARCH_CONFIG))
+
+
+def index_product(product, using='default'):
+    """
+    Add or refresh a product in the search index.
+    Called from Product.save so the index stays in sync.
+    """
+    index_products([product], using)
+
+
+def index_products(products, using='default'):
+    """
+    Add or refresh a batch of products in the search index, with one
+    delete and one insert for the whole batch
+    """
+    rows = [(product.pk, product.name,
+             strip_tags(product.description or '')) for product in products]
+    if not rows:
+        return
+    vendor = _vendor(using)
+    if vendor == 'postgresql':
+        from .models import ProductSearchIndex
+        with transaction.atomic(using=using):
+            ProductSearchIndex.objects.using(using).filter(
+                pk__in=[pk for pk, _, _ in rows]).delete()
+            ProductSearchIndex.objects.using(using).bulk_create([
+                ProductSearchIndex(
+                    product_id=pk,
+                    search_vector=_search_vector(name, description))
+                for pk, name, description in rows])
+    elif vendor == 'sqlite':
+        with connections[using].cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [[pk] for pk, _, _ in rows])
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description) '
+                'VALUES (%s, %s, %s)', rows)
+
+
+def unindex_product(product, using='default'):
+    """ Remove a deleted product from the SQLite search index """
+    if _vendor(using) == 'sqlite':
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+
+
+def _fts_match(query):
+    """
+    Turn free text into an FTS5 match expression, quoting every term
+    so user input cannot inject FTS5 query syntax.
+    """
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_products(queryset, query, order_by_rank=True):
+    """
+    Filter a product queryset down to the products matching ``query``.
+
+    Matches are annotated with ``search_rank`` (higher is better) and,
+    when ``order_by_rank`` is set, ordered by it with the id as a
+    tie-breaker.
+    """
+    vendor = _vendor(queryset.db)
+
+    if vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch')
+        queryset = queryset.filter(
+            search_index__search_vector=search_query).annotate(
+            # ts_rank returns a float4 (real): cast it to double precision
+            # so the rank stored in a page cursor, read back as a Python
+            # float, compares equal to the one of the row it came from
+            search_rank=Cast(SearchRank(
+                F('search_index__search_vector'), search_query),
+                FloatField()))
+
+    elif vendor == 'sqlite':
+        match = _fts_match(query)
+        if not match:
+            return queryset.none()
+        table = queryset.model._meta.db_table
+        # Every match is kept: the products are filtered with a subquery
+        # on the index and ranked by a correlated one, so the number of
+        # query parameters doesn't grow with the number of matches.
+        # bm25() returns lower scores for better matches.
+        queryset = queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [match])).annotate(search_rank=RawSQL(
+                f'SELECT -bm25({FTS_TABLE}, %s, %s) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+                [NAME_WEIGHT, DESCRIPTION_WEIGHT, match],
+                output_field=FloatField()))
+
+    else:
+        queryset = queryset.filter(
+            Q(name__icontains=query) | Q(description__icontains=query)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    if order_by_rank:
+        queryset = queryset.order_by('-search_rank', 'id')
+    return queryset
@@ -0,0 +1,73 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from hand_crafted.images import schedule_derivatives
+
+from .cache import bump_versions
+from .models import Category, Product, ProductReview
+from .search import unindex_product
+
+
+@receiver(post_save, sender=ProductReview)
+def update_rating_on_save(sender, instance, created, **kwargs):
+    """
+    Update product rating on review update/create
+    """
+    instance.product.update_rating()
+
+
+@receiver(post_delete, sender=ProductReview)
+def update_rating_on_delete(sender, instance, **kwargs):
+    """
+    Update product rating on review delete
+    """
+    instance.product.update_rating()
+
+
+@receiver(post_save, sender=Category)
+def update_closure_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Update the category tree on category create/move
+    """
+    if not raw:
+        instance.update_closure()
+
+
+@receiver(post_save, sender=Product)
+def generate_image_derivatives(sender, instance, raw=False, **kwargs):
+    """
+    Queue the resized copies of a new product image
+    """
+    if not raw:
+        schedule_derivatives(instance, 'image', 'image_derivatives',
+                             'image_derivatives_pending')
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, using, **kwargs):
+    """
+    Remove deleted products from the search index
+    """
+    unindex_product(instance, using=using)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def invalidate_product_pages(sender, instance, **kwargs):
+    """
+    Invalidate the cached product list and the product's detail page
+    """
+    product_id = (instance.pk if sender is Product
+                  else instance.product_id)
+    bump_versions('products', f'product:{product_id}')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_pages(sender, instance, **kwargs):
+    """
+    Invalidate every cached product page showing category names
+    """
+    bump_versions('categories')
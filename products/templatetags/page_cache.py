@@ -0,0 +1,27 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from products.cache import FRAGMENTS, fragment_placeholder
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def nocache(context, template_name):
+    """
+    Render a visitor dependent include. When the page is being stored in
+    the anonymous page cache the output is marked so it is stored as a
+    placeholder, filled in client-side for every visitor served from the
+    cache.
+    """
+    if template_name not in FRAGMENTS:
+        raise template.TemplateSyntaxError(
+            f'{template_name} is not a page fragment.')
+    content = fragment_placeholder(
+        template_name,
+        context.template.engine.get_template(template_name).render(context),
+        pending=False)
+    request = context.get('request')
+    if getattr(request, 'page_cache_holes', False):
+        content = f'<!--nocache:{template_name}-->{content}<!--/nocache-->'
+    return mark_safe(content)
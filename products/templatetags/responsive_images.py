@@ -0,0 +1,57 @@
+from django import template
+
+from hand_crafted.images import DERIVATIVE_FORMATS
+
+
+register = template.Library()
+
+# Layout widths of each derivative, used for the sizes attribute
+SIZES = {
+    'thumb': '160px',
+    'card': '(min-width: 1200px) 25vw, (min-width: 768px) 50vw, 100vw',
+    'detail': '(min-width: 992px) 50vw, 100vw',
+}
+
+
+def _srcset(storage, derivatives, extension):
+    """ Build a srcset from the derivatives, one candidate per width """
+    candidates = {}
+    for size in SIZES:
+        derivative = derivatives.get(size)
+        if derivative and extension in derivative:
+            candidates.setdefault(
+                derivative['width'], storage.url(derivative[extension]))
+    return ', '.join(f'{url} {width}w'
+                     for width, url in sorted(candidates.items()))
+
+
+@register.inclusion_tag('includes/responsive-image.html')
+def responsive_image(field_file, derivatives, size, alt='', css_class=''):
+    """
+    Render an image with WebP and JPEG srcsets of its derivatives,
+    falling back to the original file until they have been generated.
+
+    Usage:
+        {% responsive_image product.image product.image_derivatives 'card' alt=product.name css_class='img-fluid' %}
+    """
+    context = {
+        'src': field_file.url,
+        'alt': alt,
+        'css_class': css_class,
+        'lazy': size != 'detail',
+        'sources': [],
+    }
+    derivatives = derivatives or {}
+    if derivatives.get('source') != field_file.name or size not in derivatives:
+        return context
+
+    storage = field_file.storage
+    context['src'] = storage.url(derivatives[size]['jpg'])
+    context['sizes'] = SIZES[size]
+    context['srcset'] = _srcset(storage, derivatives, 'jpg')
+    context['sources'] = [
+        {'type': mime_type,
+         'srcset': _srcset(storage, derivatives, extension)}
+        for extension, _, mime_type in DERIVATIVE_FORMATS
+        if extension != 'jpg']
+    return context
@@ -0,0 +1,112 @@
+import re
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from .models import Category, Product, ProductReview
+
+
+class AnonymousPageCacheTest(TestCase):
+    """
+    Test the anonymous page cache of the product pages
+    """
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.category = Category.objects.create(
+            name='boxes', slug='boxes', friendly_name='Boxes')
+        self.product = Product.objects.create(
+            name='Shadow Box', price=Decimal('25.00'),
+            category=self.category, available=True)
+        self.list_url = reverse('products:product_list')
+        self.detail_url = self.product.get_absolute_url()
+
+    def test_product_list_is_cached_per_query(self):
+        response = self.client.get(self.list_url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        response = self.client.get(self.list_url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Shadow Box')
+        # Parameter order does not change the key
+        self.client.get(self.list_url, {'sort': 'price', 'direction': 'asc'})
+        response = self.client.get(
+            f'{self.list_url}?direction=asc&sort=price&utm_source=x')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+
+    def test_saves_invalidate_cached_pages(self):
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+
+        self.product.price = Decimal('30.00')
+        self.product.save()
+        response = self.client.get(self.list_url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, '€30.00')
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+
+        user = User.objects.create_user(username='reviewer', password='x')
+        ProductReview.objects.create(
+            product=self.product, user=user, stars=5)
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+
+        self.category.friendly_name = 'Frames'
+        self.category.save()
+        response = self.client.get(self.list_url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Frames')
+
+    def test_other_product_save_keeps_detail_page(self):
+        self.client.get(self.detail_url)
+        Product.objects.create(name='Cake Topper', price=Decimal('5.00'))
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+
+    def test_cached_pages_have_fragment_placeholders(self):
+        first = self.client.get(self.list_url)
+        self.assertContains(first, '€0.00')
+        self.assertNotContains(first, 'data-fragment-pending><')
+        visitor = Client()
+        session = visitor.session
+        session['cart'] = {str(self.product.id): 2}
+        session.save()
+        response = visitor.get(self.list_url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        # The badge and user menu are filled in client-side
+        for name in ('includes/cart-badge.html', 'includes/user-menu.html'):
+            self.assertContains(
+                response, f'<div class="page-fragment" data-fragment="{name}"'
+                          ' data-fragment-pending></div>', html=False)
+        self.assertNotContains(response, '€0.00')
+        self.assertNotContains(response, '€55.00')
+
+        fragments = visitor.get(reverse('home:page_fragments'), {
+            'name': ['includes/cart-badge.html', 'base.html'],
+        }).json()['fragments']
+        self.assertEqual(list(fragments), ['includes/cart-badge.html'])
+        self.assertIn('€55.00', fragments['includes/cart-badge.html'])
+
+    def test_csrf_token_is_not_shared(self):
+        first = self.client.get(self.detail_url)
+        self.assertRegex(first.content.decode(),
+                         r'name="csrfmiddlewaretoken" value="[^"]+"')
+        visitor = Client()
+        second = visitor.get(self.detail_url)
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertContains(
+            second, 'name="csrfmiddlewaretoken" value=""')
+
+        response = visitor.get(reverse('home:page_fragments'))
+        self.assertIn('csrftoken', response.cookies)
+        self.assertTrue(response.json()['csrf_token'])
+
+    def test_authenticated_users_are_not_cached(self):
+        User.objects.create_user(username='buyer', password='x')
+        self.client.login(username='buyer', password='x')
+        self.client.get(self.list_url)
+        response = self.client.get(self.list_url)
+        self.assertFalse(response.has_header('X-Page-Cache'))
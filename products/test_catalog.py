@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from .models import Category, Product
+from .search import search_products
+
+
+class CatalogCommandsTest(TestCase):
+    """
+    Test the import_products and export_products commands
+    """
+    def setUp(self):
+        self.boxes = Category.objects.create(name='boxes', slug='boxes')
+        self.toppers = Category.objects.create(
+            name='toppers', slug='toppers')
+        self.product = Product.objects.create(
+            sku='PB-1', name='Paper Box', price=Decimal('12.50'),
+            category=self.boxes)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def run_command(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command(*args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_jsonl_creates_and_updates_by_sku(self):
+        rows = [
+            {'sku': 'PB-1', 'name': 'Paper Box Deluxe', 'price': '15.00',
+             'category': 'toppers', 'available': True},
+            {'sku': 'CT-1', 'name': 'Cake Topper', 'price': '4.00',
+             'category': 'toppers', 'has_sizes': True},
+            {'sku': 'XX-1', 'name': 'Lost', 'price': '1.00',
+             'category': 'missing'},
+            {'sku': 'XX-2', 'name': 'Free', 'price': 'free'},
+            {'name': 'No Sku Frame', 'price': '30'},
+        ]
+        with open(self.path('catalog.jsonl'), 'w') as stream:
+            for row in rows:
+                stream.write(json.dumps(row) + '\n')
+
+        out, err = self.run_command(
+            'import_products', self.path('catalog.jsonl'),
+            '--batch-size', '2')
+        self.assertIn('Created 2, updated 1 and skipped 2 products', out)
+        self.assertIn("Row 3 skipped: unknown category 'missing'", err)
+        self.assertIn("Row 4 skipped: invalid price 'free'", err)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.name, 'Paper Box Deluxe')
+        self.assertEqual(self.product.slug, 'paper-box-deluxe')
+        self.assertEqual(self.product.price, Decimal('15.00'))
+        self.assertEqual(self.product.category, self.toppers)
+        topper = Product.objects.get(sku='CT-1')
+        self.assertTrue(topper.has_sizes)
+        self.assertEqual(topper.slug, 'cake-topper')
+        self.assertEqual(Product.objects.count(), 3)
+
+        # Imported products are searchable
+        found = search_products(Product.objects.all(), 'topper')
+        self.assertEqual(list(found), [topper])
+        found = search_products(Product.objects.all(), 'deluxe')
+        self.assertEqual(list(found), [self.product])
+
+    def test_import_reports_bad_prices_and_lines(self):
+        lines = [
+            json.dumps({'sku': 'A-1', 'name': 'NaN', 'price': 'NaN'}),
+            json.dumps({'sku': 'A-2', 'name': 'Inf', 'price': 'Infinity'}),
+            json.dumps({'sku': 'A-3', 'name': 'Refund', 'price': '-5.00'}),
+            json.dumps({'sku': 'A-4', 'name': 'Dear', 'price': '12345.00'}),
+            json.dumps({'sku': 'A-5', 'name': 'Cents', 'price': '1.005'}),
+            '{"sku": "A-6", "name": ',
+            json.dumps(['A-7', 'List', '1.00']),
+            json.dumps({'sku': 'A-8', 'name': 'Fine', 'price': '9.99'}),
+        ]
+        with open(self.path('catalog.jsonl'), 'w') as stream:
+            stream.write('\n'.join(lines) + '\n')
+
+        out, err = self.run_command(
+            'import_products', self.path('catalog.jsonl'))
+        self.assertIn('Created 1, updated 0 and skipped 7 products', out)
+        self.assertIn("Row 1 skipped: invalid price 'NaN'", err)
+        self.assertIn("Row 2 skipped: invalid price 'Infinity'", err)
+        self.assertIn("Row 3 skipped: invalid price '-5.00'", err)
+        self.assertIn("Row 4 skipped: invalid price '12345.00'", err)
+        self.assertIn("Row 5 skipped: invalid price '1.005'", err)
+        self.assertIn('Row 6 skipped: invalid JSON', err)
+        self.assertIn('Row 7 skipped: row is not a JSON object', err)
+        self.assertEqual(Product.objects.get(sku='A-8').price,
+                         Decimal('9.99'))
+
+    def test_export_and_import_round_trip(self):
+        Product.objects.create(
+            sku='CT-1', name='Cake Topper', description='Gold, glitter',
+            price=Decimal('4.00'), has_sizes=True, available=False)
+        for file_format in ('csv', 'jsonl'):
+            path = self.path(f'export.{file_format}')
+            out, _ = self.run_command('export_products', path)
+            self.assertIn('Exported 2 products', out)
+
+            out, _ = self.run_command('import_products', path)
+            self.assertIn('Created 0, updated 2 and skipped 0', out)
+            topper = Product.objects.get(sku='CT-1')
+            self.assertEqual(topper.description, 'Gold, glitter')
+            self.assertIsNone(topper.category)
+            self.assertTrue(topper.has_sizes)
+            self.assertFalse(topper.available)
+            self.assertEqual(Product.objects.get(sku='PB-1').category,
+                             self.boxes)
@@ -1,8 +1,11 @@
 from decimal import Decimal
+from io import StringIO
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.test import TestCase
 from django.contrib.auth.models import User
 from django.urls import reverse
-from .models import Category, Product, ProductReview
+from .models import Category, CategoryClosure, Product, ProductReview
 
 
 class CategoryModelTest(TestCase):
@@ -47,6 +50,37 @@ class CategoryModelTest(TestCase):
         category.save()
         self.assertEqual(category.get_friendly_name(), friendly_name)
 
+    def test_closure_follows_create_and_move(self):
+        root = Category.objects.get(id=1)
+        child = Category.objects.create(
+            name='Child', slug='child', parent=root)
+        grandchild = Category.objects.create(
+            name='Grandchild', slug='grandchild', parent=child)
+        self.assertEqual(
+            set(CategoryClosure.objects.filter(
+                ancestor=root).values_list('descendant__slug', 'depth')),
+            {('test-category', 0), ('child', 1), ('grandchild', 2)})
+
+        # Moving a subtree relinks all of its categories
+        other = Category.objects.create(name='Other', slug='other')
+        child.parent = other
+        child.save()
+        self.assertEqual(
+            list(CategoryClosure.objects.filter(
+                ancestor=root).values_list('descendant__slug', flat=True)),
+            ['test-category'])
+        self.assertEqual(
+            CategoryClosure.objects.get(
+                ancestor=other, descendant=grandchild).depth, 2)
+
+        # A category cannot be moved below its own descendant
+        child.parent = grandchild
+        with self.assertRaises(ValidationError) as context:
+            child.full_clean()
+        self.assertIn('parent', context.exception.message_dict)
+        with self.assertRaises(ValueError):
+            child.save()
+
 
 class ProductModelTest(TestCase):
     """
@@ -121,6 +155,53 @@ class ProductModelTest(TestCase):
         # assert that the actual average rating matches the expected value
         self.assertEqual(actual_avg_rating, expected_avg_rating)
 
+    def test_rating_aggregates_follow_review_edit_and_delete(self):
+        product = Product.objects.get(id=1)
+        user = User.objects.create_user(
+            'testuser1',
+            'testuser1@test.com',
+            'password')
+        review = ProductReview.objects.create(
+            product=product,
+            user=user,
+            content='Test Review',
+            stars=2)
+        review.stars = 4
+        review.save()
+        product.refresh_from_db()
+        self.assertEqual(product.review_count, 1)
+        self.assertEqual(product.rating_total, Decimal('4'))
+        self.assertEqual(product.avg_rating, Decimal('4'))
+
+        review.delete()
+        product.refresh_from_db()
+        self.assertEqual(product.review_count, 0)
+        self.assertEqual(product.rating_total, 0)
+        self.assertEqual(product.get_rating(), 0)
+
+    def test_get_rating_does_not_query_reviews(self):
+        product = Product.objects.get(id=1)
+        with self.assertNumQueries(0):
+            product.get_rating()
+
+    def test_rebuild_ratings_command(self):
+        product = Product.objects.get(id=1)
+        user = User.objects.create_user(
+            'testuser1',
+            'testuser1@test.com',
+            'password')
+        ProductReview.objects.create(
+            product=product, user=user, stars=3)
+        ProductReview.objects.create(
+            product=product, user=user, stars=4)
+        # Corrupt the stored aggregates, then rebuild them
+        Product.objects.update(review_count=0, rating_total=0, avg_rating=0)
+        call_command('rebuild_ratings', stdout=StringIO())
+        product.refresh_from_db()
+        self.assertEqual(product.review_count, 2)
+        self.assertEqual(product.rating_total, Decimal('7'))
+        self.assertEqual(product.avg_rating, Decimal('3.5'))
+
 
 class ProductReviewModelTest(TestCase):
     """
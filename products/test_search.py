@@ -0,0 +1,110 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from hand_crafted.pagination import KeysetPaginator
+
+from .models import Product
+from .search import index_products, search_products
+
+
+class ProductSearchTest(TestCase):
+    """
+    Test the full-text product search index
+    """
+    def setUp(self):
+        self.name_match = Product.objects.create(
+            name='Paper Flower Box',
+            description='<p class="lead">A handmade shadow box</p>',
+            price=Decimal('10.00'))
+        self.description_match = Product.objects.create(
+            name='Cake Topper',
+            description='<p>Decorated with tiny paper flowers</p>',
+            price=Decimal('10.00'))
+        Product.objects.create(
+            name='Wedding Frame',
+            description='<p>A wooden frame</p>',
+            price=Decimal('10.00'))
+
+    def test_name_matches_rank_above_description_matches(self):
+        results = list(search_products(Product.objects.all(), 'flower'))
+        self.assertEqual(results, [self.name_match, self.description_match])
+
+    def test_every_match_is_returned(self):
+        Product.objects.bulk_create(
+            Product(name=f'Flower {number}', price=Decimal('10.00'))
+            for number in range(600))
+        for product in Product.objects.filter(name__startswith='Flower '):
+            product.save()
+        results = search_products(Product.objects.all(), 'flower')
+        self.assertEqual(results.count(), 602)
+
+    def test_rank_cursor_round_trips(self):
+        # Ranks vary with the description length, so the cursors carry
+        # distinct floats that must compare equal when read back
+        for number in range(10):
+            Product.objects.create(
+                name=f'Flower {number}', description='tiny ' * number,
+                price=Decimal('10.00'))
+        queryset = search_products(Product.objects.all(), 'flower')
+        expected = list(queryset)
+        paginator = KeysetPaginator(queryset, 3)
+
+        seen = []
+        page = paginator.get_page()
+        while True:
+            seen.extend(page.object_list)
+            if not page.has_next():
+                break
+            page = paginator.get_page(page.next_cursor)
+        self.assertEqual(seen, expected)
+
+        previous = paginator.get_page(page.previous_cursor)
+        self.assertEqual(previous.object_list, expected[-6:-3])
+
+    def test_batch_is_indexed_in_two_queries(self):
+        Product.objects.bulk_create(
+            Product(name=f'Lantern {number}', price=Decimal('10.00'))
+            for number in range(20))
+        products = list(Product.objects.filter(name__startswith='Lantern'))
+        with self.assertNumQueries(2):
+            index_products(products)
+        results = search_products(Product.objects.all(), 'lantern')
+        self.assertEqual(results.count(), 20)
+
+    def test_search_is_stemmed(self):
+        results = search_products(Product.objects.all(), 'flowers')
+        self.assertIn(self.name_match, results)
+        self.assertIn(self.description_match, results)
+
+    def test_markup_is_not_indexed(self):
+        results = search_products(Product.objects.all(), 'lead')
+        self.assertFalse(results.exists())
+
+    def test_fts_syntax_in_query_is_escaped(self):
+        results = search_products(Product.objects.all(), 'flower" *(')
+        self.assertEqual(results.count(), 2)
+
+    def test_index_follows_product_save(self):
+        self.name_match.name = 'Birthday Banner'
+        self.name_match.save()
+        self.assertIn(
+            self.name_match,
+            search_products(Product.objects.all(), 'banner'))
+        self.assertNotIn(
+            self.name_match,
+            search_products(Product.objects.all(), 'flower'))
+
+    def test_deleted_products_are_removed_from_index(self):
+        self.name_match.delete()
+        results = search_products(Product.objects.all(), 'flower')
+        self.assertEqual(list(results), [self.description_match])
+
+    def test_rebuild_search_index_command(self):
+        Product.objects.filter(pk=self.name_match.pk).update(name='Lantern')
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertIn(
+            self.name_match,
+            search_products(Product.objects.all(), 'lantern'))
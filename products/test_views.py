@@ -1,7 +1,10 @@
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from decimal import Decimal
 from unittest import skip
 
+from django.core.cache import cache
+from django.db import connection
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from django.contrib.messages import get_messages
@@ -85,6 +88,147 @@ class ProductListViewTests(TestCase):
         self.assertContains(response, 'Product B')
         self.assertContains(response, 'Product C')
 
+    def test_product_list_sort_by_rating(self):
+        """
+        Test that the product list view sorts products by their
+        stored average rating in the database.
+        """
+        low = mixer.blend('products.Product', available=True,
+                          avg_rating=Decimal('2.00'))
+        high = mixer.blend('products.Product', available=True,
+                           avg_rating=Decimal('4.50'))
+        response = self.client.get(
+            self.url, {'sort': 'rating', 'direction': 'desc'})
+        self.assertEqual(response.status_code, 200)
+        products = list(response.context['products'])
+        self.assertEqual(products[:2], [high, low])
+        self.assertEqual(response.context['current_sorting'], 'rating_desc')
+
+        response = self.client.get(
+            self.url, {'sort': 'rating', 'direction': 'asc'})
+        products = list(response.context['products'])
+        self.assertEqual(products[-2:], [low, high])
+
+    def test_product_list_card_cache(self):
+        """
+        Test that product cards are served from the fragment cache and
+        that a review or an edit refreshes only the affected card.
+        """
+        cache.clear()
+        other = Product.objects.create(
+            name='other product', price=Decimal('5.00'), available=True)
+        self.client.get(self.url)
+        # Changes that bypass save() are not seen while the card is cached
+        Product.objects.filter(pk=other.pk).update(name='renamed product')
+        Product.objects.filter(pk=self.product.pk).update(
+            name='renamed test product')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'other product')
+        self.assertContains(response, 'test product')
+
+        # A review bumps the rating version of its product only
+        user = User.objects.create_user(username='reviewer', password='x')
+        ProductReview.objects.create(
+            product=self.product, user=user, stars=4)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'renamed test product')
+        self.assertContains(response, '4.00 / 5')
+        self.assertContains(response, 'other product')
+
+        # Saving a product refreshes its card
+        other.refresh_from_db()
+        other.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'renamed product')
+
+    def test_product_list_loads_only_cards_missing_from_cache(self):
+        """
+        Test that the listing fetches only the card cache key columns
+        and loads in full only the products whose card is not cached.
+        """
+        cache.clear()
+        for number in range(3):
+            Product.objects.create(name=f'product {number}',
+                                   price=Decimal('5.00'), available=True)
+        user = User.objects.create_user(username='shopper', password='x')
+        self.client.force_login(user)
+        self.client.get(self.url)
+        Product.objects.get(name='product 1').save()
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, {'sort': 'price'})
+        product_queries = [
+            query['sql'] for query in context.captured_queries
+            if 'FROM "products_product"' in query['sql']]
+        self.assertEqual(len(product_queries), 2)
+        self.assertNotIn('"description"', product_queries[0])
+        self.assertIn('"description"', product_queries[1])
+        self.assertContains(response, 'product 1')
+        self.assertContains(response, 'test product')
+
+    def test_product_list_sort_by_rating_with_category(self):
+        """
+        Test that rating sort stays a queryset so it can be combined
+        with the category filter.
+        """
+        category = mixer.blend('products.Category')
+        product = mixer.blend('products.Product', category=category,
+                              available=True)
+        response = self.client.get(
+            self.url, {'sort': 'rating', 'category': category.name})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['products']), [product])
+
+    def test_product_list_category_includes_descendants(self):
+        """
+        Test that a parent category, selected by slug or name, lists the
+        products of all its descendant categories.
+        """
+        parent = mixer.blend('products.Category', parent=None)
+        child = mixer.blend('products.Category', parent=parent)
+        grandchild = mixer.blend('products.Category', parent=child)
+        other = mixer.blend('products.Category', parent=None)
+        expected = [
+            mixer.blend('products.Product', category=category,
+                        available=True)
+            for category in (parent, child, grandchild)]
+        mixer.blend('products.Product', category=other, available=True)
+        for value in (parent.slug, parent.name):
+            response = self.client.get(self.url, {'category': value})
+            self.assertEqual(
+                sorted(p.pk for p in response.context['products']),
+                sorted(p.pk for p in expected))
+            self.assertEqual(list(response.context['current_categories']),
+                             [parent])
+        response = self.client.get(self.url, {'category': child.slug})
+        self.assertEqual(len(response.context['products']), 2)
+
+    def test_product_list_cursor_pagination_for_each_sort(self):
+        """
+        Test that following the next cursors visits every product once
+        for each sort order, including products without a category.
+        """
+        category = mixer.blend('products.Category')
+        for index in range(14):
+            mixer.blend('products.Product', available=True,
+                        category=category if index % 2 else None,
+                        price=Decimal('5.00'))
+        expected = Product.objects.filter(available=True).count()
+        for sort in ('name', 'price', 'category', 'rating', None):
+            for direction in (('asc', 'desc') if sort else (None,)):
+                params = {'sort': sort, 'direction': direction} \
+                    if sort else {}
+                response = self.client.get(self.url, params)
+                seen = list(response.context['products'])
+                page = response.context['products']
+                while page.has_next():
+                    response = self.client.get(
+                        f'{self.url}?{page.next_query}')
+                    page = response.context['products']
+                    seen.extend(page)
+                self.assertEqual(len(seen), expected)
+                self.assertEqual(len(set(seen)), expected)
+
     def test_product_list_search(self):
         prod1 = mixer.blend(
             Product, available=True, name='Test Product 1',
@@ -145,6 +289,29 @@ class ProductDetailViewTests(TestCase):
         self.assertTemplateUsed(response, 'products/detail.html')
         self.assertTemplateUsed(response, 'includes/footer.html')
 
+    def test_product_detail_query_count_is_fixed(self):
+        """
+        Test that the number of queries does not grow with the number
+        of reviews on the product.
+        """
+        url = reverse('products:product_detail',
+                      args=[self.product.id, self.product.slug])
+        self.client.login(username='testuser', password='password')
+        ProductReview.objects.create(
+            product=self.product, user=self.user, stars=4)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as one_review:
+            self.client.get(url)
+        for index in range(5):
+            reviewer = User.objects.create_user(
+                username=f'reviewer{index}', password='password')
+            ProductReview.objects.create(
+                product=self.product, user=reviewer, stars=2)
+        with self.assertNumQueries(len(one_review)):
+            response = self.client.get(url)
+        self.assertContains(response, 'reviewer4')
+        self.assertContains(response, '2.33 / 5')
+
     def test_product_detail_template_content(self):
         url = reverse('products:product_detail',
                       args=[self.product.id, self.product.slug])
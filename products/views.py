@@ -1,14 +1,20 @@
 from django.shortcuts import render, redirect, reverse, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator, PageNotAnInteger
-from django.db.models import Q
-from django.db.models.functions import Lower
+from django.db.models import Prefetch, Q, Value
+from django.db.models.functions import Coalesce, Lower
 
-from .models import Category, Product, ProductReview
+from hand_crafted.pagination import KeysetPaginator
+
+from .cache import (
+    CARD_KEY_FIELDS, anonymous_page_cache, load_product_cards,
+    product_detail_key, product_list_key)
+from .models import Category, CategoryClosure, Product, ProductReview
 from .forms import ProductForm, ProductReviewForm
+from .search import search_products
 
 
+@anonymous_page_cache(product_list_key)
 def product_list(request):
     """
     Display a list of all products, including sorting and search queries,
@@ -20,8 +26,10 @@ def product_list(request):
     Returns:
         HttpResponse: the HTTP response object with the rendered template
     """
-    # Get all available products
-    products = Product.objects.filter(available=True)
+    # Get all available products with their category, which is needed
+    # to build the cache key of each product card
+    products = Product.objects.filter(
+        available=True).select_related('category')
     # Initialize query, categories, sort, and direction to None
     query = None
     categories = None
@@ -38,21 +46,16 @@ def product_list(request):
             sort = sortkey
 
             # If the 'sortkey' parameter is 'rating', sort the products
-            # based on their rating
+            # on their stored average rating, using the id as a tie-breaker
+            # so the ordering matches the (avg_rating, id) index
             if sortkey == 'rating':
                 # Get the 'direction' parameter from the GET request,
                 # or use 'desc' as the default value
                 direction = request.GET.get('direction', 'desc').lower()
-                # Sort the products based on their rating, in either ascending
-                # or descending order depending on the value of 'direction'
-                products = sorted(
-                    products,
-                    # Use a lambda function as the sorting key to access the
-                    # rating of each product
-                    key=lambda p: p.get_rating(),
-                    # Set the 'reverse' argument to True if 'direction' is not
-                    # 'asc', which means sorting in descending order
-                    reverse=direction != 'asc')
+                if direction == 'asc':
+                    products = products.order_by('avg_rating', 'id')
+                else:
+                    products = products.order_by('-avg_rating', '-id')
 
             # If the sorting method is anything else (e.g., 'name', 'price'),
             # sort the products using the Django ORM's order_by method
@@ -61,7 +64,11 @@ def product_list(request):
                     sortkey = 'lower_name'
                     products = products.annotate(lower_name=Lower('name'))
                 if sortkey == 'category':
-                    sortkey = 'category__name'
+                    # Products without a category sort as an empty name
+                    # so the cursor paginator never compares NULLs
+                    sortkey = 'category_name'
+                    products = products.annotate(category_name=Coalesce(
+                        'category__name', Value('')))
                 if 'direction' in request.GET:
                     direction = request.GET['direction']
                     if direction == 'desc':
@@ -69,15 +76,21 @@ def product_list(request):
                 products = products.order_by(sortkey)
 
         # If the 'category' parameter is present, extract the
-        # selected categories and filter the products based on them
+        # selected categories (by name or slug) and filter the products
+        # on them and all of their descendants through the closure table
         if 'category' in request.GET:
             categories = request.GET['category'].split(',')
-            products = products.filter(category__name__in=categories)
-            categories = Category.objects.filter(name__in=categories)
+            selected = Q(name__in=categories) | Q(slug__in=categories)
+            descendants = CategoryClosure.objects.filter(
+                Q(ancestor__name__in=categories) |
+                Q(ancestor__slug__in=categories)).values('descendant_id')
+            products = products.filter(category_id__in=descendants)
+            categories = Category.objects.filter(selected)
 
         # If the 'q' parameter is present, extract the search term and
-        # filter the products using the Django ORM's Q objects to perform
-        # a case-insensitive search on the name and description fields
+        # filter the products through the full-text search index, ranking
+        # name matches above description matches unless another sort
+        # order was requested
         if 'q' in request.GET:
             query = request.GET['q']
             if not query:
@@ -85,24 +98,28 @@ def product_list(request):
                                "You didn't enter any search criteria!")
                 return redirect(reverse('products:product_list'))
 
-            queries = Q(name__icontains=query) | \
-                Q(description__icontains=query)
-
-            products = products.filter(queries)
+            products = search_products(products, query,
+                                       order_by_rank=sort is None)
 
     # Set the current sorting direction as a string of the form
     # 'sort_direction'
     current_sorting = f'{sort}_{direction}'
 
-    # Create a Paginator object with 12 products per page and set the
-    # current page based on the 'page' GET parameter
-    paginator = Paginator(products, 12)
-    page = request.GET.get("page")
-    try:
-        products = paginator.page(page)
-    except PageNotAnInteger:
-        # If 'page' is not an integer, default to the first page
-        products = paginator.page(1)
+    # Only fetch the columns the product card cache keys and the cursor
+    # are built from; cards missing from the cache are loaded in full
+    ordering = products.query.order_by or Product._meta.ordering
+    sort_fields = [field.lstrip('-') for field in ordering
+                   if isinstance(field, str)]
+    products = products.only(*CARD_KEY_FIELDS, *[
+        field for field in sort_fields
+        if field != 'pk' and field not in products.query.annotations])
+
+    # Create a cursor paginator with 12 products per page and fetch the
+    # page pointed at by the opaque 'cursor' GET parameter
+    paginator = KeysetPaginator(products, 12)
+    cursor = request.GET.get("cursor")
+    products = load_product_cards(
+        paginator.get_page(cursor, request.GET), request.user)
 
     # Render a template with the list of products, search term,
     # selected categories, current sorting method, and current page
@@ -113,13 +130,14 @@ def product_list(request):
         'search_term': query,
         'current_categories': categories,
         'current_sorting': current_sorting,
-        "page": page,
+        "cursor": cursor,
 
     }
 
     return render(request, template, context)
 
 
+@anonymous_page_cache(product_detail_key)
 def product_detail(request, product_id, slug):
     """
     Display an individual product details
@@ -132,16 +150,24 @@ def product_detail(request, product_id, slug):
     Returns:
         HttpResponse: The rendered HTML template for the product detail page.
     """
-    # Retrieve the product object from the database or return 404
-    # error if not found
-    product = get_object_or_404(Product,
-                                pk=product_id,
-                                slug=slug,
-                                available=True)
-
-    # Check if the current user has the product in their wishlist
+    # Retrieve the product object and its category from the database
+    # or return 404 error if not found. The reviews and their users are
+    # fetched in one extra query, and the review count and average rating
+    # come from the stored aggregates, so the page costs the same number
+    # of queries however many reviews the product has
+    product = get_object_or_404(
+        Product.objects.select_related('category').prefetch_related(
+            Prefetch('reviews',
+                     queryset=ProductReview.objects.select_related('user'))),
+        pk=product_id,
+        slug=slug,
+        available=True)
+
+    # Check if the current user has the product in their wishlist,
+    # skipping the query for anonymous users
     wished = False
-    if product.wishlist.filter(id=request.user.id).exists():
+    if (request.user.is_authenticated and
+            product.wishlist.filter(id=request.user.id).exists()):
         wished = True
 
     # Handle submission of product review form
@@ -3,7 +3,8 @@ from django.shortcuts import (
     reverse, get_object_or_404)
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator, PageNotAnInteger
+
+from hand_crafted.pagination import KeysetPaginator
 
 from .models import UserProfile
 from .forms import UserProfileForm
@@ -16,8 +17,8 @@ from products.models import Product
 def wish_list(request):
     """
     This view function displays the user's wish list of products.
-    It uses Django's built-in Paginator class to display the products
-    in sets of 12 per page.
+    It uses a cursor paginator to display the products in sets of 12
+    per page.
 
     Parameters:
     request (HttpRequest): The HTTP request sent by the user.
@@ -31,19 +32,16 @@ def wish_list(request):
     new_wish = Product.objects.filter(wishlist=request.user)
 
     # Paginate the results to display 12 products per page
-    paginator = Paginator(new_wish, 12)
-    page = request.GET.get("page")
-    try:
-        new_wish = paginator.page(page)
-    except PageNotAnInteger:
-        # If the page parameter is not an integer, default to the first page
-        new_wish = paginator.page(1)
+    paginator = KeysetPaginator(new_wish, 12)
+    cursor = request.GET.get("cursor")
+    # An invalid cursor falls back to the first page
+    new_wish = paginator.get_page(cursor, request.GET)
 
     # Set up the dictionary of variables to pass to the template
     template = 'profiles/wishlist.html'
     context = {
         'new_wish': new_wish,
-        'page': page,
+        'cursor': cursor,
     }
 
     # Render the template with the variables